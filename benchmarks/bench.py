@@ -0,0 +1,269 @@
+"""Benchmarks for the ingestion and query hot paths.
+
+Runs against synthetic legal PDFs (see synthetic_pdf.py) and writes JSON
+that can be compared between commits:
+
+    python benchmarks/bench.py --pages 10 50 --output before.json
+    # ...change something...
+    python benchmarks/bench.py --pages 10 50 --compare before.json --output after.json
+
+Stages are timed with the app's own functions: get_pdf_pages,
+extract_metadata, strip_boilerplate, chunk_document, embedding,
+FAISS.from_embeddings/save_local/load_local, search_batch, plus the full
+upload-to-ready and /ask-question/ paths through the ASGI app with the
+fake LLM provider at zero latency. `--embeddings fake` swaps in a
+deterministic embedding model so the rest of the pipeline can be
+measured without downloading one.
+
+The app's relative storage paths are created in a temporary working
+directory, so running this leaves the checkout untouched.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from synthetic_pdf import make_legal_pdf  # noqa: E402
+
+QUESTIONS = [
+    "What is the notice period for termination?",
+    "Who must maintain insurance and for how long?",
+    "What is the limitation of liability?",
+    "Which law governs this agreement?",
+    "What losses are excluded from coverage?",
+    "How are disputes resolved?",
+    "When are payments due?",
+    "What are the confidentiality obligations?"
+]
+
+
+def git_revision() -> Dict[str, Optional[str]]:
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def timed(fn: Callable, repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples: List[float], **extra) -> Dict:
+    result = {
+        "runs": len(samples),
+        "mean_s": statistics.fmean(samples),
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "p95_s": percentile(samples, 95),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0
+    }
+    result.update(extra)
+    return result
+
+
+def load_app(embeddings_kind: str):
+    """Import main in the current (temporary) directory with the offline LLM provider"""
+    # Read at import by this process and by the spawned ingestion workers
+    os.environ["EMBEDDINGS_PROVIDER"] = embeddings_kind
+    import main
+
+    main.app_state.set_llm_provider(main.FakeLLMProvider(latency_distribution="fixed", latency_seconds=0.0))
+    main.Config.ENABLE_RESPONSE_CACHE = False
+    main.Config.COOLDOWN_PERIOD = 0
+    main.Config.MAX_DAILY_TOKENS = main.Config.TENANT_DAILY_TOKENS = 10 ** 12
+    main.app_state.rate_limiter.max_requests = 10 ** 9
+
+    embeddings = main.load_embeddings_model()
+    main.app_state.embeddings_model = embeddings
+    return main, embeddings
+
+
+def bench_stages(main, embeddings, pages: int, args) -> Dict[str, Dict]:
+    """Per-stage timings for one synthetic document"""
+    results = {}
+    pdf = make_legal_pdf(pages, args.seed)
+    pdf_path = f"bench_{pages}.pdf"
+    with open(pdf_path, "wb") as f:
+        f.write(pdf)
+
+    samples = timed(lambda: main.get_pdf_pages(io.BytesIO(pdf)), args.repeat)
+    results[f"get_pdf_pages[{pages}]"] = summarize(samples, pages_per_s=pages / statistics.median(samples))
+    page_list = main.get_pdf_pages(pdf_path)
+
+    results[f"extract_metadata[{pages}]"] = summarize(timed(lambda: main.extract_metadata(pdf_path, page_list), args.repeat))
+    results[f"strip_boilerplate[{pages}]"] = summarize(timed(lambda: main.strip_boilerplate(page_list), args.repeat))
+    stripped = main.strip_boilerplate(page_list)
+
+    samples = timed(lambda: main.chunk_document(main.DocumentBuffer(stripped)), args.repeat)
+    buffer = main.DocumentBuffer(stripped)
+    metadatas = main.chunk_document(buffer)
+    chunks = [buffer.text[metadata["start"]:metadata["end"]] for metadata in metadatas]
+    results[f"chunk_document[{pages}]"] = summarize(samples, chunks=len(chunks))
+
+    samples = timed(lambda: embeddings.embed_documents(chunks), args.repeat)
+    results[f"embed_documents[{pages}]"] = summarize(samples, chunks_per_s=len(chunks) / statistics.median(samples))
+    vectors = embeddings.embed_documents(chunks)
+
+    build = lambda: main.FAISS.from_embeddings(list(zip(chunks, vectors)), embedding=embeddings, metadatas=metadatas)  # noqa: E731
+    results[f"faiss_from_embeddings[{pages}]"] = summarize(timed(build, args.repeat))
+    vector_store = build()
+
+    index_dir = f"bench_index_{pages}"
+    results[f"faiss_save_local[{pages}]"] = summarize(timed(lambda: vector_store.save_local(index_dir), args.repeat))
+    load = lambda: main.FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)  # noqa: E731
+    results[f"faiss_load_local[{pages}]"] = summarize(timed(load, args.repeat))
+    shutil.rmtree(index_dir, ignore_errors=True)
+
+    questions = (QUESTIONS * (args.questions // len(QUESTIONS) + 1))[:args.questions]
+    samples = timed(lambda: main.search_batch(vector_store, questions, main.Config.SIMILARITY_SEARCH_K), args.repeat)
+    results[f"search_batch[{pages}]"] = summarize(samples, questions=len(questions))
+    return results
+
+
+def bench_end_to_end(main, args) -> Dict[str, Dict]:
+    """Upload-to-ready and /ask-question/ latency through the ASGI app"""
+    from fastapi.testclient import TestClient
+
+    results = {}
+    with TestClient(main.app) as client:
+        for pages in args.pages:
+            pdf = make_legal_pdf(pages, args.seed)
+            ingest = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.post("/upload-pdf/", files={"pdf": (f"bench_{pages}.pdf", pdf, "application/pdf")})
+                response.raise_for_status()
+                task_id = response.json()["task_id"]
+                while True:
+                    progress = client.get("/progress/", params={"task_id": task_id}).json()
+                    if progress["status"] in ("done", "error"):
+                        break
+                    time.sleep(0.005)
+                if progress["status"] != "done":
+                    raise RuntimeError(f"Ingestion failed: {progress['message']}")
+                ingest.append(time.perf_counter() - start)
+            results[f"ingest_e2e[{pages}]"] = summarize(ingest)
+
+            latencies = []
+            for index in range(args.questions):
+                start = time.perf_counter()
+                response = client.post("/ask-question/", data={"question": QUESTIONS[index % len(QUESTIONS)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            results[f"ask_question_e2e[{pages}]"] = summarize(
+                latencies,
+                p50_s=percentile(latencies, 50),
+                p99_s=percentile(latencies, 99),
+                requests_per_s=len(latencies) / sum(latencies)
+            )
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline_path: str, threshold: float) -> int:
+    """Print median changes against a baseline run; return how many regressed past threshold"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = 0
+    print(f"{'benchmark':<32} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["median_s"], result["median_s"]
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  regression"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  improvement"
+        print(f"{name:<32} {old * 1000:>10.2f}ms {new * 1000:>10.2f}ms {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion and query hot paths")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50], help="Synthetic document sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--questions", type=int, default=20, help="Questions per search/ask benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embeddings", choices=["huggingface", "fake"], default="huggingface")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only run the stage benchmarks")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON to compare medians against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change reported as a regression")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix="lawgic-bench-")
+    os.chdir(workdir)
+    logging.disable(logging.INFO)
+    try:
+        main, embeddings = load_app(args.embeddings)
+        results = {}
+        for pages in args.pages:
+            results.update(bench_stages(main, embeddings, pages, args))
+        if not args.skip_e2e:
+            results.update(bench_end_to_end(main, args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        },
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,267 @@
+"""Load generator for mixed upload / question / progress-poll traffic.
+
+Requests arrive open-loop (Poisson) at a rate per endpoint, and at most
+--concurrency are in flight at once. The report gives throughput, status
+counts and p50/p95/p99 latency for each endpoint. Latency is measured
+from when a request was sent; time spent waiting for a concurrency slot
+is reported separately as queue_wait.
+
+In-process, the app runs in this process on the fake LLM provider and
+gets its own temporary working directory:
+
+    python benchmarks/loadtest.py --duration 60 --ask-rate 5 --upload-rate 0.2 --progress-rate 2 \\
+        --concurrency 16 --embeddings fake --llm-latency 0.8
+
+Over localhost, start the server offline first:
+
+    LLM_PROVIDER=fake EMBEDDINGS_PROVIDER=fake FAKE_LLM_LATENCY_SECONDS=0.8 uvicorn main:app --port 8000
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --ask-rate 5
+
+The app's rate limiter, cooldown and response cache stay on by default,
+so the run shows where they start to dominate. --disable-rate-limits and
+--no-response-cache turn them off in-process. Against a remote server,
+--unique-questions defeats the cache instead.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from bench import QUESTIONS, git_revision, percentile  # noqa: E402
+from synthetic_pdf import make_legal_pdf  # noqa: E402
+
+ENDPOINTS = ("upload", "ask", "progress")
+
+
+class LoadRecorder:
+    """Latencies, queue waits and status codes per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.waits: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, endpoint: str, status, wait: float, latency: float):
+        self.statuses[endpoint][str(status)] += 1
+        self.waits[endpoint].append(wait)
+        self.latencies[endpoint].append(latency)
+
+    def report(self, elapsed: float) -> Dict[str, Dict]:
+        report = {}
+        for endpoint, latencies in self.latencies.items():
+            ok = self.statuses[endpoint].get("200", 0)
+            report[endpoint] = {
+                "requests": len(latencies),
+                "ok": ok,
+                "statuses": dict(self.statuses[endpoint]),
+                "throughput_rps": len(latencies) / elapsed,
+                "ok_rps": ok / elapsed,
+                "mean_s": statistics.fmean(latencies),
+                "p50_s": percentile(latencies, 50),
+                "p95_s": percentile(latencies, 95),
+                "p99_s": percentile(latencies, 99),
+                "max_s": max(latencies),
+                "queue_wait_mean_s": statistics.fmean(self.waits[endpoint]),
+                "queue_wait_p95_s": percentile(self.waits[endpoint], 95)
+            }
+        return report
+
+
+async def wait_until_ready(client: httpx.AsyncClient, task_id: str, timeout: float = 300):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        progress = (await client.get("/progress/", params={"task_id": task_id})).json()
+        if progress["status"] == "done":
+            return
+        if progress["status"] == "error":
+            raise RuntimeError(f"Seed document failed: {progress['message']}")
+        await asyncio.sleep(0.05)
+    raise RuntimeError("Seed document was not indexed in time")
+
+
+async def seed_document(client: httpx.AsyncClient, pdf: bytes) -> str:
+    """Upload one document and wait for it so questions have an index to hit"""
+    for _ in range(30):
+        response = await client.post("/upload-pdf/", files={"pdf": ("seed.pdf", pdf, "application/pdf")})
+        if response.status_code == 200:
+            task_id = response.json()["task_id"]
+            await wait_until_ready(client, task_id)
+            return task_id
+        if response.status_code not in (429, 503):
+            response.raise_for_status()
+        await asyncio.sleep(2)
+    raise RuntimeError("Could not upload the seed document")
+
+
+async def run_load(client: httpx.AsyncClient, args) -> Dict:
+    pdf = make_legal_pdf(args.pages, args.seed)
+    task_ids = [] if args.no_seed else [await seed_document(client, pdf)]
+    recorder = LoadRecorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rng = random.Random(args.seed)
+    counter = 0
+
+    def send(endpoint: str):
+        nonlocal counter
+        if endpoint == "upload":
+            return client.post("/upload-pdf/", files={"pdf": ("load.pdf", pdf, "application/pdf")})
+        if endpoint == "ask":
+            counter += 1
+            question = rng.choice(QUESTIONS)
+            if args.unique_questions:
+                question = f"{question} (#{counter})"
+            return client.post("/ask-question/", data={"question": question})
+        return client.get("/progress/", params={"task_id": rng.choice(task_ids) if task_ids else "unknown"})
+
+    async def request(endpoint: str):
+        arrived = time.perf_counter()
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await send(endpoint)
+                status = response.status_code
+                if endpoint == "upload" and status == 200:
+                    task_ids.append(response.json()["task_id"])
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            recorder.record(endpoint, status, started - arrived, time.perf_counter() - started)
+
+    async def arrivals(endpoint: str, rate: float, deadline: float):
+        arrival_rng = random.Random(f"{args.seed}-{endpoint}")
+        pending = []
+        while True:
+            await asyncio.sleep(arrival_rng.expovariate(rate))
+            if time.perf_counter() >= deadline:
+                break
+            pending.append(asyncio.create_task(request(endpoint)))
+        await asyncio.gather(*pending)
+
+    rates = {"upload": args.upload_rate, "ask": args.ask_rate, "progress": args.progress_rate}
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        arrivals(endpoint, rate, deadline) for endpoint, rate in rates.items() if rate > 0
+    ))
+    elapsed = time.perf_counter() - start
+    return {"elapsed_s": elapsed, "endpoints": recorder.report(elapsed)}
+
+
+def configure_app(main, args):
+    """Offline LLM and optional limiter/cache overrides for in-process runs"""
+    main.app_state.set_llm_provider(main.FakeLLMProvider(
+        latency_distribution=args.llm_latency_distribution,
+        latency_seconds=args.llm_latency,
+        latency_jitter=args.llm_jitter,
+        output_tokens=args.llm_output_tokens
+    ))
+    main.Config.ENABLE_INGESTION_SUMMARY = args.summaries
+    if args.no_response_cache:
+        main.Config.ENABLE_RESPONSE_CACHE = False
+    if args.disable_rate_limits:
+        main.Config.COOLDOWN_PERIOD = 0
+        main.Config.MAX_DAILY_TOKENS = main.Config.TENANT_DAILY_TOKENS = 10 ** 12
+        main.app_state.rate_limiter.max_requests = 10 ** 9
+
+
+async def run_in_process(args) -> Dict:
+    # Read at import by this process and by the spawned ingestion workers
+    os.environ["EMBEDDINGS_PROVIDER"] = args.embeddings
+    import main
+
+    configure_app(main, args)
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            return await run_load(client, args)
+
+
+async def run_remote(args) -> Dict:
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        return await run_load(client, args)
+
+
+def print_report(result: Dict):
+    print(f"{'endpoint':<10} {'requests':>8} {'ok/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'wait p95':>9}  statuses")
+    for endpoint in ENDPOINTS:
+        stats = result["endpoints"].get(endpoint)
+        if not stats:
+            continue
+        print(
+            f"{endpoint:<10} {stats['requests']:>8} {stats['ok_rps']:>8.2f} "
+            f"{stats['p50_s'] * 1000:>7.1f}ms {stats['p95_s'] * 1000:>7.1f}ms {stats['p99_s'] * 1000:>7.1f}ms "
+            f"{stats['queue_wait_p95_s'] * 1000:>7.1f}ms  {stats['statuses']}"
+        )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Drive the app with concurrent mixed traffic")
+    parser.add_argument("--url", help="Target a running server instead of an in-process app")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum requests in flight")
+    parser.add_argument("--ask-rate", type=float, default=2.0, help="/ask-question/ arrivals per second")
+    parser.add_argument("--upload-rate", type=float, default=0.1, help="/upload-pdf/ arrivals per second")
+    parser.add_argument("--progress-rate", type=float, default=1.0, help="/progress/ arrivals per second")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic upload")
+    parser.add_argument("--unique-questions", action="store_true", help="Make every question unique to miss the response cache")
+    parser.add_argument("--no-seed", action="store_true", help="Skip uploading a document before the run")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here")
+    in_process = parser.add_argument_group("in-process options")
+    in_process.add_argument("--embeddings", choices=["huggingface", "fake"], default="huggingface")
+    in_process.add_argument("--llm-latency", type=float, default=0.8, help="Median fake LLM latency in seconds")
+    in_process.add_argument("--llm-jitter", type=float, default=0.5)
+    in_process.add_argument("--llm-latency-distribution", choices=["fixed", "uniform", "lognormal", "exponential"], default="lognormal")
+    in_process.add_argument("--llm-output-tokens", type=int, default=120)
+    in_process.add_argument("--disable-rate-limits", action="store_true", help="Turn off the request limiter, cooldown and token caps")
+    in_process.add_argument("--no-response-cache", action="store_true")
+    in_process.add_argument("--summaries", action="store_true", help="Turn ingestion summaries on (extra LLM calls per upload)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    logging.disable(logging.INFO)
+    if args.url:
+        result = asyncio.run(run_remote(args))
+    else:
+        workdir = tempfile.mkdtemp(prefix="lawgic-load-")
+        os.chdir(workdir)
+        try:
+            result = asyncio.run(run_in_process(args))
+        finally:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(result)
+    if output:
+        report = {
+            "meta": {
+                **git_revision(),
+                "timestamp": datetime.now().isoformat(),
+                "target": args.url or "in-process",
+                "args": {key: value for key, value in vars(args).items() if key != "output"}
+            },
+            **result
+        }
+        with open(output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,134 @@
+"""Synthetic legal PDFs for benchmarks.
+
+Pages carry a running header, a page-number footer and numbered clauses
+drawn from contract templates, so extraction, boilerplate stripping,
+chunking and near-duplicate collapse all see realistic input. Output is
+deterministic for a given seed and needs nothing beyond the standard
+library.
+"""
+import random
+from typing import List
+
+CLAUSE_TITLES = [
+    "Definitions", "Term and Termination", "Payment Terms", "Indemnification",
+    "Limitation of Liability", "Confidentiality", "Governing Law", "Dispute Resolution",
+    "Insurance", "Force Majeure", "Assignment", "Notices", "Warranties", "Data Protection",
+    "Exclusions", "Claims Procedure", "Renewal", "Severability"
+]
+
+CLAUSE_SENTENCES = [
+    "The {party} shall {verb} the {object} within {days} days of written notice.",
+    "Notwithstanding the foregoing, the {party} shall not be liable for any {object} arising from {cause}.",
+    "All amounts payable under this Agreement are exclusive of applicable taxes and shall be paid within {days} days.",
+    "Either party may terminate this Agreement upon {days} days prior written notice if the other party commits a material breach.",
+    "The {party} agrees to maintain {object} in full force and effect for the duration of the Term.",
+    "Any dispute arising out of or in connection with this Agreement shall be referred to arbitration in {place}.",
+    "This Agreement shall be governed by and construed in accordance with the laws of {place}.",
+    "The {party} shall keep confidential all {object} disclosed by the other party and use it solely for the Purpose.",
+    "Coverage under this Policy excludes any {object} caused directly or indirectly by {cause}.",
+    "The aggregate liability of the {party} shall not exceed {amount} in any twelve month period."
+]
+
+FILLERS = {
+    "party": ["Tenant", "Landlord", "Insurer", "Insured", "Supplier", "Customer", "Licensee", "Contractor"],
+    "verb": ["indemnify", "reimburse", "notify", "deliver", "repair", "insure", "remedy"],
+    "object": ["losses", "premises", "Confidential Information", "insurance policies", "deliverables", "claims", "records"],
+    "cause": ["wilful misconduct", "war or terrorism", "gross negligence", "nuclear contamination", "pre-existing conditions"],
+    "place": ["England and Wales", "the State of New York", "Singapore", "New Delhi", "Ontario"],
+    "days": ["7", "14", "30", "60", "90"],
+    "amount": ["USD 1,000,000", "the fees paid in the preceding year", "INR 50,00,000", "EUR 250,000"]
+}
+
+LINES_PER_PAGE = 48
+LINE_WIDTH = 95
+
+
+def _wrap(text: str, width: int = LINE_WIDTH) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _clause_lines(rng: random.Random, number: int) -> List[str]:
+    title = rng.choice(CLAUSE_TITLES)
+    sentences = [
+        rng.choice(CLAUSE_SENTENCES).format(**{key: rng.choice(values) for key, values in FILLERS.items()})
+        for _ in range(rng.randint(3, 7))
+    ]
+    return _wrap(f"{number}. {title}. " + " ".join(sentences)) + [""]
+
+
+def page_lines(pages: int, seed: int = 0) -> List[List[str]]:
+    """Text lines for each page, headers and footers included"""
+    rng = random.Random(seed)
+    body: List[str] = []
+    clause = 1
+    while len(body) < pages * (LINES_PER_PAGE - 4):
+        body.extend(_clause_lines(rng, clause))
+        clause += 1
+
+    per_page = LINES_PER_PAGE - 4
+    return [
+        ["MASTER SERVICES AGREEMENT - CONFIDENTIAL", ""]
+        + body[index * per_page:(index + 1) * per_page]
+        + ["", f"Page {index + 1} of {pages}"]
+        for index in range(pages)
+    ]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_legal_pdf(pages: int = 10, seed: int = 0, title: str = "Master Services Agreement") -> bytes:
+    """Build a PDF of synthetic contract text with the given page count"""
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # Pages, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        f"<< /Title ({_escape(title)}) /Author (Benchmark Generator) >>".encode("latin-1")
+    ]
+    page_ids = []
+    for lines in page_lines(pages, seed):
+        stream = "BT /F1 9 Tf 12 TL 56 800 Td\n" + "\n".join(f"({_escape(line)}) Tj T*" for line in lines) + "\nET"
+        data = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Info 4 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a synthetic legal PDF")
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.output, "wb") as f:
+        f.write(make_legal_pdf(args.pages, args.seed))
@@ -1,26 +1,61 @@
 import os
+import re
+import json
+import io
+import math
 import uuid
+import random
+import bisect
+import hashlib
+import hmac
 import shutil
+import pickle
+import sqlite3
+import zipfile
 import logging
 import time
 import asyncio
-from typing import List, Dict, Optional, Tuple
+import threading
+import cProfile
+import pstats
+import marshal
+import sys
+import tracemalloc
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Iterator, List, Dict, Literal, Optional, Set, Tuple
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
-from collections import defaultdict, deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cached_property
 
-from fastapi import FastAPI, UploadFile, Form, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Request, Form, Header, Body, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+import numpy as np
+import zstandard
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, ProcessCollector, generate_latest
+from prometheus_client import Counter as MetricCounter
+from pydantic import BaseModel, Field, ValidationError
 from PyPDF2 import PdfReader
 from PyPDF2.errors import PdfReadError
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult, LLMResult
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 import uvicorn
@@ -36,9 +71,7 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("❌ GOOGLE_API_KEY not found in environment variables")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # Only required by the "google" LLM provider
 
 
 
@@ -80,114 +113,2511 @@ class RateLimiter:
         return max(0, int(reset_time - time.time()))
 
 class APIUsageTracker:
-    """Track API usage and costs"""
+    """Track API usage and costs per tenant, endpoint and model"""
     
     def __init__(self):
         self.daily_usage = defaultdict(int)
         self.monthly_usage = defaultdict(int)
+        self.tenant_daily_usage = defaultdict(int)
+        self.breakdown = defaultdict(lambda: {
+            "requests": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "estimated_requests": 0
+        })
         self.total_tokens = 0
         self.last_reset = datetime.now()
     
-    def track_usage(self, tokens_used: int):
+    def track_usage(
+        self,
+        tokens_used: int,
+        tenant: Optional[str] = None,
+        endpoint: str = "unknown",
+        model: Optional[str] = None,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        source: str = "estimate"
+    ):
         """Track token usage"""
         today = datetime.now().strftime("%Y-%m-%d")
         month = datetime.now().strftime("%Y-%m")
+        tenant = tenant or Config.DEFAULT_TENANT
+        model = model or Config.LLM_MODEL
         
         self.daily_usage[today] += tokens_used
         self.monthly_usage[month] += tokens_used
+        self.tenant_daily_usage[(tenant, today)] += tokens_used
         self.total_tokens += tokens_used
         
-        logger.info(f"API Usage - Tokens: {tokens_used}, Daily: {self.daily_usage[today]}, Monthly: {self.monthly_usage[month]}")
+        entry = self.breakdown[(today, tenant, endpoint, model)]
+        entry["requests"] += 1
+        entry["input_tokens"] += input_tokens
+        entry["output_tokens"] += output_tokens
+        entry["total_tokens"] += tokens_used
+        if source != "provider":
+            entry["estimated_requests"] += 1
+        
+        logger.info(
+            f"API Usage - Tenant: {tenant}, Endpoint: {endpoint}, Model: {model}, "
+            f"Tokens: {tokens_used} ({source}), Daily: {self.daily_usage[today]}, Monthly: {self.monthly_usage[month]}"
+        )
+    
+    def get_tenant_daily_usage(self, tenant: str) -> int:
+        """Get today's token usage for a tenant"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        return self.tenant_daily_usage[(tenant, today)]
+    
+    def get_usage_stats(self, tenant: Optional[str] = None) -> Dict:
+        """Get current usage statistics"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        month = datetime.now().strftime("%Y-%m")
+        
+        breakdown = [
+            {"tenant": entry_tenant, "endpoint": endpoint, "model": model, **entry}
+            for (day, entry_tenant, endpoint, model), entry in self.breakdown.items()
+            if day == today and (tenant is None or entry_tenant == tenant)
+        ]
+        
+        stats = {
+            "daily_tokens": self.daily_usage[today],
+            "monthly_tokens": self.monthly_usage[month],
+            "total_tokens": self.total_tokens,
+            "breakdown": breakdown,
+            "last_update": datetime.now().isoformat()
+        }
+        if tenant is not None:
+            stats["tenant"] = tenant
+            stats["tenant_daily_tokens"] = self.get_tenant_daily_usage(tenant)
+        return stats
+
+# -------------------------
+# Token Accounting
+# -------------------------
+class TokenCounter:
+    """Local token estimator used when the provider does not report usage"""
+    
+    CHARS_PER_TOKEN = 4
+    
+    def __init__(self):
+        self.tokenizer = None
+    
+    def attach_tokenizer(self, embeddings):
+        """Reuse the embeddings model's subword tokenizer for estimates"""
+        client = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None)
+        self.tokenizer = getattr(client, "tokenizer", None)
+        if self.tokenizer is not None:
+            logger.info("Token estimator using embeddings tokenizer")
+    
+    def count(self, text: str) -> int:
+        """Estimate the number of tokens in text"""
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            try:
+                return len(self.tokenizer.encode(text, add_special_tokens=False, verbose=False))
+            except Exception as e:
+                logger.warning(f"Tokenizer estimate failed, using character heuristic: {e}")
+        return max(1, math.ceil(len(text) / self.CHARS_PER_TOKEN))
+    
+    def measure(self, usage_callback: "TokenUsageCallback", prompt_text: str, output_text: str) -> Dict:
+        """Prefer provider-reported usage, falling back to local estimates"""
+        if usage_callback.reported:
+            input_tokens = usage_callback.input_tokens
+            output_tokens = usage_callback.output_tokens
+            source = "provider"
+        else:
+            input_tokens = self.count(prompt_text)
+            output_tokens = self.count(output_text)
+            source = "estimate"
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "source": source
+        }
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Collect token usage metadata reported by the model provider"""
+    
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.reported = False
+    
+    def on_llm_end(self, response: LLMResult, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    self._add(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+                    return
+        
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("usage_metadata") or llm_output.get("token_usage") or {}
+        input_tokens = usage.get("input_tokens", usage.get("prompt_token_count", usage.get("prompt_tokens", 0)))
+        output_tokens = usage.get("output_tokens", usage.get("candidates_token_count", usage.get("completion_tokens", 0)))
+        if input_tokens or output_tokens:
+            self._add(input_tokens, output_tokens)
+    
+    def _add(self, input_tokens: int, output_tokens: int):
+        self.input_tokens += input_tokens or 0
+        self.output_tokens += output_tokens or 0
+        self.reported = True
+
+# -------------------------
+# Enhanced Configuration
+# -------------------------
+class Config:
+    MAX_FILE_SIZE_MB = 50
+    MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+    UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024  # Multipart headers and small form fields
+    UPLOAD_WRITE_CHUNK_BYTES = 1024 * 1024  # Buffered bytes per disk write
+    CHUNK_SIZE = 1000  # Increased for fewer chunks
+    CHUNK_OVERLAP = 150
+    MAX_CHUNKS_FOR_PROCESSING = 100  # Reduced to limit API calls
+    SIMILARITY_SEARCH_K = 5  # Reduced from 8
+    SIMILARITY_THRESHOLD = 1.2  # More restrictive
+    CONTEXT_TOKEN_BUDGET = 1200  # Max input tokens spent on retrieved context
+    MAX_WORKERS = 2  # Ingestion worker processes
+    EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDINGS_PROVIDER = os.environ.get("EMBEDDINGS_PROVIDER", "huggingface")  # huggingface or fake (offline runs)
+    FAKE_EMBEDDINGS_SIZE = 384
+    LLM_MODEL = "gemini-2.5-flash"  # Use Flash model for cost efficiency
+    LLM_TEMPERATURE = 0.2  # Lower temperature for consistency
+    LLM_MAX_TOKENS = 1000  # Reduced token limit
+    LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "google")  # google, fake, record or replay
+    LLM_RECORDINGS_DIR = os.environ.get("LLM_RECORDINGS_DIR", "llm_recordings")
+    LLM_REPLAY_FALLBACK_TO_FAKE = os.environ.get("LLM_REPLAY_FALLBACK_TO_FAKE", "").lower() in ("1", "true", "yes")
+    LLM_REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "true").lower() in ("1", "true", "yes")  # Sleep for the recorded latency
+    LLM_DOWNGRADE_MODEL = "gemini-2.5-flash-lite"  # Cheaper model when budget is tight
+    LLM_DOWNGRADE_MAX_TOKENS = 500
+    DOWNGRADE_CONTEXT_TOKEN_BUDGET = 500
+    PROGRESS_UPDATE_INTERVAL = 20
+    FAISS_INDEX_DIR = "faiss_index"
+    UPLOADS_DIR = "uploads"
+    STATIC_DIR = "static"
+    
+    # Rate limiting settings
+    MAX_REQUESTS_PER_MINUTE = 15  # Conservative limit
+    MAX_DAILY_TOKENS = 50000  # Daily token limit
+    TENANT_DAILY_TOKENS = 50000  # Daily token limit per tenant
+    COOLDOWN_PERIOD = 5  # Seconds between requests
+    TOKEN_RESERVATION_TTL_SECONDS = 300  # Unreleased reservations (e.g. dropped streams) stop counting after this
+    
+    # Caching settings
+    ENABLE_RESPONSE_CACHE = True
+    CACHE_TTL_SECONDS = 3600  # 1 hour cache
+    
+    # Ingestion summary settings
+    ENABLE_INGESTION_SUMMARY = False  # Precompute summary and clause inventory; costs LLM tokens on every upload
+    SUMMARY_MAP_TOKEN_BUDGET = 3000  # Input tokens per map call
+    SUMMARY_MAP_MAX_TOKENS = 800
+    SUMMARY_REDUCE_MAX_TOKENS = 1000
+    SUMMARY_CONCURRENCY = 4  # Parallel map calls per document
+    
+    # Clause classification settings
+    CLAUSE_TAG_THRESHOLD = 0.5  # Confidence needed to tag a chunk
+    CLAUSE_AMBIGUOUS_THRESHOLD = 0.3  # Below the tag threshold but worth escalating
+    CLAUSE_ESCALATION_TOKEN_BUDGET = 3000
+    
+    # Compliance settings
+    COMPLIANCE_MAX_TOKENS = 2000  # Structured report output cap
+    
+    # Batch question settings
+    MAX_BATCH_QUESTIONS = 50
+    BATCH_LLM_CONCURRENCY = 4  # Parallel LLM calls per batch
+    
+    # Batch ingestion settings
+    BATCH_MAX_FILES = 100  # Documents per batch upload
+    BATCH_EXTRACT_CONCURRENCY = 4  # Documents parsed and chunked at once
+    BATCH_JOB_PRIORITY = -1  # Default priority, below interactive uploads
+    BATCH_INDEX_DIR = "faiss_indexes"  # Per-document indexes kept for batch uploads
+    BATCH_IMPORT_ROOT = os.environ.get("BATCH_IMPORT_ROOT")  # Server directory path imports may read; unset disables them
+    
+    # Boilerplate stripping settings
+    BOILERPLATE_EDGE_LINES = 3  # Lines at the top/bottom of a page treated as header/footer candidates
+    BOILERPLATE_EDGE_RATIO = 0.5  # Fraction of pages an edge line must repeat on
+    BOILERPLATE_BODY_RATIO = 0.8  # Fraction of pages a line anywhere must repeat on
+    BOILERPLATE_MIN_PAGES = 3  # Too few pages to tell boilerplate from content
+    
+    # Near-duplicate chunk settings
+    ENABLE_NEAR_DUPLICATE_COLLAPSE = True
+    NEAR_DUPLICATE_THRESHOLD = 0.85  # Estimated Jaccard similarity of word shingles
+    MINHASH_PERMUTATIONS = 64
+    MINHASH_BANDS = 16  # LSH bands; rows per band = permutations / bands
+    MINHASH_SHINGLE_SIZE = 5  # Words per shingle
+    
+    # Citation settings
+    SENTENCE_CACHE_SIZE = 5000  # Sentence vectors kept for reference highlighting
+    REFERENCE_SNIPPET_CHARS = 200
+    
+    # Task store settings
+    TASK_STORE_PATH = "task_store/tasks.db"
+    TASK_CACHE_SIZE = 32  # Task records kept decompressed in memory
+    TASK_COMPRESSION_LEVEL = 3
+    TASK_TTL_SECONDS = 7 * 24 * 3600
+    VERSION_STORE_PATH = "task_store/versions.db"
+    PROGRESS_TTL_SECONDS = 24 * 3600
+    CLEANUP_INTERVAL_SECONDS = 600
+    
+    # Ingestion job queue settings
+    JOB_QUEUE_PATH = "task_store/jobs.db"
+    JOB_QUEUE_MAX = 20  # Queued jobs before uploads get 503
+    # Queue slots batch documents leave free for interactive uploads; at least
+    # BATCH_EXTRACT_CONCURRENCY, since that many may pass the check at once
+    INTERACTIVE_QUEUE_HEADROOM = 5
+    JOB_POLL_INTERVAL_SECONDS = 2
+    JOB_RETRY_AFTER_SECONDS = 10  # Minimum Retry-After on a full queue
+    
+    # Upload storage settings
+    TENANT_STORAGE_QUOTA_BYTES = 500 * 1024 * 1024
+    TOTAL_STORAGE_QUOTA_BYTES = 5 * 1024 * 1024 * 1024
+    UPLOAD_MAX_AGE_SECONDS = 30 * 24 * 3600  # Evict PDFs not used for this long
+    ORPHAN_GRACE_SECONDS = 3600  # Leave untracked files this young alone; they may be mid-upload
+    
+    # Fake LLM settings (LLM_PROVIDER=fake)
+    FAKE_LLM_LATENCY_DISTRIBUTION = os.environ.get("FAKE_LLM_LATENCY_DISTRIBUTION", "lognormal")  # fixed, uniform, lognormal or exponential
+    FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", 0.8))  # Median response time
+    FAKE_LLM_LATENCY_JITTER = float(os.environ.get("FAKE_LLM_LATENCY_JITTER", 0.5))  # Lognormal sigma, or +/- fraction for uniform
+    FAKE_LLM_FIRST_TOKEN_FRACTION = 0.3  # Share of the latency spent before the first streamed chunk
+    FAKE_LLM_OUTPUT_TOKENS = int(os.environ.get("FAKE_LLM_OUTPUT_TOKENS", 120))
+    FAKE_LLM_STREAM_CHUNK_TOKENS = 8
+    FAKE_LLM_SEED = os.environ.get("FAKE_LLM_SEED")
+    
+    # Metrics settings
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    TRACED_PATHS = ("/upload-pdf/", "/ask-question/")  # Responses carry a Server-Timing header
+    TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH")  # JSON-lines request traces; unset disables them
+    
+    # Profiling settings
+    ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # Required by /admin/ endpoints; unset disables them
+    PROFILE_DEFAULT_SECONDS = 10
+    PROFILE_MAX_SECONDS = 120
+    PROFILE_SAMPLE_INTERVAL_MS = 5
+    PROFILE_TOP_ENTRIES = 50
+    PROFILE_TRACEMALLOC_FRAMES = 10
+    
+    # Tenant settings
+    DEFAULT_TENANT = "default"
+
+# Shorter, more focused prompt to reduce token usage
+QA_PROMPT_TEMPLATE = """
+You are Lawgic AI, a legal assistant. 
+Use the provided context to answer. 
+If the context does not contain the answer, clearly say: 
+"I could not find this in the document, but here’s a general insight."
+
+Context:
+{context}
+
+Question: {question}
+
+Answer diplomatically:
+"""
+
+SUMMARY_MAP_PROMPT_TEMPLATE = """
+You are Lawgic AI, a legal assistant reviewing one section of a contract.
+Return JSON only, with this shape:
+{{"summary": "<3-5 sentence summary of this section>",
+  "clauses": [{{"type": "<coverage_terms|exclusions|claims_obligations|premium_adjustments|obligations|termination|regulatory|other>",
+               "page": <page number from the [Page N] tag>,
+               "text": "<the clause, quoted or closely paraphrased>"}}]}}
+Only list clauses that appear in the text.
+
+Text:
+{context}
+"""
+
+SUMMARY_REDUCE_PROMPT_TEMPLATE = """
+You are Lawgic AI, a legal assistant.
+Combine these section summaries of one document into a single regulatory
+compliance summary covering purpose, key requirements, obligations and
+potential risks. Be concise and do not add facts that are not present.
+
+Section summaries:
+{summaries}
+
+Document summary:
+"""
+
+COMPLIANCE_PROMPT_TEMPLATE = """
+You are an AI Compliance Review Agent designed for the insurance sector.
+Analyze the contract context to:
+- Extract & categorize insurance-specific clauses (coverage terms, exclusions, claims obligations, premium adjustments).
+- Map clauses to compliance frameworks (IRDAI, GDPR, HIPAA, internal policies) with status Aligned / Partial / Gap.
+- Identify risks and rate financial_exposure, regulatory_impact and urgency from 0 to 1. Do not compute an overall score.
+- Provide explainable and auditable reasoning for each risk.
+
+Preserve original meaning and do not invent facts. Only use the context.
+Respond with JSON matching the schema: list clauses first, then risks, then the executive summary.
+
+Context:
+{context}
+
+Question:
+{question}
+"""
+
+class ComplianceClause(BaseModel):
+    id: str
+    clause_type: Literal[
+        "coverage_terms", "exclusions", "claims_obligations",
+        "premium_adjustments", "regulatory", "termination", "other"
+    ]
+    page: Optional[int] = None
+    text: str
+    compliance_status: Literal["Aligned", "Partial", "Gap"]
+    frameworks: List[str] = []
+
+class ComplianceRisk(BaseModel):
+    clause_id: str
+    description: str
+    financial_exposure: float = Field(ge=0, le=1)
+    regulatory_impact: float = Field(ge=0, le=1)
+    urgency: float = Field(ge=0, le=1)
+    rationale: str
+
+class ComplianceReport(BaseModel):
+    clauses: List[ComplianceClause]
+    risks: List[ComplianceRisk]
+    executive_summary: str
+
+def _inline_schema_refs(schema, defs: Optional[Dict] = None):
+    """Resolve $ref and nullable anyOf entries for the Gemini response schema"""
+    if defs is None:
+        defs = schema.get("$defs", {})
+    if isinstance(schema, list):
+        return [_inline_schema_refs(item, defs) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    if "$ref" in schema:
+        return _inline_schema_refs(defs[schema["$ref"].split("/")[-1]], defs)
+    
+    variants = schema.get("anyOf", [])
+    non_null = [variant for variant in variants if variant.get("type") != "null"]
+    if len(variants) == 2 and len(non_null) == 1:
+        return {**_inline_schema_refs(non_null[0], defs), "nullable": True}
+    
+    resolved = {}
+    for key, value in schema.items():
+        if key in ("$defs", "title", "default"):
+            continue
+        if key == "properties":
+            resolved[key] = {name: _inline_schema_refs(prop, defs) for name, prop in value.items()}
+        else:
+            resolved[key] = _inline_schema_refs(value, defs)
+    return resolved
+
+COMPLIANCE_RESPONSE_SCHEMA = _inline_schema_refs(ComplianceReport.model_json_schema())
+
+SIMPLIFY_PROMPT_TEMPLATE = """
+You are a Legal Document Simplifier AI. 
+Your task is to take complex legal text and explain it in clear, plain, and accurate language
+that a non-lawyer can easily understand.
+
+Guidelines:
+- Use simple words, short sentences, and examples.
+- Do NOT change meaning or remove important details.
+- If an answer is not present in the context, reply: "answer is not available in the context".
+- Never fabricate or assume outside information.
+
+Context:
+{context}
+
+Question:
+{question}
+
+Simplified Answer:
+"""
+
+# Prompt registry: every mode shares ingestion, index, model, cache and limiter
+PROMPT_MODES = {
+    "ask": {"template": QA_PROMPT_TEMPLATE, "endpoint": "ask-question"},
+    "simplify": {"template": SIMPLIFY_PROMPT_TEMPLATE, "endpoint": "simplify"},
+    "compliance": {"template": COMPLIANCE_PROMPT_TEMPLATE, "endpoint": "compliance"},
+}
+QA_MODES = ("ask", "simplify")  # Modes answered through the "stuff" QA chain
+
+def resolve_tenant(tenant_id: Optional[str]) -> str:
+    """Normalize the tenant identifier supplied by the client"""
+    tenant = (tenant_id or "").strip()
+    return tenant or Config.DEFAULT_TENANT
+
+# -------------------------
+# Response Cache
+# -------------------------
+class ResponseCache:
+    """Simple in-memory response cache"""
+    
+    def __init__(self, ttl_seconds: int = 3600):
+        self.cache = {}
+        self.ttl = ttl_seconds
+    
+    def _generate_key(self, question: str, doc_hash: str = "") -> str:
+        """Generate cache key"""
+        import hashlib
+        combined = f"{question.strip().lower()}_{doc_hash}"
+        return hashlib.md5(combined.encode()).hexdigest()
+    
+    def get(self, question: str, doc_hash: str = "") -> Optional[Dict]:
+        """Get cached response"""
+        key = self._generate_key(question, doc_hash)
+        if key in self.cache:
+            entry = self.cache[key]
+            if time.time() - entry['timestamp'] < self.ttl:
+                logger.info(f"Cache hit for question: {question[:50]}...")
+                app_state.metrics.cache("response", hits=1)
+                return entry['response']
+            else:
+                del self.cache[key]
+        app_state.metrics.cache("response", misses=1)
+        return None
+    
+    def set(self, question: str, response: Dict, doc_hash: str = ""):
+        """Cache response"""
+        key = self._generate_key(question, doc_hash)
+        self.cache[key] = {
+            'response': response,
+            'timestamp': time.time()
+        }
+        logger.info(f"Cached response for: {question[:50]}...")
+
+# -------------------------
+# Clause Classification
+# -------------------------
+CLAUSE_PATTERNS = {
+    "coverage_terms": [
+        r"\bcover(?:ed|age|s)?\b",
+        r"\bbenefits?\b",
+        r"\bsum insured\b|\binsured amount\b",
+        r"\bpolicy limits?\b|\blimit of liability\b",
+        r"\bindemnif(?:y|ies|ication)\b",
+    ],
+    "exclusions": [
+        r"\bexclu(?:de|ded|des|sion|sions)\b",
+        r"\bnot covered\b",
+        r"\bshall not (?:be liable|apply|cover)\b",
+        r"\bexcept(?:ion|ions)?\b",
+        r"\bwaiting period\b",
+    ],
+    "claims_obligations": [
+        r"\bclaims?\b",
+        r"\bnotif(?:y|ied|ication)\b|\bnotice\b",
+        r"\bwithin (?:\d+|seven|fifteen|thirty|sixty|ninety) days\b",
+        r"\bproof of loss\b",
+        r"\bsubmi(?:t|ssion)\b|\bdocumentation\b",
+    ],
+    "premium_adjustments": [
+        r"\bpremiums?\b",
+        r"\bdeductibles?\b|\bco-?pay(?:ment)?s?\b",
+        r"\b(?:increase|decrease|adjust(?:ment)?|revis(?:e|ion))\b",
+        r"\bloading\b|\bno[- ]claims? bonus\b",
+    ],
+    "regulatory": [
+        r"\bIRDAI\b|\bGDPR\b|\bHIPAA\b",
+        r"\bregulat(?:ion|ions|ory|or)\b",
+        r"\bcompl(?:y|iance)\b",
+        r"\bstatut(?:e|ory)\b|\bapplicable law\b",
+        r"\bdata protection\b|\bpersonal data\b",
+    ],
+    "termination": [
+        r"\bterminat(?:e|ed|ion)\b",
+        r"\bcancel(?:led|lation)?\b",
+        r"\brenew(?:al|ed)?\b",
+        r"\bgrace period\b",
+        r"\blapse[sd]?\b",
+    ],
+}
+
+CLAUSE_EXEMPLARS = {
+    "coverage_terms": [
+        "The insurer will indemnify the insured for covered losses up to the sum insured stated in the schedule.",
+        "This policy covers hospitalisation expenses, including room rent, surgeon fees and medicines.",
+    ],
+    "exclusions": [
+        "The insurer shall not be liable for any loss arising from war, nuclear risks or wilful misconduct.",
+        "Pre-existing conditions are excluded from coverage until the waiting period has elapsed.",
+    ],
+    "claims_obligations": [
+        "The insured must notify the insurer of any claim within thirty days and submit proof of loss.",
+        "All claims shall be supported by original bills, reports and documentation requested by the insurer.",
+    ],
+    "premium_adjustments": [
+        "The premium may be revised on renewal based on the claims experience of the insured.",
+        "A deductible of the stated amount applies to each claim and a no claim bonus is applied on renewal.",
+    ],
+    "regulatory": [
+        "This policy is subject to the regulations issued by IRDAI and the applicable law in force.",
+        "Personal data shall be processed in compliance with applicable data protection regulation.",
+    ],
+    "termination": [
+        "Either party may terminate or cancel this policy by giving thirty days written notice.",
+        "The policy lapses if the premium is not paid within the grace period and may be renewed thereafter.",
+    ],
+}
+
+CLAUSE_ESCALATION_PROMPT_TEMPLATE = """
+You are Lawgic AI, a legal assistant classifying insurance contract passages.
+Allowed clause types: {clause_types}.
+For each numbered passage return the clause types it contains (possibly none).
+Return JSON only, mapping passage number to a list of types, e.g. {{"1": ["exclusions"]}}.
+
+Passages:
+{passages}
+"""
+
+class ClauseClassifier:
+    """CPU-only clause tagger combining keyword patterns and exemplar centroids"""
+    
+    KEYWORD_WEIGHT = 0.6
+    
+    def __init__(self):
+        self.clause_types = list(CLAUSE_PATTERNS)
+        self.patterns = {
+            clause_type: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for clause_type, patterns in CLAUSE_PATTERNS.items()
+        }
+        self.centroids: Optional[np.ndarray] = None
+    
+    def _get_centroids(self, embeddings) -> Optional[np.ndarray]:
+        """Embed labelled exemplars once and keep one unit centroid per type"""
+        if self.centroids is None and embeddings is not None:
+            try:
+                centroids = []
+                for clause_type in self.clause_types:
+                    vectors = np.asarray(embeddings.embed_documents(CLAUSE_EXEMPLARS[clause_type]), dtype=np.float32)
+                    centroid = vectors.mean(axis=0)
+                    centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+                self.centroids = np.vstack(centroids)
+            except Exception as e:
+                logger.warning(f"Failed to embed clause exemplars, using keywords only: {e}")
+        return self.centroids
+    
+    def _keyword_scores(self, texts: List[str]) -> np.ndarray:
+        """Fraction of each type's patterns matched, saturating at two hits"""
+        scores = np.zeros((len(texts), len(self.clause_types)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, clause_type in enumerate(self.clause_types):
+                hits = sum(1 for pattern in self.patterns[clause_type] if pattern.search(text))
+                scores[row, column] = min(1.0, hits / 2)
+        return scores
+    
+    def classify(self, texts: List[str], vectors: Optional[np.ndarray] = None, embeddings=None) -> List[Dict]:
+        """Score every chunk against every clause type in one pass"""
+        if not texts:
+            return []
+        
+        confidence = self._keyword_scores(texts)
+        centroids = self._get_centroids(embeddings)
+        if vectors is not None and centroids is not None:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            similarity = (matrix / norms) @ centroids.T
+            # Map typical sentence-embedding cosine range onto [0, 1]
+            semantic = np.clip((similarity - 0.1) / 0.5, 0.0, 1.0)
+            confidence = self.KEYWORD_WEIGHT * confidence + (1 - self.KEYWORD_WEIGHT) * semantic
+        
+        results = []
+        for row in confidence:
+            tagged = {
+                clause_type: round(float(score), 3)
+                for clause_type, score in zip(self.clause_types, row)
+                if score >= Config.CLAUSE_TAG_THRESHOLD
+            }
+            best = float(row.max())
+            results.append({
+                "clause_types": sorted(tagged, key=tagged.get, reverse=True),
+                "clause_confidence": tagged,
+                "clause_ambiguous": not tagged and best >= Config.CLAUSE_AMBIGUOUS_THRESHOLD
+            })
+        return results
+
+# -------------------------
+# Risk Scoring
+# -------------------------
+RISK_FACTORS = ("financial_exposure", "regulatory_impact", "urgency")
+RISK_WEIGHTS = np.array([0.5, 0.3, 0.2], dtype=np.float32)  # combined_score weights
+
+# Prior factor values (0-1) per clause type, scaled by tag confidence
+CLAUSE_RISK_PRIORS = {
+    "coverage_terms": (0.6, 0.3, 0.3),
+    "exclusions": (0.8, 0.4, 0.5),
+    "claims_obligations": (0.5, 0.4, 0.8),
+    "premium_adjustments": (0.7, 0.3, 0.4),
+    "regulatory": (0.4, 0.9, 0.6),
+    "termination": (0.6, 0.4, 0.7),
+}
+
+class RiskScorer:
+    """Vectorized combined_score computation, ranking and aggregation"""
+    
+    HIGH_RISK_THRESHOLD = 0.6
+    MEDIUM_RISK_THRESHOLD = 0.35
+    
+    def factors_from_tags(self, metadatas: List[Dict]) -> Dict[str, np.ndarray]:
+        """Build a factor table with one row per tagged (chunk, clause type)"""
+        priors = np.array([CLAUSE_RISK_PRIORS[clause_type] for clause_type in CLAUSE_PATTERNS], dtype=np.float32)
+        type_index = {clause_type: index for index, clause_type in enumerate(CLAUSE_PATTERNS)}
+        
+        type_ids, confidences, pages, chunks = [], [], [], []
+        for metadata in metadatas:
+            for clause_type, confidence in (metadata.get("clause_confidence") or {}).items():
+                type_ids.append(type_index[clause_type])
+                confidences.append(confidence)
+                pages.append(metadata.get("page") or 0)
+                chunks.append(metadata.get("chunk", -1))
+        
+        type_ids = np.asarray(type_ids, dtype=np.int32)
+        return {
+            "factors": priors[type_ids] * np.asarray(confidences, dtype=np.float32)[:, None],
+            "type_ids": type_ids,
+            "pages": np.asarray(pages, dtype=np.int32),
+            "chunks": np.asarray(chunks, dtype=np.int32)
+        }
+    
+    def score(self, factors: np.ndarray) -> np.ndarray:
+        """combined_score = financial_exposure*0.5 + regulatory_impact*0.3 + urgency*0.2"""
+        return np.clip(factors, 0.0, 1.0) @ RISK_WEIGHTS
+    
+    def levels(self, scores: np.ndarray) -> np.ndarray:
+        """Bucket scores into high / medium / low"""
+        return np.select(
+            [scores >= self.HIGH_RISK_THRESHOLD, scores >= self.MEDIUM_RISK_THRESHOLD],
+            ["high", "medium"],
+            default="low"
+        )
+    
+    def rank(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k scores, highest first"""
+        top_k = max(0, top_k)
+        if top_k >= len(scores):
+            return np.argsort(-scores, kind="stable")
+        top = np.argpartition(-scores, top_k)[:top_k]
+        return top[np.argsort(-scores[top], kind="stable")]
+    
+    def aggregate(self, scores: np.ndarray, group_ids: np.ndarray, group_count: int) -> Dict[str, np.ndarray]:
+        """Per-group count, total, mean and max of scores"""
+        counts = np.bincount(group_ids, minlength=group_count)
+        totals = np.bincount(group_ids, weights=scores, minlength=group_count)
+        maxima = np.zeros(group_count, dtype=np.float64)
+        np.maximum.at(maxima, group_ids, scores)
+        means = np.divide(totals, counts, out=np.zeros_like(totals), where=counts > 0)
+        return {"count": counts, "total": totals, "mean": means, "max": maxima}
+
+# -------------------------
+# Incremental JSON Parsing
+# -------------------------
+class IncrementalJSONParser:
+    """Emit array elements of a streamed top-level JSON object as they close.
+    
+    Fed with raw text deltas, the parser tracks string/escape state and
+    nesting depth, and returns (key, element) for every object completed
+    inside a top-level array such as {"clauses": [{...}, {...}]}.
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_key_candidate: Optional[str] = None
+        self.current_key: Optional[str] = None
+        self.element_start: Optional[int] = None
+    
+    def feed(self, text: str) -> List[Tuple[Optional[str], Dict]]:
+        self.buffer += text
+        events = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        self.last_key_candidate = self.buffer[self.string_start:self.position + 1]
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.position
+            elif char == ":" and len(self.stack) == 1 and self.last_key_candidate:
+                self.current_key = json.loads(self.last_key_candidate)
+                self.last_key_candidate = None
+            elif char in "{[":
+                self.stack.append(char)
+                if len(self.stack) == 3 and self.stack[1] == "[" and char == "{":
+                    self.element_start = self.position
+            elif char in "}]":
+                if len(self.stack) == 3 and self.element_start is not None:
+                    try:
+                        events.append((self.current_key, json.loads(self.buffer[self.element_start:self.position + 1])))
+                    except ValueError:
+                        logger.warning(f"Skipping malformed streamed element under {self.current_key}")
+                    self.element_start = None
+                if self.stack:
+                    self.stack.pop()
+            self.position += 1
+        return events
+    
+    def result(self) -> Optional[Dict]:
+        """Parse the complete buffer once the stream has finished"""
+        return _parse_json_object(self.buffer)
+
+# -------------------------
+# Near-Duplicate Detection
+# -------------------------
+MINHASH_PRIME = (1 << 31) - 1
+
+class NearDuplicateDetector:
+    """MinHash fingerprints with LSH banding to collapse near-duplicate chunks"""
+    
+    def __init__(self, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MINHASH_PRIME, Config.MINHASH_PERMUTATIONS, dtype=np.uint64)
+        self.b = rng.integers(0, MINHASH_PRIME, Config.MINHASH_PERMUTATIONS, dtype=np.uint64)
+        self.bands = Config.MINHASH_BANDS
+    
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature over word shingles"""
+        words = re.findall(r"\w+", text.lower())
+        size = Config.MINHASH_SHINGLE_SIZE
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little") for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        ) % MINHASH_PRIME
+        # 31-bit operands keep a * h + b within uint64
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % MINHASH_PRIME).min(axis=1)
+    
+    def collapse(
+        self,
+        text_chunks: List[str],
+        metadatas: List[Dict],
+        vectors: List[Optional[List[float]]]
+    ) -> Tuple[List[str], List[Dict], List[Optional[List[float]]], int]:
+        """Keep the first chunk of each near-duplicate group and record every source page on it"""
+        if len(text_chunks) < 2:
+            return text_chunks, metadatas, vectors, 0
+        
+        signatures = [self.signature(chunk) for chunk in text_chunks]
+        buckets = defaultdict(list)
+        survivors = []
+        duplicate_pages = defaultdict(set)
+        
+        for index, signature in enumerate(signatures):
+            keys = [(band, rows.tobytes()) for band, rows in enumerate(signature.reshape(self.bands, -1))]
+            candidates = sorted({candidate for key in keys for candidate in buckets.get(key, ())})
+            match = next(
+                (candidate for candidate in candidates
+                 if np.mean(signatures[candidate] == signature) >= Config.NEAR_DUPLICATE_THRESHOLD),
+                None
+            )
+            if match is None:
+                survivors.append(index)
+                for key in keys:
+                    buckets[key].append(index)
+            else:
+                duplicate_pages[match].add(metadatas[index].get("page"))
+        
+        chunks, kept_metadatas, kept_vectors = [], [], []
+        for index in survivors:
+            metadata = dict(metadatas[index], chunk=len(chunks))
+            if index in duplicate_pages:
+                metadata["pages"] = sorted({metadata["page"]} | duplicate_pages[index])
+                metadata["duplicates"] = len(duplicate_pages[index])
+            chunks.append(text_chunks[index])
+            kept_metadatas.append(metadata)
+            kept_vectors.append(vectors[index])
+        
+        removed = len(text_chunks) - len(chunks)
+        if removed:
+            logger.info(f"Collapsed {removed} near-duplicate chunks into {len(duplicate_pages)}")
+        return chunks, kept_metadatas, kept_vectors, removed
+
+# -------------------------
+# Citation Spans
+# -------------------------
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+|\n\s*\n")
+
+class SentenceLocator:
+    """Pick the sentence of each chunk closest to the question, caching sentence vectors"""
+    
+    def __init__(self, max_entries: int = Config.SENTENCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def sentence_spans(text: str) -> List[Tuple[int, int]]:
+        """Whitespace-trimmed (start, end) offsets of the sentences in text"""
+        spans = []
+        start = 0
+        for boundary in list(SENTENCE_BOUNDARY.finditer(text)) + [None]:
+            end = boundary.start() if boundary else len(text)
+            span_start, span_end = start, end
+            while span_start < span_end and text[span_start].isspace():
+                span_start += 1
+            while span_end > span_start and text[span_end - 1].isspace():
+                span_end -= 1
+            if span_end > span_start:
+                spans.append((span_start, span_end))
+            if boundary:
+                start = boundary.end()
+        return spans
+    
+    def _embed(self, sentences: List[str], embeddings) -> np.ndarray:
+        """Sentence vectors, embedding only those not cached yet"""
+        with self.lock:
+            unique = dict.fromkeys(sentences)
+            missing = [sentence for sentence in unique if sentence not in self.vectors]
+        app_state.metrics.cache("sentence_vectors", hits=len(unique) - len(missing), misses=len(missing))
+        if missing:
+            embedded = embeddings.embed_documents(missing)
+            with self.lock:
+                for sentence, vector in zip(missing, embedded):
+                    self.vectors[sentence] = np.asarray(vector, dtype=np.float32)
+                while len(self.vectors) > self.max_entries:
+                    self.vectors.popitem(last=False)
+        with self.lock:
+            for sentence in sentences:
+                self.vectors.move_to_end(sentence)
+            return np.stack([self.vectors[sentence] for sentence in sentences])
+    
+    def locate(self, texts: List[str], query_vector: Optional[np.ndarray], embeddings) -> List[Tuple[int, int]]:
+        """Best sentence span per text, or the first sentence without a query vector"""
+        spans = [self.sentence_spans(text) or [(0, len(text))] for text in texts]
+        if query_vector is None or embeddings is None:
+            return [text_spans[0] for text_spans in spans]
+        
+        # Single-sentence chunks have nothing to choose between, so only the rest are embedded
+        sentences = [
+            text[start:end] for text, text_spans in zip(texts, spans) if len(text_spans) > 1
+            for start, end in text_spans
+        ]
+        if sentences:
+            distances = np.linalg.norm(self._embed(sentences, embeddings) - np.asarray(query_vector, dtype=np.float32), axis=1)
+        best = []
+        offset = 0
+        for text_spans in spans:
+            if len(text_spans) == 1:
+                best.append(text_spans[0])
+                continue
+            best.append(text_spans[int(np.argmin(distances[offset:offset + len(text_spans)]))])
+            offset += len(text_spans)
+        return best
+
+def citation_span(metadata: Dict, text: str, start: int, end: int) -> Dict:
+    """Page plus in-page character and line offsets of text[start:end].
+    
+    Offsets refer to the extracted page text, using the chunk's page_char,
+    page_line and page_breaks metadata recorded at chunking time.
+    """
+    page = metadata.get("page")
+    base = metadata.get("page_char")
+    line = metadata.get("page_line")
+    origin = 0
+    for offset, break_page in metadata.get("page_breaks", []):
+        if offset > start:
+            break
+        page, base, line, origin = break_page, 0, 1, offset
+    if base is None or line is None:
+        return {"page": page}
+    
+    line_start = line + text.count("\n", origin, start)
+    return {
+        "page": page,
+        "char_start": base + start - origin,
+        "char_end": base + end - origin,
+        "line_start": line_start,
+        "line_end": line_start + text.count("\n", start, end)
+    }
+
+# -------------------------
+# Index Registry
+# -------------------------
+class IndexRegistry:
+    """Keep loaded FAISS indexes in memory, keyed by index directory.
+    
+    Entries are reloaded when the index file on disk changes, so another
+    process writing the same directory is picked up.
+    """
+    
+    def __init__(self):
+        self.indexes: Dict[str, Tuple[float, FAISS]] = {}
+        self.lock = threading.Lock()
+    
+    def _mtime(self, index_dir: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(os.path.join(index_dir, "index.faiss"))
+        except OSError:
+            return None
+    
+    def get(self, index_dir: str, embeddings) -> Optional[FAISS]:
+        """Return the loaded index, loading it from disk if needed"""
+        mtime = self._mtime(index_dir)
+        if mtime is None:
+            return None
+        with self.lock:
+            entry = self.indexes.get(index_dir)
+            if entry is None or entry[0] != mtime:
+                logger.info(f"Loading index from {index_dir}")
+                app_state.metrics.cache("index", misses=1)
+                with app_state.metrics.time("index_load"):
+                    vector_store = FAISS.load_local(
+                        index_dir, 
+                        embeddings,
+                        allow_dangerous_deserialization=True
+                    )
+                entry = (mtime, vector_store)
+                self.indexes[index_dir] = entry
+            else:
+                app_state.metrics.cache("index", hits=1)
+            return entry[1]
+    
+    def put(self, index_dir: str, vector_store: FAISS):
+        """Register an index that was just saved to index_dir"""
+        with self.lock:
+            self.indexes[index_dir] = (self._mtime(index_dir), vector_store)
+    
+    def evict(self, index_dir: str):
+        with self.lock:
+            self.indexes.pop(index_dir, None)
+
+# -------------------------
+# Document Versioning
+# -------------------------
+class DocumentVersionStore:
+    """Version history per document with page hashes and reusable chunk vectors.
+    
+    Stored in SQLite next to the task store and read on demand. Only the
+    latest version's chunk vectors are kept, as float32 blobs, and entries
+    go away with the task records they belong to.
+    """
+    
+    def __init__(self, path: str = Config.VERSION_STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            "document_id TEXT NOT NULL, version INTEGER NOT NULL, task_id TEXT NOT NULL, "
+            "page_hashes BLOB NOT NULL, created TEXT NOT NULL, PRIMARY KEY (document_id, version))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS document_vectors ("
+            "document_id TEXT NOT NULL, chunk_hash TEXT NOT NULL, task_id TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (document_id, chunk_hash))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS versions_task ON versions (task_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS document_vectors_task ON document_vectors (task_id)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Hash text with whitespace normalized"""
+        return hashlib.sha256(" ".join((text or "").split()).encode()).hexdigest()
+    
+    @staticmethod
+    def key(tenant: str, document_id: str) -> str:
+        """Store key of a tenant's document; document ids are only unique within a tenant"""
+        return json.dumps([tenant, document_id])
+    
+    @staticmethod
+    def _entry(row: Tuple) -> Dict:
+        version, task_id, page_hashes, created = row
+        return {"version": version, "task_id": task_id, "page_hashes": pickle.loads(page_hashes), "created": created}
+    
+    def history(self, document_id: str) -> List[Dict]:
+        """Registered versions of a document, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT version, task_id, page_hashes, created FROM versions WHERE document_id = ? ORDER BY version",
+                (document_id,)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+    
+    def get_version(self, document_id: str, version: int) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version, task_id, page_hashes, created FROM versions WHERE document_id = ? AND version = ?",
+                (document_id, version)
+            ).fetchone()
+        return self._entry(row) if row else None
+    
+    def latest(self, document_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version, task_id, page_hashes, created FROM versions WHERE document_id = ? "
+                "ORDER BY version DESC LIMIT 1",
+                (document_id,)
+            ).fetchone()
+        return self._entry(row) if row else None
+    
+    def _next_version(self, document_id: str) -> int:
+        """Call with the lock held"""
+        (current,) = self.conn.execute(
+            "SELECT COALESCE(MAX(version), 0) FROM versions WHERE document_id = ?", (document_id,)
+        ).fetchone()
+        return current + 1
+    
+    def next_version(self, document_id: str) -> int:
+        """Number the next registered version of a document will get"""
+        with self.lock:
+            return self._next_version(document_id)
+    
+    def add_version(self, document_id: str, task_id: str, page_hashes: Dict[int, str]) -> int:
+        """Register a new version and return its number"""
+        with self.lock:
+            version = self._next_version(document_id)
+            self.conn.execute(
+                "INSERT INTO versions (document_id, version, task_id, page_hashes, created) VALUES (?, ?, ?, ?, ?)",
+                (
+                    document_id, version, task_id,
+                    pickle.dumps(page_hashes, protocol=pickle.HIGHEST_PROTOCOL), datetime.now().isoformat()
+                )
+            )
+            self.conn.commit()
+        return version
+    
+    def record_chunks(self, document_id: str, task_id: str, text_chunks: List[str], vectors: List[List[float]]):
+        """Replace the document's reusable chunk vectors with this version's, keyed by chunk text"""
+        rows = [
+            (document_id, self.hash_text(chunk), task_id, np.asarray(vector, dtype=np.float32).tobytes())
+            for chunk, vector in zip(text_chunks, vectors)
+        ]
+        with self.lock:
+            self.conn.execute("DELETE FROM document_vectors WHERE document_id = ?", (document_id,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO document_vectors (document_id, chunk_hash, task_id, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+    
+    def chunk_vectors(self, document_id: str, chunk_hashes: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors for those of chunk_hashes the document's latest version had"""
+        found = {}
+        wanted = list(dict.fromkeys(chunk_hashes))
+        with self.lock:
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                found.update(self.conn.execute(
+                    f"SELECT chunk_hash, vector FROM document_vectors WHERE document_id = ? "
+                    f"AND chunk_hash IN ({', '.join('?' * len(batch))})",
+                    (document_id, *batch)
+                ).fetchall())
+        return {chunk_hash: np.frombuffer(blob, dtype=np.float32).tolist() for chunk_hash, blob in found.items()}
+    
+    def remove_tasks(self, task_ids: List[str]) -> int:
+        """Forget the versions and vectors of deleted tasks; returns the versions removed"""
+        rows = [(task_id,) for task_id in task_ids]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany("DELETE FROM versions WHERE task_id = ?", rows)
+            removed = self.conn.total_changes - before
+            self.conn.executemany("DELETE FROM document_vectors WHERE task_id = ?", rows)
+            self.conn.commit()
+        return removed
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            documents, versions = self.conn.execute("SELECT COUNT(DISTINCT document_id), COUNT(*) FROM versions").fetchone()
+            (vectors,) = self.conn.execute("SELECT COUNT(*) FROM document_vectors").fetchone()
+        return {"documents": documents, "versions": versions, "chunk_vectors": vectors}
+    
+    @staticmethod
+    def diff(old_hashes: Dict[int, str], new_hashes: Dict[int, str]) -> Dict[str, List[int]]:
+        """Compare two versions page by page"""
+        return {
+            "added": sorted(page for page in new_hashes if page not in old_hashes),
+            "removed": sorted(page for page in old_hashes if page not in new_hashes),
+            "modified": sorted(
+                page for page in new_hashes
+                if page in old_hashes and old_hashes[page] != new_hashes[page]
+            ),
+            "unchanged": sorted(
+                page for page in new_hashes
+                if page in old_hashes and old_hashes[page] == new_hashes[page]
+            )
+        }
+
+# -------------------------
+# Task Store
+# -------------------------
+class TaskStore:
+    """SQLite-backed task records with zstd-compressed payloads and an LRU of hot entries.
+    
+    Large write-once fields (BLOB_FIELDS) are compressed into `data`; the
+    risk table and small status fields such as the summary are stored in
+    their own columns, so status updates don't rewrite the page text.
+    Records returned by get() are cached copies; persist changes with
+    update() rather than mutating them in place.
+    """
+    
+    BLOB_FIELDS = ("pages", "page_hashes", "metadata")
+    
+    def __init__(self, path: str = Config.TASK_STORE_PATH, cache_size: int = Config.TASK_CACHE_SIZE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "task_id TEXT PRIMARY KEY, updated REAL NOT NULL, data BLOB NOT NULL, risk_table BLOB, state BLOB)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(tasks)")}
+        if "state" not in columns:
+            # Stores written before status fields moved out of the compressed blob
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN state BLOB")
+        self.conn.commit()
+        self.cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self.cache_size = cache_size
+        self.compressor = zstandard.ZstdCompressor(level=Config.TASK_COMPRESSION_LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.lock = threading.Lock()
+    
+    def _cache(self, task_id: str, record: Dict):
+        self.cache[task_id] = record
+        self.cache.move_to_end(task_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+    
+    def _columns(self, record: Dict) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """Pickled state and risk_table columns for a record"""
+        state = {key: value for key, value in record.items() if key not in self.BLOB_FIELDS and key != "risk_table"}
+        risk_table = record.get("risk_table")
+        return (
+            pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL),
+            pickle.dumps(risk_table, protocol=pickle.HIGHEST_PROTOCOL) if risk_table is not None else None
+        )
+    
+    def _write(self, task_id: str, record: Dict):
+        """Write a whole record; call with the lock held"""
+        data = {key: record[key] for key in self.BLOB_FIELDS if key in record}
+        state, risk_table = self._columns(record)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, updated, data, risk_table, state) VALUES (?, ?, ?, ?, ?)",
+            (
+                task_id,
+                time.time(),
+                self.compressor.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)),
+                risk_table,
+                state
+            )
+        )
+        self.conn.commit()
+        self._cache(task_id, record)
+    
+    def _load(self, task_id: str) -> Optional[Dict]:
+        """Cached or stored record; call with the lock held"""
+        if task_id in self.cache:
+            self.cache.move_to_end(task_id)
+            return self.cache[task_id]
+        row = self.conn.execute(
+            "SELECT data, risk_table, state FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = pickle.loads(self.decompressor.decompress(row[0]))
+        if row[2] is not None:
+            record.update(pickle.loads(row[2]))
+        if row[1] is not None:
+            record["risk_table"] = pickle.loads(row[1])
+        self._cache(task_id, record)
+        return record
+    
+    def __setitem__(self, task_id: str, record: Dict):
+        with self.lock:
+            self._write(task_id, dict(record))
+    
+    def get(self, task_id: Optional[str]) -> Optional[Dict]:
+        if not task_id:
+            return None
+        with self.lock:
+            return self._load(task_id)
+    
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+    
+    def update(self, task_id: str, changes: Dict) -> bool:
+        """Atomically merge changes into a stored record; False if the task is gone.
+        
+        Changes that don't touch BLOB_FIELDS only rewrite the small state and
+        risk table columns.
+        """
+        with self.lock:
+            record = self._load(task_id)
+            if record is None:
+                return False
+            record = {**record, **changes}
+            if any(key in self.BLOB_FIELDS for key in changes):
+                self._write(task_id, record)
+                return True
+            state, risk_table = self._columns(record)
+            self.conn.execute(
+                "UPDATE tasks SET updated = ?, state = ?, risk_table = ? WHERE task_id = ?",
+                (time.time(), state, risk_table, task_id)
+            )
+            self.conn.commit()
+            self._cache(task_id, record)
+        return True
+    
+    def risk_tables(self) -> List[Tuple[str, Dict]]:
+        """Risk tables of every stored task, without decompressing page text"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT task_id, risk_table FROM tasks WHERE risk_table IS NOT NULL ORDER BY updated"
+            ).fetchall()
+        return [(task_id, pickle.loads(blob)) for task_id, blob in rows]
+    
+    def expire(self, ttl_seconds: float, keep: Tuple[str, ...] = ()) -> List[str]:
+        """Delete records not written for ttl_seconds, except those in keep; returns their ids"""
+        cutoff = time.time() - ttl_seconds
+        with self.lock:
+            expired = [
+                task_id for (task_id,) in self.conn.execute("SELECT task_id FROM tasks WHERE updated < ?", (cutoff,))
+                if task_id not in keep
+            ]
+            self.conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id in expired])
+            self.conn.commit()
+            for task_id in expired:
+                self.cache.pop(task_id, None)
+        return expired
+    
+    def delete(self, task_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            self.conn.commit()
+            self.cache.pop(task_id, None)
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            count, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM tasks"
+            ).fetchone()
+            return {"stored": count, "cached": len(self.cache), "compressed_bytes": size}
+
+class ProgressStore(dict):
+    """Progress entries that expire a fixed time after they were created"""
+    
+    def __init__(self):
+        super().__init__()
+        self.created: Dict[str, float] = {}
+    
+    def __setitem__(self, task_id: str, value: Dict):
+        if task_id not in self:
+            self.created[task_id] = time.time()
+        super().__setitem__(task_id, value)
+    
+    def expire(self, ttl_seconds: float, keep: Tuple[str, ...] = ()) -> int:
+        cutoff = time.time() - ttl_seconds
+        expired = [task_id for task_id, created in self.created.items() if created < cutoff and task_id not in keep]
+        for task_id in expired:
+            self.pop(task_id, None)
+            self.created.pop(task_id, None)
+        return len(expired)
+
+# -------------------------
+# Job Queue
+# -------------------------
+class JobQueue:
+    """Persisted priority queue of ingestion jobs.
+    
+    Jobs left running by a previous process are re-queued on startup, so
+    uploads survive restarts.
+    """
+    
+    def __init__(self, path: str = Config.JOB_QUEUE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, tenant TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL, "
+            "payload BLOB, created REAL NOT NULL, started REAL, finished REAL, error TEXT, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.commit()
+        self.compressor = zstandard.ZstdCompressor(level=Config.TASK_COMPRESSION_LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.lock = threading.Lock()
+    
+    def enqueue(self, job_id: str, tenant: str, priority: int, payload: Dict):
+        blob = self.compressor.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, tenant, priority, status, payload, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, tenant, priority, blob, time.time())
+            )
+            self.conn.commit()
+    
+    def claim(self) -> Optional[Dict]:
+        """Mark the highest-priority, oldest queued job running and return it with its payload"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT job_id, tenant, payload FROM jobs WHERE status = 'queued' "
+                "ORDER BY priority DESC, created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE jobs SET status = 'running', started = ? WHERE job_id = ?", (time.time(), row[0]))
+            self.conn.commit()
+            payload = pickle.loads(self.decompressor.decompress(row[2]))
+        return {"job_id": row[0], "tenant": row[1], **payload}
+    
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        """Record a final status and drop the payload"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?, payload = NULL WHERE job_id = ?",
+                (status, error, time.time(), job_id)
+            )
+            self.conn.commit()
+    
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued job, or flag a running one; returns the resulting status.
+        
+        A flagged job is not interrupted: its worker runs to completion and
+        process_job then discards the result instead of installing it.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status = row[0]
+            if status == "queued":
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished = ?, payload = NULL WHERE job_id = ?",
+                    (time.time(), job_id)
+                )
+                status = "cancelled"
+            elif status == "running":
+                self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+                status = "cancelling"
+            self.conn.commit()
+            return status
+    
+    def cancel_requested(self, job_id: str) -> bool:
+        with self.lock:
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT job_id, tenant, priority, status, created, started, finished, error, cancel_requested "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "tenant", "priority", "status", "created", "started", "finished", "error", "cancel_requested")
+        job = dict(zip(keys, row))
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        if job["status"] == "queued":
+            job["position"] = self.position(job_id)
+        return job
+    
+    def position(self, job_id: str) -> int:
+        """1-based position among queued jobs in dispatch order"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM jobs AS other, jobs AS job WHERE job.job_id = ? AND other.status = 'queued' "
+                "AND (other.priority > job.priority OR (other.priority = job.priority AND other.created <= job.created))",
+                (job_id,)
+            ).fetchone()
+        return row[0]
+    
+    def depth(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    
+    def active(self) -> Set[str]:
+        """Ids of queued and running jobs"""
+        with self.lock:
+            rows = self.conn.execute("SELECT job_id FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return {job_id for (job_id,) in rows}
+    
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        with self.lock:
+            average = self.conn.execute(
+                "SELECT AVG(finished - started) FROM (SELECT finished, started FROM jobs "
+                "WHERE status = 'done' ORDER BY finished DESC LIMIT 20)"
+            ).fetchone()[0]
+        estimate = (average or 0) * max(1, self.depth() - Config.JOB_QUEUE_MAX + 1) / max(1, Config.MAX_WORKERS)
+        return int(min(600, max(Config.JOB_RETRY_AFTER_SECONDS, math.ceil(estimate))))
+    
+    def requeue_interrupted(self) -> List[str]:
+        """Put jobs left running by a previous process back in the queue"""
+        with self.lock:
+            job_ids = [job_id for (job_id,) in self.conn.execute("SELECT job_id FROM jobs WHERE status = 'running'")]
+            self.conn.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'")
+            self.conn.commit()
+        return job_ids
+    
+    def expire(self, ttl_seconds: float) -> int:
+        """Delete finished jobs older than ttl_seconds"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished < ?",
+                (time.time() - ttl_seconds,)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+    
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+# -------------------------
+# Storage Management
+# -------------------------
+class StorageManager:
+    """Track uploaded PDFs per tenant and enforce quotas, age limits and orphan cleanup"""
+    
+    def __init__(self, uploads_dir: str = Config.UPLOADS_DIR):
+        self.uploads_dir = uploads_dir
+        self.files: Dict[str, Dict] = {}  # task_id -> {"path", "tenant", "size", "accessed"}
+        self.lock = threading.Lock()
+    
+    def _path(self, task_id: str) -> str:
+        return os.path.join(self.uploads_dir, f"{task_id}.pdf")
+    
+    def _usage(self, tenant: Optional[str] = None) -> int:
+        return sum(entry["size"] for entry in self.files.values() if tenant is None or entry["tenant"] == tenant)
+    
+    def register(self, task_id: str, tenant: str):
+        """Start tracking a saved upload"""
+        size = os.path.getsize(self._path(task_id))
+        with self.lock:
+            self.files[task_id] = {"path": self._path(task_id), "tenant": tenant, "size": size, "accessed": time.time()}
+    
+    def touch(self, task_id: Optional[str]):
+        with self.lock:
+            if task_id in self.files:
+                self.files[task_id]["accessed"] = time.time()
+    
+    def remove(self, task_id: str, drop_task: bool = True):
+        """Delete an upload's PDF and, by default, its task record"""
+        with self.lock:
+            self.files.pop(task_id, None)
+        try:
+            os.remove(self._path(task_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove upload {task_id}: {e}")
+        shutil.rmtree(os.path.join(Config.BATCH_INDEX_DIR, task_id), ignore_errors=True)
+        if drop_task:
+            app_state.task_store.delete(task_id)
+            app_state.version_store.remove_tasks([task_id])
+            app_state.progress_data.pop(task_id, None)
+    
+    @staticmethod
+    def protected_tasks() -> Set[str]:
+        """Uploads that must be kept: the current index's and those still being ingested"""
+        protected = app_state.job_queue.active()
+        protected.update(
+            task_id for task_id, entry in list(app_state.progress_data.items())
+            if entry.get("status") in ("queued", "processing")
+        )
+        if app_state.current_task_id:
+            protected.add(app_state.current_task_id)
+        return protected
+    
+    def _evict_lru(self, needed: int, quota: int, tenant: Optional[str] = None) -> bool:
+        """Evict least recently used uploads until needed more bytes fit under quota"""
+        protected = self.protected_tasks()
+        while True:
+            with self.lock:
+                if self._usage(tenant) + needed <= quota:
+                    return True
+                candidates = [
+                    (entry["accessed"], task_id) for task_id, entry in self.files.items()
+                    if task_id not in protected and (tenant is None or entry["tenant"] == tenant)
+                ]
+            if not candidates:
+                return False
+            _, task_id = min(candidates)
+            logger.info(f"Evicting upload {task_id} to stay within storage quota")
+            self.remove(task_id)
+    
+    def make_room(self, tenant: str, size: int):
+        """Evict old uploads so a new one of size bytes fits, or raise 507"""
+        if size > Config.TENANT_STORAGE_QUOTA_BYTES:
+            raise HTTPException(status_code=507, detail="File exceeds the tenant storage quota")
+        if not self._evict_lru(size, Config.TENANT_STORAGE_QUOTA_BYTES, tenant):
+            raise HTTPException(status_code=507, detail="Tenant storage quota exceeded")
+        if not self._evict_lru(size, Config.TOTAL_STORAGE_QUOTA_BYTES):
+            raise HTTPException(status_code=507, detail="Server storage quota exceeded")
+    
+    def scan(self) -> int:
+        """Register PDFs on disk and delete orphans with no task record"""
+        orphans = 0
+        now = time.time()
+        for entry in os.scandir(self.uploads_dir):
+            if not entry.is_file() or not entry.name.endswith(".pdf"):
+                continue
+            task_id = entry.name[:-len(".pdf")]
+            stat = entry.stat()
+            with self.lock:
+                tracked = task_id in self.files
+            if tracked:
+                continue
+            task = app_state.task_store.get(task_id)
+            if task is None:
+                if now - stat.st_mtime >= Config.ORPHAN_GRACE_SECONDS:
+                    self.remove(task_id, drop_task=False)
+                    orphans += 1
+                continue
+            with self.lock:
+                self.files[task_id] = {
+                    "path": entry.path,
+                    "tenant": task.get("tenant", Config.DEFAULT_TENANT),
+                    "size": stat.st_size,
+                    "accessed": stat.st_mtime
+                }
+        return orphans
+    
+    def sweep(self) -> Dict[str, int]:
+        """Remove orphans and uploads past UPLOAD_MAX_AGE_SECONDS, then enforce the global quota"""
+        orphans = self.scan()
+        cutoff = time.time() - Config.UPLOAD_MAX_AGE_SECONDS
+        protected = self.protected_tasks()
+        with self.lock:
+            stale = [
+                task_id for task_id, entry in self.files.items()
+                if entry["accessed"] < cutoff and task_id not in protected
+            ]
+            missing = [task_id for task_id, entry in self.files.items() if not os.path.exists(entry["path"])]
+            for task_id in missing:
+                self.files.pop(task_id, None)
+        for task_id in stale:
+            self.remove(task_id)
+        self._evict_lru(0, Config.TOTAL_STORAGE_QUOTA_BYTES)
+        return {"orphans": orphans, "expired": len(stale)}
+    
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    
+    def usage(self) -> Dict:
+        with self.lock:
+            tenants = defaultdict(int)
+            for entry in self.files.values():
+                tenants[entry["tenant"]] += entry["size"]
+            return {
+                "uploads": len(self.files),
+                "upload_bytes": sum(tenants.values()),
+                "tenant_bytes": dict(tenants),
+                "index_bytes": self._dir_size(Config.FAISS_INDEX_DIR) + self._dir_size(Config.BATCH_INDEX_DIR),
+                "tenant_quota_bytes": Config.TENANT_STORAGE_QUOTA_BYTES,
+                "total_quota_bytes": Config.TOTAL_STORAGE_QUOTA_BYTES
+            }
+
+# -------------------------
+# Streaming Uploads
+# -------------------------
+class MultipartUpload:
+    """Incremental multipart/form-data parser that hands file parts back in chunks"""
+    
+    def __init__(self, boundary: bytes, file_field: str = "pdf"):
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filenames: List[str] = []
+        self.field_bytes = 0
+        self._file_chunks: List[Tuple[int, bytes]] = []
+        self._headers: Dict[str, str] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value = bytearray()
+        self.parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end
+        })
+    
+    def _on_part_begin(self):
+        self._headers = {}
+        self._value = bytearray()
+    
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+    
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def _on_header_end(self):
+        self._headers[self._header_field.decode("latin-1").lower()] = self._header_value.decode("latin-1")
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+    
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get("content-disposition", ""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self._is_file = self._name == self.file_field and filename is not None
+        if self._is_file:
+            self.filenames.append(filename.decode("utf-8", "replace"))
+    
+    @property
+    def filename(self) -> Optional[str]:
+        return self.filenames[0] if self.filenames else None
+    
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            self._file_chunks.append((len(self.filenames) - 1, data[start:end]))
+        else:
+            self.field_bytes += end - start
+            self._value += data[start:end]
+    
+    def _on_part_end(self):
+        if not self._is_file and self._name:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+        self._is_file = False
+    
+    def feed(self, chunk: bytes) -> List[Tuple[int, bytes]]:
+        """Parse one network chunk and return (file index, bytes) for the file data it contained"""
+        self.parser.write(chunk)
+        file_chunks, self._file_chunks = self._file_chunks, []
+        return file_chunks
+    
+    def finalize(self):
+        self.parser.finalize()
+
+async def receive_pdf_uploads(
+    request: Request,
+    path_for: Callable[[int], str],
+    max_files: int = 1
+) -> MultipartUpload:
+    """Stream every "pdf" part of a multipart request to disk.
+    
+    path_for(index) names the file for the index-th part. The body is parsed
+    as it arrives and written in UPLOAD_WRITE_CHUNK_BYTES batches off the
+    event loop. Raises 413 as soon as a file passes MAX_FILE_SIZE_BYTES and
+    400 as soon as one is not named .pdf, does not start with %PDF or is
+    past max_files, or the body is not valid multipart; the caller removes
+    the partial files.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    
+    upload = MultipartUpload(boundary)
+    current = -1
+    out_file = None
+    size = 0
+    magic = b""
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            for index, data in upload.feed(chunk):
+                if index != current:
+                    # A new file part started: finish the previous one
+                    if out_file is not None:
+                        await asyncio.to_thread(out_file.write, bytes(pending))
+                        pending.clear()
+                        await asyncio.to_thread(out_file.close)
+                        out_file = None
+                    if index != current + 1 or (current >= 0 and magic != b"%PDF"):
+                        raise HTTPException(status_code=400, detail="File is not a PDF")
+                    if index >= max_files:
+                        raise HTTPException(status_code=400, detail=f"At most {max_files} files are allowed per upload")
+                    if not upload.filenames[index].lower().endswith(".pdf"):
+                        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+                    out_file = await asyncio.to_thread(open, path_for(index), "wb")
+                    current = index
+                    size = 0
+                    magic = b""
+                if len(magic) < 4:
+                    magic += data[:4 - len(magic)]
+                    if not b"%PDF".startswith(magic):
+                        raise HTTPException(status_code=400, detail="File is not a PDF")
+                size += len(data)
+                if size > Config.MAX_FILE_SIZE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File size exceeds {Config.MAX_FILE_SIZE_MB}MB limit")
+                pending += data
+            if upload.field_bytes > Config.UPLOAD_FORM_OVERHEAD_BYTES:
+                raise HTTPException(status_code=413, detail="Form fields are too large")
+            if len(pending) >= Config.UPLOAD_WRITE_CHUNK_BYTES:
+                await asyncio.to_thread(out_file.write, bytes(pending))
+                pending.clear()
+        upload.finalize()
+        if pending:
+            await asyncio.to_thread(out_file.write, bytes(pending))
+    except MultipartParseError as e:
+        logger.warning(f"Rejected malformed multipart upload: {e}")
+        raise HTTPException(status_code=400, detail="Malformed multipart/form-data body")
+    finally:
+        if out_file is not None:
+            await asyncio.to_thread(out_file.close)
+    
+    if current != len(upload.filenames) - 1 or (current >= 0 and magic != b"%PDF"):
+        raise HTTPException(status_code=400, detail="File is not a PDF")
+    return upload
+
+async def receive_pdf_upload(request: Request, upload_path: str) -> MultipartUpload:
+    """Stream the single "pdf" part of a multipart request to upload_path"""
+    upload = await receive_pdf_uploads(request, lambda index: upload_path)
+    if upload.filename is None:
+        raise HTTPException(status_code=400, detail="No PDF file in upload")
+    return upload
+
+def import_batch_path(source: str, path_for: Callable[[int], str]) -> Tuple[List[str], List[Dict]]:
+    """Copy the PDFs in a directory or zip under BATCH_IMPORT_ROOT into uploads.
+    
+    Returns the imported names, in path_for index order, and the files that
+    were skipped with the reason.
+    """
+    if not Config.BATCH_IMPORT_ROOT:
+        raise HTTPException(status_code=400, detail="Path imports are disabled on this server")
+    root = os.path.realpath(Config.BATCH_IMPORT_ROOT)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root or not os.path.exists(path):
+        raise HTTPException(status_code=400, detail="Path not found under the import root")
+    
+    imported: List[str] = []
+    skipped: List[Dict] = []
+    
+    def add(name: str, size: int, open_source):
+        if size > Config.MAX_FILE_SIZE_BYTES:
+            skipped.append({"filename": name, "reason": f"File size exceeds {Config.MAX_FILE_SIZE_MB}MB limit"})
+            return
+        if len(imported) >= Config.BATCH_MAX_FILES:
+            skipped.append({"filename": name, "reason": f"Batch is limited to {Config.BATCH_MAX_FILES} files"})
+            return
+        with open_source() as src:
+            if src.read(4) != b"%PDF":
+                skipped.append({"filename": name, "reason": "File is not a PDF"})
+                return
+            with open(path_for(len(imported)), "wb") as dst:
+                dst.write(b"%PDF")
+                shutil.copyfileobj(src, dst, Config.UPLOAD_WRITE_CHUNK_BYTES)
+        imported.append(name)
+    
+    if os.path.isdir(path):
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(".pdf"):
+                    file_path = os.path.join(directory, filename)
+                    add(os.path.relpath(file_path, path), os.path.getsize(file_path), lambda: open(file_path, "rb"))
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".pdf"):
+                    add(info.filename, info.file_size, lambda: archive.open(info))
+    else:
+        raise HTTPException(status_code=400, detail="Path must be a directory or a zip archive")
+    return imported, skipped
+
+# -------------------------
+# Cost-Aware Admission Control
+# -------------------------
+class AdmissionController:
+    """Reserve expected token cost against tenant and global daily budgets"""
+    
+    def __init__(self, usage_tracker: APIUsageTracker):
+        self.usage_tracker = usage_tracker
+        self.reservations: Dict[str, Dict] = {}
+        self.lock = asyncio.Lock()
+    
+    def get_reserved_tokens(self, tenant: Optional[str] = None) -> int:
+        """Get tokens currently reserved by in-flight requests"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        now = time.time()
+        return sum(
+            reservation["tokens"]
+            for reservation in list(self.reservations.values())
+            if reservation["day"] == today and reservation["expires"] > now
+            and (tenant is None or reservation["tenant"] == tenant)
+        )
+    
+    def expire(self) -> int:
+        """Drop reservations whose request never released them"""
+        now = time.time()
+        expired = [key for key, reservation in self.reservations.items() if reservation["expires"] <= now]
+        for reservation_id in expired:
+            reservation = self.reservations.pop(reservation_id)
+            logger.warning(f"Expired unreleased reservation of {reservation['tokens']} tokens for tenant {reservation['tenant']}")
+        return len(expired)
+    
+    def get_remaining_budget(self, tenant: str) -> int:
+        """Get tokens still available to a tenant today"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        tenant_remaining = (
+            Config.TENANT_DAILY_TOKENS
+            - self.usage_tracker.get_tenant_daily_usage(tenant)
+            - self.get_reserved_tokens(tenant)
+        )
+        global_remaining = (
+            Config.MAX_DAILY_TOKENS
+            - self.usage_tracker.daily_usage[today]
+            - self.get_reserved_tokens()
+        )
+        return max(0, min(tenant_remaining, global_remaining))
+    
+    async def admit(self, tenant: str, plans: List[Dict]) -> Dict:
+        """Reserve the first generation plan whose expected cost fits the budget.
+        
+        Plans are ordered from preferred to cheapest; if none fits, the
+        request is rejected before any provider call is made.
+        """
+        async with self.lock:
+            self.expire()
+            remaining = self.get_remaining_budget(tenant)
+            for plan in plans:
+                if plan["expected_tokens"] <= remaining:
+                    reservation_id = str(uuid.uuid4())
+                    self.reservations[reservation_id] = {
+                        "tenant": tenant,
+                        "day": datetime.now().strftime("%Y-%m-%d"),
+                        "tokens": plan["expected_tokens"],
+                        "expires": time.time() + Config.TOKEN_RESERVATION_TTL_SECONDS
+                    }
+                    if plan["decision"] != "admit":
+                        logger.info(f"Downgraded request for tenant {tenant}: {remaining} tokens remaining")
+                    return {**plan, "reservation_id": reservation_id}
+        
+        cheapest = min(plan["expected_tokens"] for plan in plans)
+        app_state.metrics.rejected("token_budget")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Daily token budget exhausted: request needs ~{cheapest} tokens but only {remaining} remain. Try again tomorrow."
+        )
+    
+    def release(self, reservation_id: str, actual_tokens: Optional[int] = None):
+        """Drop a reservation once actual usage has been tracked"""
+        reservation = self.reservations.pop(reservation_id, None)
+        if reservation and actual_tokens is not None:
+            logger.info(
+                f"Reconciled reservation for tenant {reservation['tenant']}: "
+                f"reserved {reservation['tokens']}, used {actual_tokens}"
+            )
+
+# -------------------------
+# Request Tracing
+# -------------------------
+class RequestTrace:
+    """Stage spans, cache outcomes and token counts collected for one request"""
+    
+    def __init__(self, request_id: str, path: str):
+        self.request_id = request_id
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []  # (stage, start offset, duration) in seconds
+        self.cache: Dict[str, int] = defaultdict(int)
+        self.tokens: Dict[str, int] = {}
+    
+    def span(self, stage: str, seconds: float):
+        self.spans.append((stage, time.perf_counter() - self.started - seconds, seconds))
+    
+    def add_tokens(self, token_usage: Dict):
+        for key in ("input_tokens", "output_tokens", "total_tokens"):
+            self.tokens[key] = self.tokens.get(key, 0) + (token_usage.get(key) or 0)
+    
+    def server_timing(self) -> str:
+        """Server-Timing header value: summed duration per stage plus the total, in ms"""
+        durations: Dict[str, float] = defaultdict(float)
+        for stage, _, seconds in self.spans:
+            durations[stage] += seconds
+        durations["total"] = time.perf_counter() - self.started
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items())
+    
+    def record(self, status: int) -> Dict:
+        return {
+            "request_id": self.request_id,
+            "timestamp": datetime.now().isoformat(),
+            "path": self.path,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": [
+                {"stage": stage, "start_ms": round(start * 1000, 1), "duration_ms": round(seconds * 1000, 1)}
+                for stage, start, seconds in self.spans
+            ],
+            "cache": dict(self.cache),
+            "tokens": self.tokens
+        }
+
+REQUEST_TRACE: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+trace_logger = logging.getLogger("lawgic.trace")
+if Config.TRACE_LOG_PATH:
+    _trace_handler = logging.FileHandler(Config.TRACE_LOG_PATH)
+    _trace_handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_trace_handler)
+    trace_logger.propagate = False
+
+class ServerTimingMiddleware:
+    """Trace requests to TRACED_PATHS and report their stages in a Server-Timing header.
+    
+    Stages are recorded by PipelineMetrics while the trace is the current
+    one. The trace is also written as a JSON line when TRACE_LOG_PATH is set.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in Config.TRACED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        trace = RequestTrace(request_id, scope["path"])
+        token = REQUEST_TRACE.set(trace)
+        
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", trace.server_timing().encode("latin-1")),
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+                if Config.TRACE_LOG_PATH:
+                    trace_logger.info(json.dumps(trace.record(message["status"])))
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUEST_TRACE.reset(token)
+
+# -------------------------
+# Metrics
+# -------------------------
+class PipelineMetrics:
+    """Prometheus metrics for the ingestion and Q&A stages, in a registry of their own.
+    
+    Stages: parse, extract, chunk, dedup, embed, index_build, index_save,
+    index_load, retrieval and llm. Stages that run in ingestion workers are
+    timed there and observed here from the job result. Stages and cache
+    lookups are also added to the current RequestTrace, if any.
+    """
+    
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        ProcessCollector(registry=self.registry)  # process_resident_memory_bytes, CPU, open fds
+        self.stage_seconds = Histogram(
+            "lawgic_stage_seconds", "Latency of pipeline stages", ["stage"],
+            buckets=Config.METRICS_LATENCY_BUCKETS, registry=self.registry
+        )
+        self.cache_lookups = MetricCounter(
+            "lawgic_cache_lookups", "Cache lookups by cache and outcome", ["cache", "outcome"],
+            registry=self.registry
+        )
+        self.rate_limit_rejections = MetricCounter(
+            "lawgic_rate_limit_rejections", "Requests rejected by rate limits or token budgets", ["reason"],
+            registry=self.registry
+        )
+        self.job_queue_depth = Gauge("lawgic_job_queue_depth", "Ingestion jobs waiting to run", registry=self.registry)
+        self.loaded_indexes = Gauge("lawgic_loaded_indexes", "FAISS indexes held in memory", registry=self.registry)
+    
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def observe(self, stage: str, seconds: float):
+        self.stage_seconds.labels(stage).observe(seconds)
+        trace = REQUEST_TRACE.get()
+        if trace is not None:
+            trace.span(stage, seconds)
+    
+    def cache(self, cache: str, hits: int = 0, misses: int = 0):
+        trace = REQUEST_TRACE.get()
+        if hits:
+            self.cache_lookups.labels(cache, "hit").inc(hits)
+            if trace is not None:
+                trace.cache[f"{cache}_hit"] += hits
+        if misses:
+            self.cache_lookups.labels(cache, "miss").inc(misses)
+            if trace is not None:
+                trace.cache[f"{cache}_miss"] += misses
+    
+    def rejected(self, reason: str):
+        self.rate_limit_rejections.labels(reason).inc()
     
-    def get_usage_stats(self) -> Dict:
-        """Get current usage statistics"""
-        today = datetime.now().strftime("%Y-%m-%d")
-        month = datetime.now().strftime("%Y-%m")
-        
-        return {
-            "daily_tokens": self.daily_usage[today],
-            "monthly_tokens": self.monthly_usage[month],
-            "total_tokens": self.total_tokens,
-            "last_update": datetime.now().isoformat()
-        }
+    def render(self) -> bytes:
+        return generate_latest(self.registry)
 
 # -------------------------
-# Enhanced Configuration
+# Profiling
 # -------------------------
-class Config:
-    MAX_FILE_SIZE_MB = 50
-    MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
-    CHUNK_SIZE = 1000  # Increased for fewer chunks
-    CHUNK_OVERLAP = 150
-    MAX_CHUNKS_FOR_PROCESSING = 100  # Reduced to limit API calls
-    SIMILARITY_SEARCH_K = 5  # Reduced from 8
-    SIMILARITY_THRESHOLD = 1.2  # More restrictive
-    MAX_WORKERS = 2  # Reduced workers
-    EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-    LLM_MODEL = "gemini-2.5-flash"  # Use Flash model for cost efficiency
-    LLM_TEMPERATURE = 0.2  # Lower temperature for consistency
-    LLM_MAX_TOKENS = 1000  # Reduced token limit
-    PROGRESS_UPDATE_INTERVAL = 20
-    FAISS_INDEX_DIR = "faiss_index"
-    UPLOADS_DIR = "uploads"
-    STATIC_DIR = "static"
+class ProfileSession:
+    """One on-demand profiling run over live requests.
     
-    # Rate limiting settings
-    MAX_REQUESTS_PER_MINUTE = 15  # Conservative limit
-    MAX_DAILY_TOKENS = 50000  # Daily token limit
-    COOLDOWN_PERIOD = 5  # Seconds between requests
+    "deterministic" runs cProfile on the event loop thread; "sampling"
+    records every thread's stack each interval from a background thread and
+    returns collapsed stacks for flamegraphs. Optionally diffs tracemalloc
+    snapshots taken at the start and end.
+    """
     
-    # Caching settings
-    ENABLE_RESPONSE_CACHE = True
-    CACHE_TTL_SECONDS = 3600  # 1 hour cache
+    def __init__(self, mode: str, max_requests: Optional[int], interval: float, trace_memory: bool):
+        self.mode = mode
+        self.max_requests = max_requests
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.requests = 0
+        self.done = asyncio.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.profile: Optional[cProfile.Profile] = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self._structures: Dict[str, int] = {}
+    
+    def request_finished(self):
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self.done.set()
+    
+    def _sample(self):
+        sampler_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+    
+    def start(self):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(Config.PROFILE_TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+            self._structures = memory_structures()
+        if self.mode == "deterministic":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+            self._sampler.start()
+    
+    def stop(self) -> Dict:
+        if self.profile is not None:
+            self.profile.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        
+        result: Dict = {"mode": self.mode, "requests_profiled": self.requests}
+        growth = None
+        if self._snapshot is not None:
+            growth = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        if growth is not None:
+            structures = memory_structures()
+            result["memory"] = {
+                "top_growth": [
+                    {
+                        "location": str(stat.traceback[0]),
+                        "size_diff_bytes": stat.size_diff,
+                        "size_bytes": stat.size,
+                        "count_diff": stat.count_diff
+                    }
+                    for stat in growth[:Config.PROFILE_TOP_ENTRIES]
+                ],
+                "structures": {
+                    name: {"before": self._structures.get(name, 0), "after": size}
+                    for name, size in structures.items()
+                }
+            }
+        return result
+    
+    def pstats_text(self, sort: str = "cumulative") -> str:
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(sort).print_stats(Config.PROFILE_TOP_ENTRIES)
+        return out.getvalue()
+    
+    def pstats_dump(self) -> bytes:
+        """Marshalled stats, loadable with pstats.Stats or snakeviz once saved to a file"""
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+    
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+def memory_structures() -> Dict[str, int]:
+    """Entry counts of the in-memory stores that tend to grow"""
+    return {
+        "task_store_cached": len(app_state.task_store.cache),
+        "response_cache_entries": len(app_state.response_cache.cache),
+        "loaded_indexes": len(app_state.index_registry.indexes),
+        "sentence_vectors": len(app_state.sentence_locator.vectors),
+        "progress_entries": len(app_state.progress_data),
+        "llm_models": len(app_state.llms)
+    }
+
+class ProfilerMiddleware:
+    """Count finished requests for the active ProfileSession; a single check when none is running"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        session = app_state.profiler
+        if session is None or scope["type"] != "http" or scope["path"].startswith("/admin/"):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.request_finished()
 
 # -------------------------
-# Response Cache
+# LLM Providers
 # -------------------------
-class ResponseCache:
-    """Simple in-memory response cache"""
+FAKE_LLM_WORDS = (
+    "the insured shall notify the insurer within thirty days of any claim under this policy "
+    "coverage excludes losses arising from wilful misconduct and the aggregate liability "
+    "is limited to the sum insured as stated in the schedule [Page 1]"
+).split()
+
+def _schema_example(schema: Dict, text: str) -> Any:
+    """Smallest value that satisfies a JSON schema, for fake structured responses"""
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _schema_example(prop, text) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_schema_example(schema.get("items", {}), text)]
+    if kind in ("number", "integer"):
+        low = schema.get("minimum", 0)
+        high = schema.get("maximum", low + 1)
+        value = (low + high) / 2
+        return int(value) if kind == "integer" else value
+    if kind == "boolean":
+        return False
+    return text
+
+async def _stream_text(
+    text: str,
+    usage: Optional[Dict],
+    latency: float,
+    chunk_tokens: int = Config.FAKE_LLM_STREAM_CHUNK_TOKENS
+) -> AsyncIterator[ChatGenerationChunk]:
+    """Yield text in word groups spread over latency; the last chunk carries usage"""
+    words = re.findall(r"\S+\s*", text) or [""]
+    pieces = ["".join(words[index:index + chunk_tokens]) for index in range(0, len(words), chunk_tokens)]
+    first_delay = latency * Config.FAKE_LLM_FIRST_TOKEN_FRACTION
+    step = (latency - first_delay) / max(len(pieces) - 1, 1)
+    for index, piece in enumerate(pieces):
+        await asyncio.sleep(first_delay if index == 0 else step)
+        last = index == len(pieces) - 1
+        yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage if last else None))
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model with a configurable latency distribution and output size.
     
-    def __init__(self, ttl_seconds: int = 3600):
-        self.cache = {}
-        self.ttl = ttl_seconds
+    Answers are filler text of output_tokens words. Calls bound with a JSON
+    response_schema (compliance reports) get a minimal schema-valid object
+    instead. Input tokens are counted with the app's token counter.
+    """
     
-    def _generate_key(self, question: str, doc_hash: str = "") -> str:
-        """Generate cache key"""
-        import hashlib
-        combined = f"{question.strip().lower()}_{doc_hash}"
-        return hashlib.md5(combined.encode()).hexdigest()
+    model_name: str = "fake"
+    max_output_tokens: int = Config.LLM_MAX_TOKENS
+    latency_distribution: str = Config.FAKE_LLM_LATENCY_DISTRIBUTION
+    latency_seconds: float = Config.FAKE_LLM_LATENCY_SECONDS
+    latency_jitter: float = Config.FAKE_LLM_LATENCY_JITTER
+    output_tokens: int = Config.FAKE_LLM_OUTPUT_TOKENS
+    rng: Any = None
     
-    def get(self, question: str, doc_hash: str = "") -> Optional[Dict]:
-        """Get cached response"""
-        key = self._generate_key(question, doc_hash)
-        if key in self.cache:
-            entry = self.cache[key]
-            if time.time() - entry['timestamp'] < self.ttl:
-                logger.info(f"Cache hit for question: {question[:50]}...")
-                return entry['response']
-            else:
-                del self.cache[key]
-        return None
+    @property
+    def _llm_type(self) -> str:
+        return "lawgic-fake"
     
-    def set(self, question: str, response: Dict, doc_hash: str = ""):
-        """Cache response"""
-        key = self._generate_key(question, doc_hash)
-        self.cache[key] = {
-            'response': response,
-            'timestamp': time.time()
+    def _random(self) -> random.Random:
+        if self.rng is None:
+            self.rng = random.Random(Config.FAKE_LLM_SEED)
+        return self.rng
+    
+    def sample_latency(self) -> float:
+        rng = self._random()
+        if self.latency_distribution == "fixed":
+            return self.latency_seconds
+        if self.latency_distribution == "uniform":
+            return max(0.0, self.latency_seconds * (1 + rng.uniform(-self.latency_jitter, self.latency_jitter)))
+        if self.latency_distribution == "exponential":
+            return rng.expovariate(1 / self.latency_seconds) if self.latency_seconds > 0 else 0.0
+        return self.latency_seconds * math.exp(rng.gauss(0, self.latency_jitter))
+    
+    def _respond(self, messages: List[BaseMessage], kwargs: Dict) -> Tuple[str, Dict]:
+        tokens = min(self.output_tokens, self.max_output_tokens)
+        rng = self._random()
+        text = " ".join(rng.choice(FAKE_LLM_WORDS) for _ in range(tokens))
+        if kwargs.get("response_mime_type") == "application/json" and kwargs.get("response_schema"):
+            text = json.dumps(_schema_example(kwargs["response_schema"], text))
+        prompt = "\n".join(str(message.content) for message in messages)
+        input_tokens = app_state.token_counter.count(prompt)
+        output_tokens = app_state.token_counter.count(text)
+        return text, {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, usage = self._respond(messages, kwargs)
+        time.sleep(self.sample_latency())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+    
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text, usage = self._respond(messages, kwargs)
+        await asyncio.sleep(self.sample_latency())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+    
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        text, usage = self._respond(messages, kwargs)
+        async for chunk in _stream_text(text, usage, self.sample_latency()):
+            yield chunk
+
+class LLMRecordingStore:
+    """Captured LLM responses on disk, one JSON file per prompt hash"""
+    
+    def __init__(self, directory: str = Config.LLM_RECORDINGS_DIR):
+        self.directory = directory
+        self.cache: Dict[str, Dict] = {}
+    
+    @staticmethod
+    def key(model_name: str, max_output_tokens: int, messages: List[BaseMessage], kwargs: Dict) -> str:
+        payload = json.dumps(
+            [model_name, max_output_tokens, [(message.type, message.content) for message in messages], kwargs],
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        if key not in self.cache:
+            try:
+                with open(os.path.join(self.directory, f"{key}.json")) as f:
+                    self.cache[key] = json.load(f)
+            except FileNotFoundError:
+                return None
+        return self.cache[key]
+    
+    def put(self, key: str, record: Dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(record, f)
+        os.replace(f"{path}.tmp", path)
+        self.cache[key] = record
+
+class RecordReplayChatModel(BaseChatModel):
+    """Record responses from a real model to disk, or replay them offline.
+    
+    Prompts are matched on model, output limit, messages and bound call
+    options. A replay miss raises LookupError unless a fallback model is set.
+    """
+    
+    mode: Literal["record", "replay"]
+    store: Any
+    model_name: str
+    max_output_tokens: int
+    inner: Optional[BaseChatModel] = None
+    fallback: Optional[BaseChatModel] = None
+    replay_latency: bool = Config.LLM_REPLAY_LATENCY
+    
+    @property
+    def _llm_type(self) -> str:
+        return f"lawgic-{self.mode}"
+    
+    def _key(self, messages: List[BaseMessage], kwargs: Dict) -> str:
+        return self.store.key(self.model_name, self.max_output_tokens, messages, kwargs)
+    
+    def _save(self, key: str, messages: List[BaseMessage], text: str, usage: Optional[Dict], latency: float):
+        self.store.put(key, {
+            "model": self.model_name,
+            "prompt": "\n".join(str(message.content) for message in messages),
+            "text": text,
+            "usage": usage,
+            "latency": latency,
+            "recorded": datetime.now().isoformat()
+        })
+    
+    def _replay(self, key: str) -> Optional[Dict]:
+        record = self.store.get(key)
+        if record is None and self.fallback is None:
+            raise LookupError(f"No recorded LLM response for prompt {key[:12]}")
+        return record
+    
+    @staticmethod
+    def _result(record: Dict) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=record["text"], usage_metadata=record["usage"]))])
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._key(messages, kwargs)
+        if self.mode == "record":
+            start = time.perf_counter()
+            message = self.inner.invoke(messages, stop=stop, **kwargs)
+            self._save(key, messages, message.content, message.usage_metadata, time.perf_counter() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        record = self._replay(key)
+        if record is None:
+            return self.fallback._generate(messages, stop=stop, **kwargs)
+        if self.replay_latency:
+            time.sleep(record["latency"])
+        return self._result(record)
+    
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._key(messages, kwargs)
+        if self.mode == "record":
+            start = time.perf_counter()
+            message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+            self._save(key, messages, message.content, message.usage_metadata, time.perf_counter() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        record = self._replay(key)
+        if record is None:
+            return await self.fallback._agenerate(messages, stop=stop, **kwargs)
+        if self.replay_latency:
+            await asyncio.sleep(record["latency"])
+        return self._result(record)
+    
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages, kwargs)
+        if self.mode == "record":
+            start = time.perf_counter()
+            text = ""
+            usage = None
+            async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+                text += chunk.content if isinstance(chunk.content, str) else ""
+                usage = chunk.usage_metadata or usage
+                yield ChatGenerationChunk(message=chunk)
+            self._save(key, messages, text, usage, time.perf_counter() - start)
+            return
+        record = self._replay(key)
+        if record is None:
+            async for chunk in self.fallback._astream(messages, stop=stop, **kwargs):
+                yield chunk
+            return
+        async for chunk in _stream_text(record["text"], record["usage"], record["latency"] if self.replay_latency else 0.0):
+            yield chunk
+
+class LLMProvider(ABC):
+    """Creates the chat models that every LLM call goes through"""
+    
+    name = "base"
+    
+    @abstractmethod
+    def chat_model(self, model_name: str, max_output_tokens: int) -> BaseChatModel:
+        """Chat model for model_name capped at max_output_tokens"""
+
+class GoogleLLMProvider(LLMProvider):
+    name = "google"
+    
+    def chat_model(self, model_name: str, max_output_tokens: int) -> BaseChatModel:
+        if not GOOGLE_API_KEY:
+            raise HTTPException(
+                status_code=503,
+                detail="GOOGLE_API_KEY is not configured; set it or run with LLM_PROVIDER=fake"
+            )
+        return ChatGoogleGenerativeAI(
+            model=model_name,
+            temperature=Config.LLM_TEMPERATURE,
+            max_output_tokens=max_output_tokens,
+            google_api_key=GOOGLE_API_KEY,
+            top_p=0.8,
+            top_k=20
+        )
+
+class FakeLLMProvider(LLMProvider):
+    """Offline stand-in; keyword arguments override the FAKE_LLM_* settings"""
+    
+    name = "fake"
+    
+    def __init__(self, **overrides):
+        self.overrides = overrides
+    
+    def chat_model(self, model_name: str, max_output_tokens: int) -> BaseChatModel:
+        settings = {
+            "latency_distribution": Config.FAKE_LLM_LATENCY_DISTRIBUTION,
+            "latency_seconds": Config.FAKE_LLM_LATENCY_SECONDS,
+            "latency_jitter": Config.FAKE_LLM_LATENCY_JITTER,
+            "output_tokens": Config.FAKE_LLM_OUTPUT_TOKENS
         }
-        logger.info(f"Cached response for: {question[:50]}...")
+        settings.update(self.overrides)
+        return FakeChatModel(model_name=model_name, max_output_tokens=max_output_tokens, **settings)
+
+class RecordReplayLLMProvider(LLMProvider):
+    def __init__(self, mode: str, store: Optional[LLMRecordingStore] = None, inner: Optional[LLMProvider] = None):
+        self.name = mode
+        self.store = store or LLMRecordingStore()
+        self.inner = inner or GoogleLLMProvider()
+    
+    def chat_model(self, model_name: str, max_output_tokens: int) -> BaseChatModel:
+        return RecordReplayChatModel(
+            mode=self.name,
+            store=self.store,
+            model_name=model_name,
+            max_output_tokens=max_output_tokens,
+            inner=self.inner.chat_model(model_name, max_output_tokens) if self.name == "record" else None,
+            fallback=FakeLLMProvider().chat_model(model_name, max_output_tokens)
+            if self.name == "replay" and Config.LLM_REPLAY_FALLBACK_TO_FAKE else None
+        )
+
+def create_llm_provider(name: str) -> LLMProvider:
+    if name == "google":
+        return GoogleLLMProvider()
+    if name == "fake":
+        return FakeLLMProvider()
+    if name in ("record", "replay"):
+        return RecordReplayLLMProvider(name)
+    raise ValueError(f"Unknown LLM_PROVIDER {name!r}; expected google, fake, record or replay")
+
+def load_embeddings_model() -> Embeddings:
+    """Embeddings model selected by Config.EMBEDDINGS_PROVIDER"""
+    if Config.EMBEDDINGS_PROVIDER == "fake":
+        return DeterministicFakeEmbedding(size=Config.FAKE_EMBEDDINGS_SIZE)
+    return HuggingFaceEmbeddings(
+        model_name=Config.EMBEDDINGS_MODEL,
+        model_kwargs={'device': 'cpu'}
+    )
 
 # -------------------------
 # Enhanced Global State Management
 # -------------------------
 class AppState:
     def __init__(self):
-        self.progress_data: Dict[str, Dict] = {}
-        self.task_store: Dict[str, Dict] = {}
-        self.embeddings_model: Optional[HuggingFaceEmbeddings] = None
-        self.executor: Optional[ThreadPoolExecutor] = None
-        self.conversational_chain = None
+        self.progress_data = ProgressStore()
+        self.storage_manager = StorageManager()
+        self.embeddings_model: Optional[Embeddings] = None
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.cleanup_task: Optional[asyncio.Task] = None
+        self.dispatcher_task: Optional[asyncio.Task] = None
+        self.background_tasks: Set[asyncio.Task] = set()  # Fire-and-forget work such as summaries
+        self.job_event: Optional[asyncio.Event] = None
+        self.profiler: Optional[ProfileSession] = None
+        self.batches = ProgressStore()  # batch_id -> {"tenant", "tasks": {task_id: filename}, "skipped"}
+        self.conversational_chains: Dict[Tuple[str, str, int], object] = {}
+        self.llm_provider = create_llm_provider(Config.LLM_PROVIDER)
+        self.llms: Dict[Tuple[str, int], BaseChatModel] = {}
+        self.current_task_id: Optional[str] = None
         
         # Rate limiting components
         self.rate_limiter = RateLimiter(
@@ -195,39 +2625,96 @@ class AppState:
             time_window=60
         )
         self.usage_tracker = APIUsageTracker()
+        self.token_counter = TokenCounter()
+        self.admission_controller = AdmissionController(self.usage_tracker)
+        self.clause_classifier = ClauseClassifier()
+        self.risk_scorer = RiskScorer()
+        self.duplicate_detector = NearDuplicateDetector()
+        self.sentence_locator = SentenceLocator()
+        self.index_registry = IndexRegistry()
         self.response_cache = ResponseCache(Config.CACHE_TTL_SECONDS)
         self.last_api_call = 0
+        
+        self.metrics = PipelineMetrics()
+        self.metrics.job_queue_depth.set_function(lambda: self.job_queue.depth())
+        self.metrics.loaded_indexes.set_function(lambda: len(self.index_registry.indexes))
+
+    # The SQLite-backed stores open on first use: spawned ingestion workers
+    # import this module but never touch them, so they don't load them
+    @cached_property
+    def task_store(self) -> TaskStore:
+        return TaskStore()
+    
+    @cached_property
+    def job_queue(self) -> JobQueue:
+        return JobQueue()
+    
+    @cached_property
+    def version_store(self) -> DocumentVersionStore:
+        return DocumentVersionStore()
 
     def initialize_embeddings(self):
         """Initialize embeddings model at startup"""
         try:
             logger.info("Initializing embeddings model...")
-            self.embeddings_model = HuggingFaceEmbeddings(
-                model_name=Config.EMBEDDINGS_MODEL,
-                model_kwargs={'device': 'cpu'}
-            )
+            self.embeddings_model = load_embeddings_model()
+            self.token_counter.attach_tokenizer(self.embeddings_model)
             logger.info("Embeddings model initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize embeddings model: {e}")
             self.embeddings_model = None
 
+    def run_in_background(self, coro, name: str) -> asyncio.Task:
+        """Start a fire-and-forget task, holding a reference until it finishes.
+        
+        The event loop only keeps weak references to tasks, so an unreferenced
+        task can be garbage collected mid-run and its exception never logged.
+        """
+        task = asyncio.create_task(coro, name=name)
+        self.background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+        return task
+
+    def _background_task_done(self, task: asyncio.Task):
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
     def initialize_executor(self):
-        """Initialize thread pool executor"""
-        self.executor = ThreadPoolExecutor(max_workers=Config.MAX_WORKERS)
+        """Initialize the ingestion worker process pool.
+        
+        Workers are spawned rather than forked: the pool starts on the first
+        submit, when this process already runs the event loop, thread pools
+        and SQLite connections, and forking it could copy held locks. Each
+        worker imports the app and loads its own embeddings model.
+        """
+        self.executor = ProcessPoolExecutor(
+            max_workers=Config.MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_ingestion_worker
+        )
 
-    async def check_rate_limits(self) -> bool:
+    async def check_rate_limits(self, tenant: Optional[str] = None) -> bool:
         """Check if request can proceed based on rate limits"""
         # Check daily token limit
         today = datetime.now().strftime("%Y-%m-%d")
         if self.usage_tracker.daily_usage[today] >= Config.MAX_DAILY_TOKENS:
+            self.metrics.rejected("daily_tokens")
             raise HTTPException(
                 status_code=429,
                 detail=f"Daily token limit ({Config.MAX_DAILY_TOKENS}) exceeded. Try again tomorrow."
             )
+        if tenant and self.usage_tracker.get_tenant_daily_usage(tenant) >= Config.TENANT_DAILY_TOKENS:
+            self.metrics.rejected("tenant_daily_tokens")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Daily token limit for tenant ({Config.TENANT_DAILY_TOKENS}) exceeded. Try again tomorrow."
+            )
         
         # Check rate limiter
         if not await self.rate_limiter.can_proceed():
             reset_time = self.rate_limiter.get_reset_time()
+            self.metrics.rejected("requests_per_minute")
             raise HTTPException(
                 status_code=429,
                 detail=f"Rate limit exceeded. Try again in {reset_time} seconds."
@@ -242,41 +2729,38 @@ class AppState:
         self.last_api_call = time.time()
         return True
 
-    def get_conversational_chain(self):
+    def get_conversational_chain(
+        self,
+        model_name: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        mode: str = "ask"
+    ):
         """Get or create conversational chain with optimized settings"""
-        if self.conversational_chain is None:
-            self.conversational_chain = self._create_conversational_chain()
-        return self.conversational_chain
-
-    def _create_conversational_chain(self):
-        """Create enhanced conversational chain with cost optimization"""
-        # Shorter, more focused prompt to reduce token usage
-        prompt_template = """
-You are Lawgic AI, a legal assistant. 
-Use the provided context to answer. 
-If the context does not contain the answer, clearly say: 
-"I could not find this in the document, but here’s a general insight."
-
-Context:
-{context}
-
-Question: {question}
+        key = (mode, model_name or Config.LLM_MODEL, max_output_tokens or Config.LLM_MAX_TOKENS)
+        if key not in self.conversational_chains:
+            self.conversational_chains[key] = self._create_conversational_chain(*key)
+        return self.conversational_chains[key]
 
-Answer diplomatically:
-"""
+    def get_llm(self, model_name: Optional[str] = None, max_output_tokens: Optional[int] = None) -> BaseChatModel:
+        """Get or create a chat model shared by chains and ingestion stages"""
+        key = (model_name or Config.LLM_MODEL, max_output_tokens or Config.LLM_MAX_TOKENS)
+        if key not in self.llms:
+            self.llms[key] = self.llm_provider.chat_model(*key)
+        return self.llms[key]
+    
+    def set_llm_provider(self, provider: LLMProvider):
+        """Switch LLM provider, dropping models and chains built by the old one"""
+        self.llm_provider = provider
+        self.llms.clear()
+        self.conversational_chains.clear()
 
+    def _create_conversational_chain(self, mode: str, model_name: str, max_output_tokens: int):
+        """Create enhanced conversational chain with cost optimization"""
         try:
-            model = ChatGoogleGenerativeAI(
-    model=Config.LLM_MODEL,
-    temperature=Config.LLM_TEMPERATURE,
-    max_output_tokens=Config.LLM_MAX_TOKENS,
-    google_api_key=GOOGLE_API_KEY,
-    top_p=0.8,
-    top_k=20
-)
+            model = self.get_llm(model_name, max_output_tokens)
 
             prompt = PromptTemplate(
-                template=prompt_template, 
+                template=PROMPT_MODES[mode]["template"], 
                 input_variables=["context", "question"]
             )
             return load_qa_chain(model, chain_type="stuff", prompt=prompt)
@@ -290,19 +2774,21 @@ app_state = AppState()
 # -------------------------
 # Core Functions (Optimized)
 # -------------------------
-def get_pdf_pages(pdf_file) -> List[Tuple[int, str]]:
-    """Extract per-page text from uploaded PDF and return list of (page_number, text)."""
+def get_pdf_pages(source, task_id: Optional[str] = None) -> List[Tuple[int, str]]:
+    """Extract per-page text from a PDF path or file object and return list of (page_number, text)."""
     pages = []
     try:
-        if hasattr(pdf_file.file, 'seek'):
-            pdf_file.file.seek(0)
+        if hasattr(source, 'seek'):
+            source.seek(0)
         
-        pdf_reader = PdfReader(pdf_file.file)
-        total_pages = len(pdf_reader.pages)
+        with app_state.metrics.time("parse"):
+            pdf_reader = PdfReader(source)
+            total_pages = len(pdf_reader.pages)
         
         # Limit pages processed to control costs
         max_pages = min(total_pages, 50)  # Process max 50 pages
         
+        extract_start = time.perf_counter()
         for idx in range(max_pages):
             try:
                 page = pdf_reader.pages[idx]
@@ -312,15 +2798,15 @@ def get_pdf_pages(pdf_file) -> List[Tuple[int, str]]:
                 
                 if idx % 10 == 0:
                     progress = 15 + (idx / max_pages) * 30
-                    current_task = getattr(pdf_file, '_task_id', None)
-                    if current_task and current_task in app_state.progress_data:
-                        app_state.progress_data[current_task].update({
+                    if task_id and task_id in app_state.progress_data:
+                        app_state.progress_data[task_id].update({
                             "progress": int(progress),
                             "message": f"Extracting text... {idx+1}/{max_pages} pages"
                         })
             except Exception as e:
                 logger.warning(f"Failed to extract text from page {idx + 1}: {e}")
                 continue
+        app_state.metrics.observe("extract", time.perf_counter() - extract_start)
         
         if total_pages > 50:
             logger.info(f"Limited processing to first 50 pages (document has {total_pages} pages)")
@@ -334,6 +2820,92 @@ def get_pdf_pages(pdf_file) -> List[Tuple[int, str]]:
     
     return pages
 
+PAGE_NUMBER_PATTERN = re.compile(r"^(page\s*)?[-\u2013(\[]?\s*\d+\s*[-\u2013)\]]?(\s*(of|/)\s*\d+)?$")
+
+def _normalize_boilerplate_line(line: str) -> str:
+    """Normalize case and spacing so repeated lines compare equal"""
+    return " ".join(line.lower().split())
+
+def _page_number_shape(line: str) -> Optional[str]:
+    """Digit-free shape of a bare page-number line ("page # of #"), or None"""
+    normalized = _normalize_boilerplate_line(line)
+    if not PAGE_NUMBER_PATTERN.match(normalized):
+        return None
+    return re.sub(r"\d+", "#", normalized)
+
+def strip_boilerplate(pages: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Remove running headers, footers, page numbers and legends repeated across pages.
+    
+    A line is dropped when its normalized form sits within the first or last
+    BOILERPLATE_EDGE_LINES non-blank lines on at least BOILERPLATE_EDGE_RATIO
+    of the pages, or appears anywhere on at least BOILERPLATE_BODY_RATIO of
+    them. Bare page numbers ("3", "- 3 -", "Page 3 of 10") are dropped from
+    the first or last non-blank line when the same shape appears there on
+    at least BOILERPLATE_EDGE_RATIO of the pages with increasing numbers.
+    Only matched lines are removed; paragraph breaks are kept, and
+    untouched pages are returned unchanged.
+    """
+    if len(pages) < Config.BOILERPLATE_MIN_PAGES:
+        return pages
+    
+    page_lines = [text.splitlines() for _, text in pages]
+    # Positions of non-blank lines; edges are counted in these
+    page_content = [[index for index, line in enumerate(lines) if line.strip()] for lines in page_lines]
+    edge_counts = Counter()
+    body_counts = Counter()
+    page_numbers: Dict[str, List[int]] = defaultdict(list)  # shape -> first number on each page
+    for lines, content in zip(page_lines, page_content):
+        normalized = [_normalize_boilerplate_line(lines[index]) for index in content]
+        # Short pages split their lines between the top and bottom edges
+        edge = min(Config.BOILERPLATE_EDGE_LINES, len(normalized) // 2)
+        edge_counts.update(set(normalized[:edge] + normalized[len(normalized) - edge:]))
+        body_counts.update(set(normalized))
+        numbered = {}
+        for index in content[:1] + content[-1:]:
+            shape = _page_number_shape(lines[index])
+            if shape:
+                numbered.setdefault(shape, int(re.search(r"\d+", lines[index]).group()))
+        for shape, number in numbered.items():
+            page_numbers[shape].append(number)
+    
+    total = len(pages)
+    edge_threshold = max(2, total * Config.BOILERPLATE_EDGE_RATIO)
+    body_threshold = max(2, total * Config.BOILERPLATE_BODY_RATIO)
+    boilerplate = {line for line, count in edge_counts.items() if count >= edge_threshold}
+    boilerplate.update(line for line, count in body_counts.items() if count >= body_threshold)
+    number_shapes = {
+        shape for shape, numbers in page_numbers.items()
+        if len(numbers) >= edge_threshold and all(a < b for a, b in zip(numbers, numbers[1:]))
+    }
+    
+    cleaned = []
+    removed = 0
+    for (page_num, text), lines, content in zip(pages, page_lines, page_content):
+        edge = min(Config.BOILERPLATE_EDGE_LINES, len(content) // 2)
+        dropped = set()
+        for position, index in enumerate(content):
+            line = lines[index]
+            if position in (0, len(content) - 1) and _page_number_shape(line) in number_shapes:
+                dropped.add(index)
+                continue
+            normalized = _normalize_boilerplate_line(line)
+            at_edge = position < edge or position >= len(content) - edge
+            if normalized in boilerplate and (at_edge or body_counts[normalized] >= body_threshold):
+                dropped.add(index)
+        
+        if dropped:
+            removed += len(dropped)
+            text = "\n".join(line for index, line in enumerate(lines) if index not in dropped).strip("\n")
+        if text.strip():
+            cleaned.append((page_num, text))
+    
+    if removed:
+        logger.info(
+            f"Stripped {removed} boilerplate lines ({len(boilerplate)} patterns, "
+            f"{len(number_shapes)} page-number shapes) from {total} pages"
+        )
+    return cleaned or pages
+
 def extract_metadata(pdf_path: str, pages: List[Tuple[int, str]]) -> Dict:
     """Extract metadata from PDF"""
     meta = {
@@ -361,112 +2933,829 @@ def extract_metadata(pdf_path: str, pages: List[Tuple[int, str]]) -> Dict:
     except OSError:
         meta["file_size"] = 0
     
-    return meta
+    return meta
+
+CHUNK_SEPARATORS = ("\n\n", "\n", ". ", " ")
+PAGE_SEPARATOR = "\n\n"
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+class DocumentBuffer:
+    """Whole-document text in one buffer with a page-offset table"""
+    
+    def __init__(self, pages: List[Tuple[int, str]]):
+        self.page_numbers = []
+        self.page_starts = []
+        parts = []
+        offset = 0
+        for page_num, text in pages:
+            if parts:
+                parts.append(PAGE_SEPARATOR)
+                offset += len(PAGE_SEPARATOR)
+            self.page_numbers.append(page_num)
+            self.page_starts.append(offset)
+            parts.append(text)
+            offset += len(text)
+        self.text = "".join(parts)
+    
+    def _page_index(self, offset: int) -> int:
+        return max(0, bisect.bisect_right(self.page_starts, offset) - 1)
+    
+    def page_at(self, offset: int) -> int:
+        """Page number containing a character offset"""
+        return self.page_numbers[self._page_index(offset)]
+    
+    def position(self, offset: int) -> Tuple[int, int]:
+        """Character offset and 1-based line number of offset within its page"""
+        page_start = self.page_starts[self._page_index(offset)]
+        return offset - page_start, self.text.count("\n", page_start, offset) + 1
+    
+    def page_breaks(self, start: int, end: int) -> List[List[int]]:
+        """[offset relative to start, page number] for each page beginning inside the span"""
+        first = bisect.bisect_right(self.page_starts, start)
+        last = bisect.bisect_left(self.page_starts, end)
+        return [
+            [self.page_starts[index] - start, self.page_numbers[index]]
+            for index in range(first, last)
+        ]
+
+def iter_chunk_spans(text: str, chunk_size: int = Config.CHUNK_SIZE, overlap: int = Config.CHUNK_OVERLAP) -> Iterator[Tuple[int, int]]:
+    """Walk text once, yielding whitespace-trimmed (start, end) chunk offsets.
+    
+    Each chunk ends at the coarsest separator found in the second half of
+    its window; the next one starts overlap characters back, on a word
+    boundary.
+    """
+    length = len(text)
+    start = 0
+    while start < length:
+        limit = min(start + chunk_size, length)
+        end = limit
+        if limit < length:
+            for separator in CHUNK_SEPARATORS:
+                cut = text.rfind(separator, start + chunk_size // 2, limit)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        
+        span_start, span_end = start, end
+        while span_start < span_end and text[span_start].isspace():
+            span_start += 1
+        while span_end > span_start and text[span_end - 1].isspace():
+            span_end -= 1
+        if span_end > span_start:
+            yield span_start, span_end
+        
+        if end >= length:
+            break
+        next_start = max(end - overlap, start + 1)
+        boundary = WHITESPACE_PATTERN.search(text, next_start, end)
+        start = boundary.end() if boundary else next_start
+
+def chunk_document(buffer: DocumentBuffer, task_id: Optional[str] = None) -> List[Dict]:
+    """Chunk the document buffer into span metadata, crossing page boundaries"""
+    metadatas = []
+    length = max(len(buffer.text), 1)
+    
+    for start, end in iter_chunk_spans(buffer.text):
+        if end - start <= 100:  # Larger minimum chunk size
+            continue
+        # Limit chunks to control API costs
+        if len(metadatas) >= Config.MAX_CHUNKS_FOR_PROCESSING:
+            logger.info(f"Limiting chunks to {Config.MAX_CHUNKS_FOR_PROCESSING} (stopped at offset {start}/{length})")
+            break
+        page_char, page_line = buffer.position(start)
+        metadata = {
+            "page": buffer.page_at(start),
+            "end_page": buffer.page_at(end - 1),
+            "start": start,
+            "end": end,
+            "page_char": page_char,
+            "page_line": page_line,
+            "chunk": len(metadatas)
+        }
+        if metadata["end_page"] != metadata["page"]:
+            metadata["page_breaks"] = buffer.page_breaks(start, end)
+        metadatas.append(metadata)
+        
+        if task_id and len(metadatas) % Config.PROGRESS_UPDATE_INTERVAL == 0:
+            if task_id in app_state.progress_data:
+                app_state.progress_data[task_id].update({
+                    "progress": int(45 + (end / length) * 20),
+                    "message": f"Creating chunks... {len(metadatas)} so far"
+                })
+    
+    if not metadatas:
+        raise Exception("No text chunks could be created from the document")
+    
+    return metadatas
+
+def get_versioned_chunks(
+    buffer: DocumentBuffer,
+    document_key: Optional[str],
+    task_id: Optional[str] = None
+) -> Tuple[List[str], List[Dict], List[Optional[List[float]]]]:
+    """Chunk a document version, reusing vectors of chunks seen in the previous version.
+    
+    Vectors are matched by chunk text, so unchanged regions that chunk the
+    same way as before are not embedded again. Returns vectors as None for
+    chunks that still need embedding, which is all of them for unversioned
+    uploads (no document_key).
+    """
+    with app_state.metrics.time("chunk"):
+        metadatas = chunk_document(buffer, task_id)
+        chunks = [buffer.text[metadata["start"]:metadata["end"]] for metadata in metadatas]
+    hashes = [DocumentVersionStore.hash_text(chunk) for chunk in chunks]
+    cached = app_state.version_store.chunk_vectors(document_key, hashes) if document_key else {}
+    vectors = [cached.get(chunk_hash) for chunk_hash in hashes]
+    reused = sum(vector is not None for vector in vectors)
+    app_state.metrics.cache("chunk_vectors", hits=reused, misses=len(vectors) - reused)
+    return chunks, metadatas, vectors
+
+def page_label(metadata: Dict) -> str:
+    """[Page N] or [Pages N-M] tag for a chunk or packed segment"""
+    page = metadata.get("page")
+    end_page = metadata.get("end_page", page)
+    if end_page is None or end_page == page:
+        return f"[Page {page}]"
+    return f"[Pages {page}-{end_page}]"
+
+def _truncate_to_budget(text: str, token_budget: int) -> str:
+    """Cut text down to roughly token_budget tokens on a word boundary"""
+    tokens = app_state.token_counter.count(text)
+    if tokens <= token_budget:
+        return text
+    cut = int(len(text) * token_budget / tokens)
+    truncated = text[:cut]
+    if " " in truncated:
+        truncated = truncated.rsplit(" ", 1)[0]
+    return truncated
+
+def pack_context(retrieved_docs: List[Tuple[Document, float]], token_budget: int) -> List[Document]:
+    """Pack retrieved chunks into a token budget for the "stuff" chain.
+    
+    Chunks are admitted in relevance order until the budget is spent, then
+    chunks whose character spans overlap are merged using their offsets so
+    each page tag and each overlapping span is sent only once.
+    """
+    ranked = sorted(retrieved_docs, key=lambda item: item[1])
+    
+    selected = []
+    seen = set()
+    remaining = token_budget
+    for rank, (doc, score) in enumerate(ranked):
+        metadata = doc.metadata or {}
+        start = metadata.get("start")
+        key = (start, metadata.get("end")) if start is not None else (metadata.get("page"), doc.page_content)
+        if key in seen:
+            continue
+        seen.add(key)
+        
+        text = doc.page_content or ""
+        end = metadata.get("end")
+        cost = app_state.token_counter.count(text)
+        if cost > remaining:
+            if selected:
+                continue
+            # Always keep the best chunk, trimmed to fit
+            text = _truncate_to_budget(text, remaining)
+            cost = remaining
+            end = start + len(text) if start is not None else None
+        selected.append({
+            "page": metadata.get("page"),
+            "end_page": metadata.get("end_page", metadata.get("page")),
+            "start": start,
+            "end": end,
+            "rank": rank,
+            "text": text
+        })
+        remaining -= cost
+        if remaining <= 0:
+            break
+    
+    # Merge chunks whose spans overlap into document-order segments
+    selected.sort(key=lambda item: (item["start"] is None, item["start"] or 0, item["rank"]))
+    segments = []
+    for item in selected:
+        last = segments[-1] if segments else None
+        if (
+            last is not None
+            and item["start"] is not None
+            and last["start"] is not None
+            and item["start"] < last["end"]
+        ):
+            if item["end"] > last["end"]:
+                last["text"] += item["text"][last["end"] - item["start"]:]
+                last["end"] = item["end"]
+                last["end_page"] = item["end_page"]
+            last["rank"] = min(last["rank"], item["rank"])
+        else:
+            segments.append(dict(item))
+    
+    segments.sort(key=lambda item: item["rank"])
+    documents = []
+    for segment in segments:
+        metadata = {"page": segment["page"], "end_page": segment["end_page"]}
+        content = f"{page_label(metadata)}\n{segment['text']}" if segment["page"] is not None else segment["text"]
+        documents.append(Document(page_content=content, metadata=metadata))
+    return documents
+
+def format_qa_prompt(docs: List[Document], question: str, mode: str = "ask") -> str:
+    """Render the prompt exactly as the "stuff" chain sends it"""
+    return PROMPT_MODES[mode]["template"].format(
+        context="\n\n".join(doc.page_content or "" for doc in docs),
+        question=question
+    )
+
+def build_generation_plans(relevant_docs: List[Tuple[Document, float]], question: str, mode: str = "ask") -> List[Dict]:
+    """Build the full and downgraded generation plans with their expected cost"""
+    plans = []
+    for decision, model_name, context_budget, max_output_tokens in (
+        ("admit", Config.LLM_MODEL, Config.CONTEXT_TOKEN_BUDGET, Config.LLM_MAX_TOKENS),
+        ("downgrade", Config.LLM_DOWNGRADE_MODEL, Config.DOWNGRADE_CONTEXT_TOKEN_BUDGET, Config.LLM_DOWNGRADE_MAX_TOKENS),
+    ):
+        docs = pack_context(relevant_docs, context_budget)
+        prompt_tokens = app_state.token_counter.count(format_qa_prompt(docs, question, mode))
+        plans.append({
+            "decision": decision,
+            "model": model_name,
+            "max_output_tokens": max_output_tokens,
+            "docs": docs,
+            "expected_tokens": prompt_tokens + max_output_tokens
+        })
+    return plans
+
+def load_vector_store() -> FAISS:
+    """Get the FAISS index for the current document from the registry.
+    
+    Loading an index reads it from disk; callers run this off the event loop.
+    """
+    embeddings = app_state.embeddings_model
+    if embeddings is None:
+        embeddings = load_embeddings_model()
+
+    vector_store = app_state.index_registry.get(Config.FAISS_INDEX_DIR, embeddings)
+    if vector_store is None:
+        raise HTTPException(
+            status_code=404, 
+            detail="No document processed. Please upload a PDF first."
+        )
+    return vector_store
+
+def search_batch(vector_store: FAISS, questions: List[str], k: int) -> Tuple[List[List[Tuple[Document, float]]], np.ndarray]:
+    """Embed questions in one pass and run a single vectorized FAISS search.
+    
+    Returns the results per question and the question vectors, which are
+    reused to locate citation sentences.
+    """
+    with app_state.metrics.time("retrieval"):
+        vectors = np.asarray(vector_store.embeddings.embed_documents(questions), dtype=np.float32)
+        scores, indices = vector_store.index.search(vectors, k)
+    
+    results = []
+    for row_scores, row_indices in zip(scores, indices):
+        docs = []
+        for score, index in zip(row_scores, row_indices):
+            if index == -1:
+                continue
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[index])
+            if isinstance(doc, Document):
+                docs.append((doc, float(score)))
+        results.append(docs)
+    return results, vectors
+
+def build_references(retrieved_docs: List[Tuple[Document, float]], query_vector: Optional[np.ndarray] = None) -> List[Dict]:
+    """Point each top result at its sentence closest to the question, with in-page offsets"""
+    top = [
+        (doc, score) for doc, score in retrieved_docs[:3]  # Limit references
+        if (doc.metadata or {}).get("page") and (doc.page_content or "").strip()
+    ]
+    if not top:
+        return []
+    
+    texts = [doc.page_content for doc, _ in top]
+    try:
+        spans = app_state.sentence_locator.locate(texts, query_vector, app_state.embeddings_model)
+    except Exception as e:
+        logger.warning(f"Sentence location failed, citing first sentences: {e}")
+        spans = app_state.sentence_locator.locate(texts, None, None)
+    
+    refs = []
+    for (doc, score), text, (start, end) in zip(top, texts, spans):
+        sentence = text[start:end]
+        limit = Config.REFERENCE_SNIPPET_CHARS
+        ref = citation_span(doc.metadata, text, start, end)
+        ref["snippet"] = sentence[:limit] + "..." if len(sentence) > limit else sentence
+        if "pages" in doc.metadata:
+            ref["pages"] = doc.metadata["pages"]
+        refs.append(ref)
+    return refs
+
+def select_relevant_docs(retrieved_docs: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """Keep results under the similarity threshold, or the top 3 if none are"""
+    relevant_docs = [(doc, score) for doc, score in retrieved_docs if score < Config.SIMILARITY_THRESHOLD]
+    
+    if not relevant_docs:
+        relevant_docs = retrieved_docs[:3]  # Limit to top 3
+    return relevant_docs
+
+async def generate_answer(
+    question: str,
+    retrieved_docs: List[Tuple[Document, float]],
+    tenant: str,
+    endpoint: str,
+    mode: str = "ask",
+    query_vector: Optional[np.ndarray] = None
+) -> Dict:
+    """Admit, generate and account for a single answer"""
+    relevant_docs = select_relevant_docs(retrieved_docs)
+
+    # Reserve the expected cost before calling the LLM
+    plan = await app_state.admission_controller.admit(
+        tenant, build_generation_plans(relevant_docs, question, mode)
+    )
+    docs = plan["docs"]
+    
+    total_tokens = None
+    try:
+        chain = app_state.get_conversational_chain(plan["model"], plan["max_output_tokens"], mode)
+        usage_callback = TokenUsageCallback()
+        with app_state.metrics.time("llm"):
+            response = await chain.ainvoke(
+                {"input_documents": docs, "question": question},
+                config={"callbacks": [usage_callback]}
+            )
+
+        # Track API usage (provider-reported when available)
+        token_usage = app_state.token_counter.measure(
+            usage_callback, format_qa_prompt(docs, question, mode), response["output_text"]
+        )
+        total_tokens = token_usage["total_tokens"]
+        trace = REQUEST_TRACE.get()
+        if trace is not None:
+            trace.add_tokens(token_usage)
+        app_state.usage_tracker.track_usage(
+            total_tokens,
+            tenant=tenant,
+            endpoint=endpoint,
+            model=plan["model"],
+            input_tokens=token_usage["input_tokens"],
+            output_tokens=token_usage["output_tokens"],
+            source=token_usage["source"]
+        )
+    finally:
+        app_state.admission_controller.release(plan["reservation_id"], total_tokens)
+
+    return {
+        "answer": response["output_text"].strip(),
+        "references": await asyncio.to_thread(build_references, retrieved_docs, query_vector),
+        "tokens_used": total_tokens,
+        "token_usage": token_usage,
+        "admission": {"decision": plan["decision"], "model": plan["model"]},
+        "cached": False
+    }
+
+def prepare_document(task_id: str, upload_path: str, tenant: str, document_id: Optional[str]) -> Dict:
+    """Parse, version and chunk a saved upload ready to be queued for indexing.
+    
+    Blocking; callers run it off the event loop.
+    """
+    pages = get_pdf_pages(upload_path, task_id)
+    metadata = extract_metadata(upload_path, pages)
+    pages = strip_boilerplate(pages)
+    
+    buffer = DocumentBuffer(pages)
+    
+    # Only uploads naming a document_id are versioned
+    document_id = (document_id or "").strip() or None
+    page_hashes = None
+    version = None
+    changed_pages = [page for page, _ in pages]
+    document_key = DocumentVersionStore.key(tenant, document_id) if document_id else None
+    if document_key:
+        page_hashes = {page: DocumentVersionStore.hash_text(text) for page, text in pages}
+        previous = app_state.version_store.latest(document_key)
+        previous_hashes = set(previous["page_hashes"].values()) if previous else set()
+        changed_pages = [page for page, page_hash in page_hashes.items() if page_hash not in previous_hashes]
+        # Registered by install_index once the index is built; until then this is the expected number
+        version = app_state.version_store.next_version(document_key)
+    
+    app_state.task_store[task_id] = {
+        "pdf_path": upload_path,
+        "tenant": tenant,
+        "pages": pages,
+        "metadata": metadata,
+        "document_id": document_id,
+        "version": version,
+        "page_hashes": page_hashes
+    }
+
+    chunks, metadatas, vectors = get_versioned_chunks(buffer, document_key, task_id)
+    duplicates = 0
+    if Config.ENABLE_NEAR_DUPLICATE_COLLAPSE:
+        with app_state.metrics.time("dedup"):
+            chunks, metadatas, vectors, duplicates = app_state.duplicate_detector.collapse(chunks, metadatas, vectors)
+    return {
+        "chunks": chunks,
+        "metadatas": metadatas,
+        "vectors": vectors,
+        "metadata": metadata,
+        "document_id": document_id,
+        "version": version,
+        "reprocessed_pages": len(changed_pages),
+        "duplicates_collapsed": duplicates
+    }
+
+def init_ingestion_worker():
+    """Load the embeddings model once in each spawned ingestion worker"""
+    app_state.embeddings_model = load_embeddings_model()
+
+def build_index(
+    job_id: str,
+    text_chunks: List[str],
+    metadatas: List[Dict],
+    vectors: List[Optional[List[float]]]
+) -> Dict:
+    """Embed, tag and index one ingestion job in a worker process.
+    
+    Only chunks without a vector are embedded. The index is saved to a
+    staging directory that install_index swaps in. Stage timings come back
+    with the result since worker processes can't update the parent's metrics.
+    """
+    embeddings = app_state.embeddings_model
+    if embeddings is None:
+        logger.info("Creating new embeddings model...")
+        embeddings = app_state.embeddings_model = load_embeddings_model()
+    
+    timings = {}
+    vectors = list(vectors)
+    missing = [index for index, vector in enumerate(vectors) if vector is None]
+    if missing:
+        start = time.perf_counter()
+        embedded = embeddings.embed_documents([text_chunks[index] for index in missing])
+        for index, vector in zip(missing, embedded):
+            vectors[index] = vector
+        timings["embed"] = time.perf_counter() - start
+    logger.info(f"Embedded {len(missing)} of {len(text_chunks)} chunks for job {job_id}")
+    
+    # Tag clause types locally, reusing the chunk vectors
+    tags = app_state.clause_classifier.classify(text_chunks, vectors, embeddings)
+    for metadata, tag in zip(metadatas, tags):
+        metadata.update(tag)
+    
+    start = time.perf_counter()
+    vector_store = FAISS.from_embeddings(
+        list(zip(text_chunks, vectors)),
+        embedding=embeddings,
+        metadatas=metadatas
+    )
+    timings["index_build"] = time.perf_counter() - start
+    staging_dir = f"{Config.FAISS_INDEX_DIR}.{job_id}"
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    start = time.perf_counter()
+    vector_store.save_local(staging_dir)
+    timings["index_save"] = time.perf_counter() - start
+    return {"index_dir": staging_dir, "metadatas": metadatas, "vectors": vectors, "timings": timings}
+
+def swap_index(index_dir: str, target_dir: str = Config.FAISS_INDEX_DIR):
+    """Replace target_dir with a saved index directory"""
+    app_state.index_registry.evict(target_dir)
+    if os.path.exists(target_dir):
+        shutil.rmtree(target_dir)
+    os.makedirs(os.path.dirname(target_dir) or ".", exist_ok=True)
+    os.replace(index_dir, target_dir)
+
+def install_index(task_id: str, text_chunks: List[str], result: Dict, activate: bool = True):
+    """Install a worker-built index and record its task state.
+    
+    Activated indexes become the current one; the rest (batch uploads) are
+    kept under BATCH_INDEX_DIR until activated.
+    """
+    if activate:
+        swap_index(result["index_dir"])
+        app_state.current_task_id = task_id
+    else:
+        swap_index(result["index_dir"], os.path.join(Config.BATCH_INDEX_DIR, task_id))
+    
+    changes = {"risk_table": app_state.risk_scorer.factors_from_tags(result["metadatas"])}
+    task = app_state.task_store.get(task_id)
+    if task and task.get("document_id"):
+        # Only versions whose index was installed are registered and offer vectors for reuse
+        document_key = DocumentVersionStore.key(task["tenant"], task["document_id"])
+        changes["version"] = app_state.version_store.add_version(document_key, task_id, task["page_hashes"])
+        app_state.version_store.record_chunks(document_key, task_id, text_chunks, result["vectors"])
+    app_state.task_store.update(task_id, changes)
+    app_state.storage_manager.touch(task_id)
 
-def get_text_chunks_with_pages(pages: List[Tuple[int, str]], task_id: Optional[str] = None) -> Tuple[List[str], List[Dict]]:
-    """Split page texts into chunks retaining page metadata."""
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=Config.CHUNK_SIZE,
-        chunk_overlap=Config.CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
+async def process_job(job: Dict):
+    """Run one claimed ingestion job on the worker pool and install its index"""
+    job_id = job["job_id"]
+    app_state.progress_data[job_id] = {
+        "status": "processing",
+        "progress": 65,
+        "message": "Creating embeddings..."
+    }
     
-    chunks = []
-    metadatas = []
-    total_pages = len(pages)
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            app_state.executor, build_index, job_id, job["chunks"], job["metadatas"], job["vectors"]
+        )
+        for stage, seconds in result["timings"].items():
+            app_state.metrics.observe(stage, seconds)
+        if app_state.job_queue.cancel_requested(job_id):
+            await asyncio.to_thread(shutil.rmtree, result["index_dir"], True)
+            app_state.job_queue.finish(job_id, "cancelled")
+            app_state.storage_manager.remove(job_id)
+            app_state.progress_data[job_id] = {"status": "cancelled", "progress": 0, "message": "Cancelled"}
+            return
+        if app_state.task_store.get(job_id) is None:
+            # The upload was removed while indexing; installing would leave an index with no task or PDF
+            await asyncio.to_thread(shutil.rmtree, result["index_dir"], True)
+            raise Exception("Upload was removed before indexing finished")
+        
+        app_state.progress_data[job_id].update({"progress": 85, "message": "Saving index..."})
+        await asyncio.to_thread(install_index, job_id, job["chunks"], result, job.get("activate", True))
+        app_state.job_queue.finish(job_id, "done")
+        app_state.progress_data[job_id] = {
+            "status": "done",
+            "progress": 100,
+            "message": "Ready for questions! ✅"
+        }
+        logger.info(f"Successfully created vector store for task {job_id}")
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            logger.error("Ingestion worker pool broke; restarting it")
+            app_state.initialize_executor()
+        logger.error(f"Failed to create vector store: {e}")
+        app_state.job_queue.finish(job_id, "error", str(e))
+        app_state.progress_data[job_id] = {
+            "status": "error",
+            "progress": 0,
+            "message": f"Processing failed: {str(e)}"
+        }
+        return
+    finally:
+        if app_state.job_event:
+            app_state.job_event.set()
     
-    for i, (page_num, text) in enumerate(pages):
-        if not text or not text.strip():
-            continue
-            
+    if Config.ENABLE_INGESTION_SUMMARY:
+        labelled_chunks = [
+            f"{page_label(metadata)}\n{chunk}" for chunk, metadata in zip(job["chunks"], result["metadatas"])
+        ]
+        app_state.run_in_background(
+            summarize_document(labelled_chunks, job_id, job["tenant"]), f"summary-{job_id}"
+        )
+
+async def job_dispatcher():
+    """Start queued jobs on free workers, highest priority first"""
+    running = set()
+    while True:
+        while len(running) < Config.MAX_WORKERS:
+            job = await asyncio.to_thread(app_state.job_queue.claim)
+            if job is None:
+                break
+            job_task = asyncio.create_task(process_job(job))
+            running.add(job_task)
+            job_task.add_done_callback(running.discard)
+        
+        app_state.job_event.clear()
         try:
-            page_chunks = splitter.split_text(text)
-            for chunk in page_chunks:
-                if len(chunk.strip()) > 100:  # Larger minimum chunk size
-                    chunks.append(f"[Page {page_num}]\n{chunk}")
-                    metadatas.append({"page": page_num})
-        except Exception as e:
-            logger.warning(f"Failed to chunk page {page_num}: {e}")
-            continue
-            
-        if task_id and i % Config.PROGRESS_UPDATE_INTERVAL == 0:
-            progress = 45 + (i / total_pages) * 20
-            if task_id in app_state.progress_data:
-                app_state.progress_data[task_id].update({
-                    "progress": int(progress),
-                    "message": f"Creating chunks... {i+1}/{total_pages} pages"
-                })
+            await asyncio.wait_for(app_state.job_event.wait(), timeout=Config.JOB_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def run_batch(batch_id: str, tenant: str, priority: int, documents: List[Tuple[str, str]]):
+    """Prepare and queue a batch's documents, BATCH_EXTRACT_CONCURRENCY at a time.
     
-    # Limit chunks to control API costs
-    if len(chunks) > Config.MAX_CHUNKS_FOR_PROCESSING:
-        logger.info(f"Limiting chunks from {len(chunks)} to {Config.MAX_CHUNKS_FOR_PROCESSING}")
-        chunks = chunks[:Config.MAX_CHUNKS_FOR_PROCESSING]
-        metadatas = metadatas[:Config.MAX_CHUNKS_FOR_PROCESSING]
+    Each document waits for room in the job queue before it is prepared, so
+    a large batch feeds the workers steadily instead of filling the queue.
+    Batches stop INTERACTIVE_QUEUE_HEADROOM short of JOB_QUEUE_MAX so they
+    never cause interactive uploads to be turned away.
+    """
+    batch_limit = max(1, Config.JOB_QUEUE_MAX - Config.INTERACTIVE_QUEUE_HEADROOM)
+    semaphore = asyncio.Semaphore(Config.BATCH_EXTRACT_CONCURRENCY)
     
-    if not chunks:
-        raise Exception("No text chunks could be created from the document")
+    async def ingest(task_id: str, filename: str):
+        async with semaphore:
+            upload_path = os.path.join(Config.UPLOADS_DIR, f"{task_id}.pdf")
+            try:
+                while app_state.job_queue.depth() >= batch_limit:
+                    await asyncio.sleep(Config.JOB_POLL_INTERVAL_SECONDS)
+                app_state.progress_data[task_id] = {"status": "processing", "progress": 10, "message": "Extracting text..."}
+                # Batch files aren't versioned: unrelated files often share a name
+                prepared = await asyncio.to_thread(prepare_document, task_id, upload_path, tenant, None)
+                app_state.job_queue.enqueue(task_id, tenant, priority, {
+                    "chunks": prepared["chunks"],
+                    "metadatas": prepared["metadatas"],
+                    "vectors": prepared["vectors"],
+                    "activate": False
+                })
+            except Exception as e:
+                logger.error(f"Batch {batch_id} failed to prepare {filename}: {e}")
+                app_state.storage_manager.remove(task_id)
+                app_state.progress_data[task_id] = {"status": "error", "progress": 0, "message": f"Upload failed: {str(e)}"}
+                return
+            app_state.progress_data[task_id].update({"progress": 60, "message": "Queued for indexing..."})
+            app_state.job_event.set()
     
-    return chunks, metadatas
+    await asyncio.gather(*(ingest(task_id, filename) for task_id, filename in documents))
+    logger.info(f"Batch {batch_id} queued {len(documents)} documents")
 
-def get_vector_store(text_chunks: List[str], task_id: str, metadatas: Optional[List[Dict]] = None):
-    """Create FAISS index with optimizations"""
+# -------------------------
+# Document Summaries
+# -------------------------
+def _parse_json_object(text: str) -> Optional[Dict]:
+    """Parse the outermost JSON object from a model response"""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end <= start:
+        return None
     try:
-        if os.path.exists(Config.FAISS_INDEX_DIR):
-            shutil.rmtree(Config.FAISS_INDEX_DIR)
-
-        embeddings = app_state.embeddings_model
-        if embeddings is None:
-            logger.info("Creating new embeddings model...")
-            embeddings = HuggingFaceEmbeddings(
-                model_name=Config.EMBEDDINGS_MODEL,
-                model_kwargs={'device': 'cpu'}
-            )
+        parsed = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
 
-        app_state.progress_data[task_id].update({
-            "progress": 65,
-            "message": "Creating embeddings..."
-        })
+def _group_chunks(text_chunks: List[str], token_budget: int) -> List[str]:
+    """Group consecutive chunks into map inputs of roughly token_budget tokens"""
+    groups = []
+    current = []
+    current_tokens = 0
+    for chunk in text_chunks:
+        tokens = app_state.token_counter.count(chunk)
+        if current and current_tokens + tokens > token_budget:
+            groups.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
 
-        if metadatas:
-            vector_store = FAISS.from_texts(
-                text_chunks,
-                embedding=embeddings, 
-                metadatas=metadatas
+async def run_budgeted_llm_call(prompt_text: str, max_output_tokens: int, tenant: str, endpoint: str) -> str:
+    """Run one admitted and tracked LLM call outside the QA chain"""
+    plan = await app_state.admission_controller.admit(tenant, [{
+        "decision": "admit",
+        "model": Config.LLM_MODEL,
+        "max_output_tokens": max_output_tokens,
+        "expected_tokens": app_state.token_counter.count(prompt_text) + max_output_tokens
+    }])
+    total_tokens = None
+    try:
+        usage_callback = TokenUsageCallback()
+        with app_state.metrics.time("llm"):
+            message = await app_state.get_llm(Config.LLM_MODEL, max_output_tokens).ainvoke(
+                prompt_text, config={"callbacks": [usage_callback]}
             )
-        else:
-            vector_store = FAISS.from_texts(
-                text_chunks,
-                embedding=embeddings
+        output_text = message.content if isinstance(message.content, str) else str(message.content)
+        token_usage = app_state.token_counter.measure(usage_callback, prompt_text, output_text)
+        total_tokens = token_usage["total_tokens"]
+        app_state.usage_tracker.track_usage(
+            total_tokens,
+            tenant=tenant,
+            endpoint=endpoint,
+            model=Config.LLM_MODEL,
+            input_tokens=token_usage["input_tokens"],
+            output_tokens=token_usage["output_tokens"],
+            source=token_usage["source"]
+        )
+        return output_text
+    finally:
+        app_state.admission_controller.release(plan["reservation_id"], total_tokens)
+
+async def summarize_document(text_chunks: List[str], task_id: str, tenant: str):
+    """Map-reduce all chunks into a stored summary and clause inventory.
+    
+    Runs after the ingestion job so the document is queryable while the
+    summary is still being produced.
+    """
+    task = app_state.task_store.get(task_id)
+    if task is None or app_state.progress_data.get(task_id, {}).get("status") != "done":
+        return
+    
+    app_state.task_store.update(task_id, {"summary": {"status": "processing"}})
+    semaphore = asyncio.Semaphore(Config.SUMMARY_CONCURRENCY)
+    
+    async def map_group(group: str) -> Dict:
+        async with semaphore:
+            output_text = await run_budgeted_llm_call(
+                SUMMARY_MAP_PROMPT_TEMPLATE.format(context=group),
+                Config.SUMMARY_MAP_MAX_TOKENS,
+                tenant,
+                "ingestion-summary"
             )
+        return _parse_json_object(output_text) or {"summary": output_text.strip(), "clauses": []}
+    
+    try:
+        groups = _group_chunks(text_chunks, Config.SUMMARY_MAP_TOKEN_BUDGET)
+        mapped = await asyncio.gather(*(map_group(group) for group in groups))
         
-        app_state.progress_data[task_id].update({
-            "progress": 85,
-            "message": "Saving index..."
-        })
+        clauses = []
+        seen = set()
+        for section in mapped:
+            for clause in section.get("clauses") or []:
+                if not isinstance(clause, dict) or not clause.get("text"):
+                    continue
+                key = (clause.get("type"), clause["text"].strip().lower())
+                if key in seen:
+                    continue
+                seen.add(key)
+                clauses.append({
+                    "type": clause.get("type") or "other",
+                    "page": clause.get("page"),
+                    "text": clause["text"].strip()
+                })
         
-        vector_store.save_local(Config.FAISS_INDEX_DIR)
+        section_summaries = [str(section.get("summary", "")).strip() for section in mapped]
+        section_summaries = [summary for summary in section_summaries if summary]
+        if len(section_summaries) > 1:
+            summary = await run_budgeted_llm_call(
+                SUMMARY_REDUCE_PROMPT_TEMPLATE.format(summaries="\n\n".join(section_summaries)),
+                Config.SUMMARY_REDUCE_MAX_TOKENS,
+                tenant,
+                "ingestion-summary"
+            )
+        else:
+            summary = section_summaries[0] if section_summaries else ""
         
-        app_state.progress_data[task_id] = {
+        app_state.task_store.update(task_id, {"summary": {
             "status": "done",
-            "progress": 100,
-            "message": "Ready for questions! ✅"
-        }
-        
-        logger.info(f"Successfully created vector store for task {task_id}")
-        
+            "summary": summary.strip(),
+            "clauses": clauses,
+            "sections": len(groups),
+            "created": datetime.now().isoformat()
+        }})
+        logger.info(f"Precomputed summary for task {task_id}: {len(groups)} sections, {len(clauses)} clauses")
+    except HTTPException as e:
+        app_state.task_store.update(task_id, {"summary": {"status": "skipped", "message": e.detail}})
+        logger.warning(f"Skipped summary for task {task_id}: {e.detail}")
     except Exception as e:
-        logger.error(f"Failed to create vector store: {e}")
-        app_state.progress_data[task_id] = {
-            "status": "error",
-            "progress": 0,
-            "message": f"Processing failed: {str(e)}"
-        }
+        app_state.task_store.update(task_id, {"summary": {"status": "error", "message": str(e)}})
+        logger.error(f"Failed to summarize task {task_id}: {e}")
+
+def get_document_summary(task_id: Optional[str]) -> Dict:
+    """Look up a finished precomputed summary"""
+    task_id = task_id or app_state.current_task_id
+    task = app_state.task_store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="No document processed. Please upload a PDF first.")
+    
+    summary = task.get("summary")
+    if summary is None:
+        detail = "No precomputed summary for this document"
+        if not Config.ENABLE_INGESTION_SUMMARY:
+            detail += " (ingestion summaries are disabled)"
+        raise HTTPException(status_code=404, detail=detail)
+    if summary["status"] == "processing":
+        raise HTTPException(status_code=409, detail="Summary is still being generated")
+    if summary["status"] != "done":
+        raise HTTPException(status_code=404, detail=f"Summary unavailable: {summary.get('message', summary['status'])}")
+    return {"task_id": task_id, **summary}
+
+async def escalate_ambiguous_clauses(docs: List[Document], tenant: str) -> Dict[int, List[str]]:
+    """Ask the LLM to classify chunks the local classifier could not decide"""
+    passages = []
+    used_tokens = 0
+    for number, doc in enumerate(docs, start=1):
+        tokens = app_state.token_counter.count(doc.page_content)
+        if passages and used_tokens + tokens > Config.CLAUSE_ESCALATION_TOKEN_BUDGET:
+            break
+        passages.append(f"{number}. {doc.page_content}")
+        used_tokens += tokens
+    
+    output_text = await run_budgeted_llm_call(
+        CLAUSE_ESCALATION_PROMPT_TEMPLATE.format(
+            clause_types=", ".join(app_state.clause_classifier.clause_types),
+            passages="\n\n".join(passages)
+        ),
+        Config.LLM_DOWNGRADE_MAX_TOKENS,
+        tenant,
+        "clause-inventory"
+    )
+    
+    parsed = _parse_json_object(output_text) or {}
+    resolved = {}
+    for number, clause_types in parsed.items():
+        # Only passages that were actually sent can be resolved
+        if str(number).isdigit() and 1 <= int(number) <= len(passages) and isinstance(clause_types, list):
+            resolved[int(number) - 1] = [
+                clause_type for clause_type in clause_types
+                if clause_type in app_state.clause_classifier.clause_types
+            ]
+    return resolved
 
 # -------------------------
 # App Setup
 # -------------------------
 app = FastAPI(title="Lawgic AI - Legal Document Analyzer (Rate Limited)")
 
+# Legacy app modules (api/main.py, Code/main.py, Code/api/main.py) import
+# this module as `main` and re-export this app instead of running their own copies.
+
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(ProfilerMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -481,18 +3770,59 @@ for directory in [Config.UPLOADS_DIR, Config.STATIC_DIR]:
 app.mount("/static", StaticFiles(directory=Config.STATIC_DIR), name="static")
 app.mount("/uploads", StaticFiles(directory=Config.UPLOADS_DIR), name="uploads")
 
+def run_cleanup():
+    """Expire old task records and progress entries and sweep upload storage"""
+    keep = tuple(app_state.storage_manager.protected_tasks())
+    tasks = app_state.task_store.expire(Config.TASK_TTL_SECONDS, keep)
+    versions = app_state.version_store.remove_tasks(tasks)
+    progress = app_state.progress_data.expire(Config.PROGRESS_TTL_SECONDS, keep)
+    app_state.batches.expire(Config.PROGRESS_TTL_SECONDS)
+    storage = app_state.storage_manager.sweep()
+    app_state.job_queue.expire(Config.TASK_TTL_SECONDS)
+    if tasks or progress or any(storage.values()):
+        logger.info(
+            f"Cleanup expired {len(tasks)} tasks, {versions} document versions and {progress} progress entries, "
+            f"removed {storage['expired']} stale uploads and {storage['orphans']} orphans"
+        )
+
+async def cleanup_loop():
+    """Run cleanup every CLEANUP_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await asyncio.to_thread(run_cleanup)
+        except Exception as e:
+            logger.error(f"Cleanup failed: {e}")
+        await asyncio.sleep(Config.CLEANUP_INTERVAL_SECONDS)
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Rate-Limited Lawgic AI...")
+    logger.info(f"LLM provider: {app_state.llm_provider.name}")
+    if app_state.llm_provider.name in ("google", "record") and not GOOGLE_API_KEY:
+        logger.warning("GOOGLE_API_KEY not found; LLM calls will fail until it is set")
     app_state.initialize_embeddings()
     app_state.initialize_executor()
+    orphans = await asyncio.to_thread(app_state.storage_manager.scan)
+    if orphans:
+        logger.info(f"Removed {orphans} orphaned uploads")
+    app_state.cleanup_task = asyncio.create_task(cleanup_loop())
+    
+    for job_id in app_state.job_queue.requeue_interrupted():
+        logger.info(f"Re-queued interrupted ingestion job {job_id}")
+        app_state.progress_data[job_id] = {"status": "processing", "progress": 60, "message": "Queued for indexing..."}
+    app_state.job_event = asyncio.Event()
+    app_state.dispatcher_task = asyncio.create_task(job_dispatcher())
     logger.info("Initialization complete!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down...")
+    for background_task in (app_state.cleanup_task, app_state.dispatcher_task, *app_state.background_tasks):
+        if background_task:
+            background_task.cancel()
     if app_state.executor:
-        app_state.executor.shutdown(wait=True)
+        # Running jobs stay marked running and are re-queued on the next start
+        app_state.executor.shutdown(wait=False, cancel_futures=True)
 
 # -------------------------
 # Enhanced API Routes
@@ -502,62 +3832,87 @@ def read_index():
     return FileResponse(os.path.join(Config.STATIC_DIR, "index.html"))
 
 @app.post("/upload-pdf/")
-async def upload_pdf(pdf: UploadFile, background_tasks: BackgroundTasks):
-    """Rate-limited PDF upload"""
+async def upload_pdf(
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """Rate-limited, streamed PDF upload.
+    
+    Expects multipart/form-data with a "pdf" file part, an optional
+    "document_id" field that versions the upload under that document
+    (uploads without one are not versioned) and an optional integer
+    "priority" (higher is indexed first). The task id doubles as the
+    ingestion job id.
+    """
+    tenant = resolve_tenant(x_tenant_id)
     
     # Check rate limits
-    await app_state.check_rate_limits()
+    await app_state.check_rate_limits(tenant)
+    
+    # Backpressure: don't accept work the ingestion queue can't take
+    if app_state.job_queue.depth() >= Config.JOB_QUEUE_MAX:
+        raise HTTPException(
+            status_code=503,
+            detail="Ingestion queue is full, please retry later",
+            headers={"Retry-After": str(app_state.job_queue.retry_after())}
+        )
     
-    if not pdf.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    # Reject declared oversize bodies before reading them
+    content_length = request.headers.get("content-length", "")
+    declared_size = int(content_length) if content_length.isdigit() else 0
+    if declared_size > Config.MAX_FILE_SIZE_BYTES + Config.UPLOAD_FORM_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File size exceeds {Config.MAX_FILE_SIZE_MB}MB limit")
     
-    if pdf.size and pdf.size > Config.MAX_FILE_SIZE_BYTES:
-        raise HTTPException(status_code=400, detail=f"File size exceeds {Config.MAX_FILE_SIZE_MB}MB limit")
+    app_state.storage_manager.make_room(tenant, declared_size)
     
     task_id = str(uuid.uuid4())
-    app_state.progress_data[task_id] = {
-        "status": "processing",
-        "progress": 5,
-        "message": "Initializing (rate-limited processing)..."
-    }
-
     upload_path = os.path.join(Config.UPLOADS_DIR, f"{task_id}.pdf")
     try:
-        if hasattr(pdf.file, 'seek'):
-            pdf.file.seek(0)
-        
-        with open(upload_path, "wb") as out_file:
-            shutil.copyfileobj(pdf.file, out_file)
-        
-        if hasattr(pdf.file, 'seek'):
-            pdf.file.seek(0)
-            
+        upload = await receive_pdf_upload(request, upload_path)
         logger.info(f"PDF saved to {upload_path}")
-            
+        # Content-Length may be missing or wrong, so check quotas on the bytes written
+        app_state.storage_manager.make_room(tenant, os.path.getsize(upload_path))
+        app_state.storage_manager.register(task_id, tenant)
+    except HTTPException:
+        app_state.storage_manager.remove(task_id, drop_task=False)
+        raise
     except Exception as e:
         logger.error(f"Failed to save PDF: {e}")
+        app_state.storage_manager.remove(task_id, drop_task=False)
         raise HTTPException(status_code=500, detail=f"Failed to save PDF: {str(e)}")
-
-    pdf.file._task_id = task_id
     
+    document_id = upload.fields.get("document_id")
     try:
-        pages = get_pdf_pages(pdf)
-        metadata = extract_metadata(upload_path, pages)
-        
-        app_state.task_store[task_id] = {
-            "pdf_path": upload_path,
-            "pages": pages,
-            "metadata": metadata
-        }
-
-        chunks, metadatas = get_text_chunks_with_pages(pages, task_id)
-        background_tasks.add_task(get_vector_store, chunks, task_id, metadatas)
+        priority = int(upload.fields.get("priority") or 0)
+    except ValueError:
+        app_state.storage_manager.remove(task_id, drop_task=False)
+        raise HTTPException(status_code=400, detail="priority must be an integer")
+    app_state.progress_data[task_id] = {
+        "status": "processing",
+        "progress": 5,
+        "message": "Initializing (rate-limited processing)..."
+    }
+    
+    try:
+        prepared = await asyncio.to_thread(prepare_document, task_id, upload_path, tenant, document_id)
+        app_state.job_queue.enqueue(task_id, tenant, priority, {
+            "chunks": prepared["chunks"],
+            "metadatas": prepared["metadatas"],
+            "vectors": prepared["vectors"]
+        })
+        app_state.progress_data[task_id].update({"progress": 60, "message": "Queued for indexing..."})
+        app_state.job_event.set()
 
         return {
             "task_id": task_id, 
             "status": "📄 PDF uploaded (optimized processing)...", 
             "pdf_url": f"/uploads/{task_id}.pdf", 
-            "metadata": metadata,
+            "metadata": prepared["metadata"],
+            "document_id": prepared["document_id"],
+            "version": prepared["version"],
+            "reprocessed_pages": prepared["reprocessed_pages"],
+            "duplicates_collapsed": prepared["duplicates_collapsed"],
+            "job": {"job_id": task_id, "priority": priority, "position": app_state.job_queue.position(task_id)},
             "rate_limit_info": {
                 "daily_usage": app_state.usage_tracker.get_usage_stats()
             }
@@ -565,6 +3920,7 @@ async def upload_pdf(pdf: UploadFile, background_tasks: BackgroundTasks):
         
     except Exception as e:
         logger.error(f"PDF processing failed: {e}")
+        app_state.storage_manager.remove(task_id)
         app_state.progress_data[task_id] = {
             "status": "error",
             "progress": 0,
@@ -583,88 +3939,37 @@ async def get_progress(task_id: str):
     progress_data["usage_stats"] = app_state.usage_tracker.get_usage_stats()
     return progress_data
 
-@app.post("/ask-question/")
-async def ask_question(question: str = Form(...)):
-    """Rate-limited question answering with caching"""
-    
+async def answer_question(question: str, tenant: str, mode: str) -> Dict:
+    """Shared cached, rate-limited QA path for every prompt mode"""
     if not question or not question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
     
+    cache_scope = "" if mode == "ask" else mode
+    
     # Check cache first
     if Config.ENABLE_RESPONSE_CACHE:
-        cached_response = app_state.response_cache.get(question)
+        cached_response = app_state.response_cache.get(question, cache_scope)
         if cached_response:
             return cached_response
     
     # Check rate limits
-    await app_state.check_rate_limits()
+    await app_state.check_rate_limits(tenant)
     
     try:
-        embeddings = app_state.embeddings_model
-        if embeddings is None:
-            embeddings = HuggingFaceEmbeddings(
-                model_name=Config.EMBEDDINGS_MODEL,
-                model_kwargs={'device': 'cpu'}
-            )
-
-        if not os.path.exists(Config.FAISS_INDEX_DIR):
-            raise HTTPException(
-                status_code=404, 
-                detail="No document processed. Please upload a PDF first."
-            )
-
-        vector_store = FAISS.load_local(
-            Config.FAISS_INDEX_DIR, 
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
+        vector_store = await asyncio.to_thread(load_vector_store)
 
         # More restrictive similarity search
-        retrieved_docs = vector_store.similarity_search_with_score(
-            question, 
-            k=Config.SIMILARITY_SEARCH_K
+        results, query_vectors = await asyncio.to_thread(
+            search_batch, vector_store, [question], Config.SIMILARITY_SEARCH_K
         )
         
-        docs = [doc for doc, score in retrieved_docs if score < Config.SIMILARITY_THRESHOLD]
-        
-        if not docs:
-            docs = [doc for doc, _ in retrieved_docs[:3]]  # Limit to top 3
-
-        # Estimate tokens for tracking
-        estimated_input_tokens = len(question.split()) + sum(len((doc.page_content or "").split()) for doc in docs)
-        
-        chain = app_state.get_conversational_chain()
-        response = chain(
-            {"input_documents": docs, "question": question},
-            return_only_outputs=True
+        result = await generate_answer(
+            question, results[0], tenant, PROMPT_MODES[mode]["endpoint"], mode, query_vectors[0]
         )
-
-        # Track API usage (estimate)
-        estimated_output_tokens = len(response["output_text"].split())
-        total_tokens = estimated_input_tokens + estimated_output_tokens
-        app_state.usage_tracker.track_usage(total_tokens)
-
-        refs = []
-        for doc, score in retrieved_docs[:3]:  # Limit references
-            page = (doc.metadata or {}).get("page")
-            content = doc.page_content or ""
-            snippet = content.replace(f"[Page {page}]\n", "").strip()[:120]
-            if page and snippet:
-                refs.append({
-                    "page": page,
-                    "snippet": snippet + "..." if len(snippet) >= 120 else snippet
-                })
-
-        result = {
-            "answer": response["output_text"].strip(),
-            "references": refs,
-            "tokens_used": total_tokens,
-            "cached": False
-        }
         
         # Cache the response
         if Config.ENABLE_RESPONSE_CACHE:
-            app_state.response_cache.set(question, result)
+            app_state.response_cache.set(question, result, cache_scope)
         
         return result
         
@@ -677,12 +3982,613 @@ async def ask_question(question: str = Form(...)):
             status_code=500
         )
 
+@app.post("/upload-batch/")
+async def upload_batch(
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """Ingest many PDFs with one rate-limited request.
+    
+    Expects multipart/form-data with one or more "pdf" file parts, or
+    instead a "path" field naming a directory or zip archive under
+    BATCH_IMPORT_ROOT. Documents are prepared in the background and queued
+    at an optional integer "priority" (BATCH_JOB_PRIORITY by default); their
+    indexes are kept per document and can be made current with
+    /jobs/{job_id}/activate. Poll /batches/{batch_id} for progress.
+    """
+    tenant = resolve_tenant(x_tenant_id)
+    await app_state.check_rate_limits(tenant)
+    
+    content_length = request.headers.get("content-length", "")
+    declared_size = int(content_length) if content_length.isdigit() else 0
+    if declared_size > Config.BATCH_MAX_FILES * Config.MAX_FILE_SIZE_BYTES + Config.UPLOAD_FORM_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail="Batch upload is too large")
+    app_state.storage_manager.make_room(tenant, declared_size)
+    
+    task_ids: List[str] = []
+    
+    def path_for(index: int) -> str:
+        task_ids.append(str(uuid.uuid4()))
+        return os.path.join(Config.UPLOADS_DIR, f"{task_ids[-1]}.pdf")
+    
+    try:
+        upload = await receive_pdf_uploads(request, path_for, Config.BATCH_MAX_FILES)
+        filenames = [os.path.basename(filename) for filename in upload.filenames]
+        skipped: List[Dict] = []
+        if not filenames:
+            if not upload.fields.get("path"):
+                raise HTTPException(status_code=400, detail="Upload PDF files or give a path to import")
+            filenames, skipped = await asyncio.to_thread(import_batch_path, upload.fields["path"], path_for)
+        if not filenames:
+            raise HTTPException(status_code=400, detail="No PDF files found")
+        # Content-Length may be missing or wrong, so check quotas on the bytes written
+        written = sum(os.path.getsize(os.path.join(Config.UPLOADS_DIR, f"{task_id}.pdf")) for task_id in task_ids)
+        app_state.storage_manager.make_room(tenant, written)
+        try:
+            priority = int(upload.fields.get("priority") or Config.BATCH_JOB_PRIORITY)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="priority must be an integer")
+        for task_id in task_ids:
+            app_state.storage_manager.register(task_id, tenant)
+    except HTTPException:
+        for task_id in task_ids:
+            app_state.storage_manager.remove(task_id, drop_task=False)
+        raise
+    except Exception as e:
+        for task_id in task_ids:
+            app_state.storage_manager.remove(task_id, drop_task=False)
+        logger.error(f"Failed to save batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to save batch: {str(e)}")
+    
+    batch_id = str(uuid.uuid4())
+    documents = list(zip(task_ids, filenames))
+    app_state.batches[batch_id] = {"tenant": tenant, "tasks": dict(documents), "skipped": skipped}
+    for task_id, _ in documents:
+        app_state.progress_data[task_id] = {"status": "queued", "progress": 0, "message": "Waiting for extraction..."}
+    app_state.run_in_background(run_batch(batch_id, tenant, priority, documents), f"batch-{batch_id}")
+    
+    return {
+        "batch_id": batch_id,
+        "documents": [
+            {"task_id": task_id, "filename": filename, "pdf_url": f"/uploads/{task_id}.pdf"}
+            for task_id, filename in documents
+        ],
+        "skipped": skipped,
+        "progress_url": f"/batches/{batch_id}"
+    }
+
+@app.get("/batches/{batch_id}")
+async def get_batch_progress(batch_id: str):
+    """Aggregate progress of a batch upload"""
+    batch = app_state.batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    documents = []
+    statuses = Counter()
+    for task_id, filename in batch["tasks"].items():
+        progress = app_state.progress_data.get(task_id, {"status": "unknown", "progress": 0, "message": "Task not found"})
+        statuses[progress["status"]] += 1
+        documents.append({"task_id": task_id, "filename": filename, **progress})
+    
+    finished = sum(statuses[status] for status in ("done", "error", "cancelled", "unknown"))
+    return {
+        "batch_id": batch_id,
+        "status": "done" if finished == len(documents) else "processing",
+        "progress": round(sum(document["progress"] for document in documents) / len(documents)),
+        "total": len(documents),
+        "counts": dict(statuses),
+        "skipped": batch["skipped"],
+        "documents": documents
+    }
+
+@app.post("/ask-question/")
+async def ask_question(question: str = Form(...), x_tenant_id: Optional[str] = Header(None)):
+    """Rate-limited question answering with caching"""
+    return await answer_question(question, resolve_tenant(x_tenant_id), "ask")
+
+@app.post("/simplify/")
+async def simplify(question: str = Form(...), x_tenant_id: Optional[str] = Header(None)):
+    """Explain legal text in plain language using the simplifier prompt"""
+    return await answer_question(question, resolve_tenant(x_tenant_id), "simplify")
+
+@app.post("/ask-questions/")
+async def ask_questions(
+    questions: List[str] = Form(...),
+    mode: str = Form("ask"),
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """Answer a batch of questions against the current document.
+    
+    The batch passes rate limiting once, questions are embedded together and
+    searched in one FAISS call, and LLM calls run with bounded parallelism.
+    Results are streamed as newline-delimited JSON in completion order.
+    """
+    tenant = resolve_tenant(x_tenant_id)
+    
+    if mode not in QA_MODES:
+        raise HTTPException(status_code=400, detail=f"Mode must be one of: {', '.join(QA_MODES)}")
+    cache_scope = "" if mode == "ask" else mode
+    
+    questions = [question.strip() for question in questions]
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    if len(questions) > Config.MAX_BATCH_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {Config.MAX_BATCH_QUESTIONS} questions are allowed per batch"
+        )
+    
+    # Serve cached answers without touching the index
+    cached = {}
+    if Config.ENABLE_RESPONSE_CACHE:
+        for index, question in enumerate(questions):
+            cached_response = app_state.response_cache.get(question, cache_scope)
+            if cached_response:
+                cached[index] = cached_response
+    pending = [index for index in range(len(questions)) if index not in cached]
+    
+    retrieved = {}
+    if pending:
+        await app_state.check_rate_limits(tenant)
+        vector_store = await asyncio.to_thread(load_vector_store)
+        results, query_vectors = await asyncio.to_thread(
+            search_batch, vector_store, [questions[index] for index in pending], Config.SIMILARITY_SEARCH_K
+        )
+        retrieved = dict(zip(pending, zip(results, query_vectors)))
+    
+    semaphore = asyncio.Semaphore(Config.BATCH_LLM_CONCURRENCY)
+    
+    async def answer(index: int) -> Dict:
+        question = questions[index]
+        async with semaphore:
+            try:
+                retrieved_docs, query_vector = retrieved[index]
+                result = await generate_answer(question, retrieved_docs, tenant, "ask-questions", mode, query_vector)
+            except HTTPException as e:
+                return {"index": index, "question": question, "error": e.detail, "status_code": e.status_code}
+            except Exception as e:
+                logger.error(f"Batch question {index} failed: {e}")
+                return {"index": index, "question": question, "error": f"Query failed: {str(e)}", "status_code": 500}
+        if Config.ENABLE_RESPONSE_CACHE:
+            app_state.response_cache.set(question, result, cache_scope)
+        return {"index": index, "question": question, **result}
+    
+    async def stream():
+        for index, response in cached.items():
+            yield json.dumps({"index": index, "question": questions[index], **response}) + "\n"
+        for next_result in asyncio.as_completed([answer(index) for index in pending]):
+            yield json.dumps(await next_result) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _score_compliance_risk(risk: Dict) -> Dict:
+    """Attach the locally computed combined_score and risk level"""
+    factors = np.array([[risk[factor] for factor in RISK_FACTORS]], dtype=np.float32)
+    score = app_state.risk_scorer.score(factors)
+    return {
+        **risk,
+        "combined_score": round(float(score[0]), 3),
+        "risk_level": str(app_state.risk_scorer.levels(score)[0])
+    }
+
+def _validate_compliance_element(key: Optional[str], element: Dict) -> Optional[Dict]:
+    """Validate one streamed clause or risk against the report schema"""
+    model = {"clauses": ComplianceClause, "risks": ComplianceRisk}.get(key)
+    if model is None:
+        return None
+    try:
+        validated = model.model_validate(element).model_dump()
+    except ValidationError as e:
+        logger.warning(f"Dropping invalid compliance {key} element: {e.errors()[:1]}")
+        return None
+    return _score_compliance_risk(validated) if key == "risks" else validated
+
+def render_compliance_report(report: Dict) -> str:
+    """Plain-text form of a compliance report for the legacy "answer" field"""
+    lines = [report["executive_summary"]]
+    if report["clauses"]:
+        lines += ["", "Clauses:"]
+        for clause in report["clauses"]:
+            page = f" (page {clause['page']})" if clause.get("page") else ""
+            lines.append(f"- [{clause['compliance_status']}] {clause['clause_type']}{page}: {clause['text']}")
+    if report["risks"]:
+        lines += ["", "Risks:"]
+        for risk in report["risks"]:
+            lines.append(f"- {risk['risk_level']} ({risk['combined_score']}) {risk['clause_id']}: {risk['description']}")
+    return "\n".join(lines)
+
+@app.post("/compliance/")
+async def compliance(
+    question: str = Form(...),
+    stream: bool = Form(False),
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """Structured compliance review.
+    
+    The model is constrained to the ComplianceReport JSON schema. By
+    default the response keeps the original {"answer": text} shape, with
+    the report rendered as text, and adds the structured fields alongside.
+    With stream=true each clause and risk is validated and sent as an
+    NDJSON event as soon as its object closes, followed by the full report.
+    """
+    tenant = resolve_tenant(x_tenant_id)
+    
+    if not question or not question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    await app_state.check_rate_limits(tenant)
+    
+    vector_store = await asyncio.to_thread(load_vector_store)
+    results, query_vectors = await asyncio.to_thread(search_batch, vector_store, [question], Config.SIMILARITY_SEARCH_K)
+    retrieved_docs = results[0]
+    docs = pack_context(select_relevant_docs(retrieved_docs), Config.CONTEXT_TOKEN_BUDGET)
+    prompt_text = PROMPT_MODES["compliance"]["template"].format(
+        context="\n\n".join(doc.page_content or "" for doc in docs),
+        question=question
+    )
+    
+    # Released when the stream finishes; a client that disconnects before the
+    # stream starts never runs that, so the reservation expires instead
+    plan = await app_state.admission_controller.admit(tenant, [{
+        "decision": "admit",
+        "model": Config.LLM_MODEL,
+        "max_output_tokens": Config.COMPLIANCE_MAX_TOKENS,
+        "expected_tokens": app_state.token_counter.count(prompt_text) + Config.COMPLIANCE_MAX_TOKENS
+    }])
+    llm = app_state.get_llm(plan["model"], plan["max_output_tokens"]).bind(
+        response_mime_type="application/json",
+        response_schema=COMPLIANCE_RESPONSE_SCHEMA
+    )
+    
+    async def events():
+        parser = IncrementalJSONParser()
+        usage_callback = TokenUsageCallback()
+        collected = {"clauses": [], "risks": []}
+        dropped = 0
+        total_tokens = None
+        llm_start = time.perf_counter()
+        try:
+            async for chunk in llm.astream(prompt_text, config={"callbacks": [usage_callback]}):
+                delta = chunk.content if isinstance(chunk.content, str) else ""
+                for key, element in parser.feed(delta):
+                    validated = _validate_compliance_element(key, element)
+                    if validated is None:
+                        dropped += 1
+                        continue
+                    collected[key].append(validated)
+                    yield {"type": key[:-1], "data": validated}
+            app_state.metrics.observe("llm", time.perf_counter() - llm_start)
+            
+            token_usage = app_state.token_counter.measure(usage_callback, prompt_text, parser.buffer)
+            total_tokens = token_usage["total_tokens"]
+            app_state.usage_tracker.track_usage(
+                total_tokens,
+                tenant=tenant,
+                endpoint="compliance",
+                model=plan["model"],
+                input_tokens=token_usage["input_tokens"],
+                output_tokens=token_usage["output_tokens"],
+                source=token_usage["source"]
+            )
+            
+            # Invalid elements were already dropped; the summary must still parse
+            parsed = parser.result()
+            summary = parsed.get("executive_summary") if parsed else None
+            if not isinstance(summary, str):
+                yield {"type": "error", "error": "Model output did not match the compliance schema"}
+                return
+            report = {
+                "clauses": collected["clauses"],
+                "risks": sorted(collected["risks"], key=lambda risk: risk["combined_score"], reverse=True),
+                "executive_summary": summary,
+                "dropped_elements": dropped
+            }
+            yield {
+                "type": "report",
+                "data": report,
+                "references": await asyncio.to_thread(build_references, retrieved_docs, query_vectors[0]),
+                "tokens_used": total_tokens
+            }
+        except Exception as e:
+            logger.error(f"Compliance review failed: {e}")
+            yield {"type": "error", "error": f"Compliance review failed: {str(e)}"}
+        finally:
+            app_state.admission_controller.release(plan["reservation_id"], total_tokens)
+    
+    if stream:
+        async def ndjson():
+            async for event in events():
+                yield json.dumps(event) + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    final = None
+    async for event in events():
+        if event["type"] in ("report", "error"):
+            final = event
+    if final is None or final["type"] == "error":
+        return JSONResponse({"error": final["error"] if final else "Compliance review failed"}, status_code=502)
+    return {
+        "answer": render_compliance_report(final["data"]),
+        **final["data"],
+        "references": final["references"],
+        "tokens_used": final["tokens_used"]
+    }
+
+@app.get("/document-summary/")
+async def document_summary(task_id: Optional[str] = None):
+    """Get the precomputed summary and clause inventory for a document"""
+    return get_document_summary(task_id)
+
+@app.post("/regulatory-summary/")
+async def regulatory_summary(task_id: Optional[str] = Form(None)):
+    """Serve the precomputed regulatory summary without an LLM call"""
+    summary = get_document_summary(task_id)
+    
+    refs = []
+    for clause in summary["clauses"][:3]:
+        if clause.get("page"):
+            snippet = clause["text"][:120]
+            refs.append({
+                "page": clause["page"],
+                "snippet": snippet + "..." if len(clause["text"]) > 120 else snippet
+            })
+    
+    return {
+        "answer": summary["summary"],
+        "references": refs,
+        "clauses": summary["clauses"],
+        "tokens_used": 0,
+        "cached": True
+    }
+
+@app.get("/clause-inventory/")
+async def clause_inventory(
+    clause_type: Optional[str] = None,
+    escalate: bool = False,
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """List clauses from the locally tagged index, escalating only ambiguous chunks"""
+    tenant = resolve_tenant(x_tenant_id)
+    
+    if clause_type and clause_type not in app_state.clause_classifier.clause_types:
+        raise HTTPException(status_code=400, detail=f"Unknown clause type: {clause_type}")
+    
+    vector_store = await asyncio.to_thread(load_vector_store)
+    docs = [doc for doc in vector_store.docstore._dict.values() if isinstance(doc, Document)]
+    docs.sort(key=lambda doc: (doc.metadata or {}).get("chunk", 0))
+    
+    inventory = defaultdict(list)
+    ambiguous = []
+    for doc in docs:
+        metadata = doc.metadata or {}
+        for tagged_type in metadata.get("clause_types", []):
+            inventory[tagged_type].append((doc, metadata["clause_confidence"][tagged_type], "local"))
+        if metadata.get("clause_ambiguous"):
+            ambiguous.append(doc)
+    
+    escalated = 0
+    if escalate and ambiguous:
+        await app_state.check_rate_limits(tenant)
+        resolved = await escalate_ambiguous_clauses(ambiguous, tenant)
+        for index, clause_types in resolved.items():
+            escalated += 1
+            for resolved_type in clause_types:
+                inventory[resolved_type].append((ambiguous[index], None, "llm"))
+    
+    clauses = {}
+    for inventory_type, entries in inventory.items():
+        if clause_type and inventory_type != clause_type:
+            continue
+        clauses[inventory_type] = [
+            {
+                "page": (doc.metadata or {}).get("page"),
+                "snippet": (doc.page_content or "")[:200],
+                "confidence": confidence,
+                "source": source
+            }
+            for doc, confidence, source in entries
+        ]
+    
+    return {
+        "clauses": clauses,
+        "ambiguous_chunks": len(ambiguous) - escalated,
+        "escalated_chunks": escalated
+    }
+
+def _risk_report(factors: np.ndarray, documents: List[str], records: List[Dict], top_k: int) -> Dict:
+    """Score, rank and aggregate a factor table"""
+    scorer = app_state.risk_scorer
+    scores = scorer.score(factors)
+    levels = scorer.levels(scores)
+    
+    document_names, document_ids = np.unique(np.asarray(documents), return_inverse=True)
+    aggregates = scorer.aggregate(scores, document_ids, len(document_names))
+    
+    ranked = []
+    for index in scorer.rank(scores, top_k):
+        ranked.append({
+            **records[index],
+            "document": documents[index],
+            **{factor: round(float(value), 3) for factor, value in zip(RISK_FACTORS, factors[index])},
+            "combined_score": round(float(scores[index]), 3),
+            "risk_level": str(levels[index])
+        })
+    
+    document_summary = [
+        {
+            "document": str(name),
+            "clauses": int(aggregates["count"][index]),
+            "max_score": round(float(aggregates["max"][index]), 3),
+            "mean_score": round(float(aggregates["mean"][index]), 3),
+            "total_score": round(float(aggregates["total"][index]), 3)
+        }
+        for index, name in enumerate(document_names)
+    ]
+    document_summary.sort(key=lambda entry: entry["max_score"], reverse=True)
+    
+    return {
+        "clauses": ranked,
+        "documents": document_summary,
+        "total_clauses": int(len(scores)),
+        "risk_levels": {level: int(np.sum(levels == level)) for level in ("high", "medium", "low")}
+    }
+
+@app.get("/risk-scores/")
+async def risk_scores(task_id: Optional[str] = None, clause_type: Optional[str] = None, top_k: int = 20):
+    """Rank locally tagged clauses by combined risk score across documents"""
+    if clause_type and clause_type not in CLAUSE_RISK_PRIORS:
+        raise HTTPException(status_code=400, detail=f"Unknown clause type: {clause_type}")
+    
+    clause_types = list(CLAUSE_PATTERNS)
+    tables, documents = [], []
+    for current_task_id, table in app_state.task_store.risk_tables():
+        if task_id and current_task_id != task_id:
+            continue
+        mask = np.ones(len(table["type_ids"]), dtype=bool)
+        if clause_type:
+            mask = table["type_ids"] == clause_types.index(clause_type)
+        tables.append({key: value[mask] for key, value in table.items()})
+        documents.extend([current_task_id] * int(mask.sum()))
+    
+    if not documents:
+        return {"clauses": [], "documents": [], "total_clauses": 0, "risk_levels": {"high": 0, "medium": 0, "low": 0}}
+    
+    factors = np.concatenate([table["factors"] for table in tables])
+    type_ids = np.concatenate([table["type_ids"] for table in tables])
+    pages = np.concatenate([table["pages"] for table in tables])
+    chunks = np.concatenate([table["chunks"] for table in tables])
+    records = [
+        {"clause_type": clause_types[type_id], "page": int(page), "chunk": int(chunk)}
+        for type_id, page, chunk in zip(type_ids, pages, chunks)
+    ]
+    return _risk_report(factors, documents, records, top_k)
+
+@app.post("/risk-scores/")
+async def score_risk_factors(payload: Dict = Body(...)):
+    """Score externally supplied factor values, e.g. from a structured LLM output"""
+    clauses = payload.get("clauses")
+    if not isinstance(clauses, list) or not clauses:
+        raise HTTPException(status_code=400, detail="Provide a non-empty 'clauses' list")
+    
+    try:
+        factors = np.array(
+            [[float(clause[factor]) for factor in RISK_FACTORS] for clause in clauses],
+            dtype=np.float32
+        )
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Every clause needs numeric {', '.join(RISK_FACTORS)} values between 0 and 1"
+        )
+    
+    documents = [str(clause.get("document", "default")) for clause in clauses]
+    records = [
+        {key: value for key, value in clause.items() if key not in RISK_FACTORS and key != "document"}
+        for clause in clauses
+    ]
+    return _risk_report(factors, documents, records, int(payload.get("top_k", len(clauses))))
+
+@app.get("/jobs/")
+async def list_jobs():
+    """Ingestion queue depth and job counts by status"""
+    return {"queued": app_state.job_queue.depth(), "max_queued": Config.JOB_QUEUE_MAX, "by_status": app_state.job_queue.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of one ingestion job"""
+    job = app_state.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or discard a running job's result when it finishes.
+    
+    Worker processes can't be interrupted mid-job, so a running job keeps
+    its worker busy until embedding and indexing finish ("cancelling");
+    only then is its index deleted instead of installed.
+    """
+    status = app_state.job_queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status == "cancelled":
+        app_state.storage_manager.remove(job_id)
+        app_state.progress_data[job_id] = {"status": "cancelled", "progress": 0, "message": "Cancelled"}
+    elif status == "cancelling" and job_id in app_state.progress_data:
+        app_state.progress_data[job_id]["message"] = "Cancelling once the running indexing step finishes..."
+    return {"job_id": job_id, "status": status}
+
+@app.post("/jobs/{job_id}/activate")
+async def activate_job(job_id: str):
+    """Make a finished batch job's index the current one for questions"""
+    index_dir = os.path.join(Config.BATCH_INDEX_DIR, job_id)
+    if not os.path.isdir(index_dir):
+        raise HTTPException(status_code=404, detail="No stored index for this job")
+    staging_dir = f"{Config.FAISS_INDEX_DIR}.{job_id}"
+    await asyncio.to_thread(shutil.copytree, index_dir, staging_dir, dirs_exist_ok=True)
+    await asyncio.to_thread(swap_index, staging_dir)
+    app_state.current_task_id = job_id
+    app_state.storage_manager.touch(job_id)
+    return {"job_id": job_id, "status": "active"}
+
+@app.get("/documents/{document_id}/versions")
+async def document_versions(document_id: str, x_tenant_id: Optional[str] = Header(None)):
+    """List the uploaded versions of one of the tenant's documents"""
+    document_key = DocumentVersionStore.key(resolve_tenant(x_tenant_id), document_id)
+    versions = await asyncio.to_thread(app_state.version_store.history, document_key)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {
+        "document_id": document_id,
+        "versions": [
+            {
+                "version": entry["version"],
+                "task_id": entry["task_id"],
+                "pages": len(entry["page_hashes"]),
+                "created": entry["created"]
+            }
+            for entry in versions
+        ]
+    }
+
+@app.get("/documents/{document_id}/changes")
+async def document_changes(
+    document_id: str,
+    from_version: Optional[int] = None,
+    to_version: Optional[int] = None,
+    x_tenant_id: Optional[str] = Header(None)
+):
+    """List pages added, removed, modified or unchanged between two versions of a tenant's document"""
+    document_key = DocumentVersionStore.key(resolve_tenant(x_tenant_id), document_id)
+    versions = await asyncio.to_thread(app_state.version_store.history, document_key)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    to_version = to_version or versions[-1]["version"]
+    from_version = from_version or max(1, to_version - 1)
+    by_number = {entry["version"]: entry for entry in versions}
+    old = by_number.get(from_version)
+    new = by_number.get(to_version)
+    if old is None or new is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    return {
+        "document_id": document_id,
+        "from_version": from_version,
+        "to_version": to_version,
+        **DocumentVersionStore.diff(old["page_hashes"], new["page_hashes"])
+    }
+
 @app.get("/usage-stats/")
-async def get_usage_stats():
-    """Get current API usage statistics"""
-    stats = app_state.usage_tracker.get_usage_stats()
+async def get_usage_stats(tenant: Optional[str] = None):
+    """Get current API usage statistics, optionally for a single tenant"""
+    stats = app_state.usage_tracker.get_usage_stats(tenant)
     stats["rate_limit_reset"] = app_state.rate_limiter.get_reset_time()
     stats["daily_limit"] = Config.MAX_DAILY_TOKENS
+    stats["tenant_daily_limit"] = Config.TENANT_DAILY_TOKENS
+    stats["reserved_tokens"] = app_state.admission_controller.get_reserved_tokens(tenant)
     stats["requests_per_minute_limit"] = Config.MAX_REQUESTS_PER_MINUTE
     return stats
 
@@ -692,6 +4598,71 @@ async def clear_cache():
     app_state.response_cache.cache.clear()
     return {"message": "Cache cleared successfully"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latencies, cache and rate-limit counters, queue and memory gauges"""
+    return Response(app_state.metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+def require_admin(token: Optional[str]):
+    """Reject callers without the configured admin token"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not token or not hmac.compare_digest(token, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/profile/")
+async def profile_requests(
+    mode: Literal["sampling", "deterministic"] = Form("sampling"),
+    seconds: float = Form(Config.PROFILE_DEFAULT_SECONDS),
+    requests: Optional[int] = Form(None),
+    memory: bool = Form(False),
+    interval_ms: float = Form(Config.PROFILE_SAMPLE_INTERVAL_MS),
+    sort: str = Form("cumulative"),
+    raw: bool = Form(False),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Profile this worker for the next `requests` requests or `seconds` seconds.
+    
+    Returns pstats text (deterministic) or collapsed stacks (sampling), with
+    a tracemalloc growth diff when memory is set. With raw set, returns only
+    the marshalled pstats or the collapsed-stack text, ready for snakeviz or
+    flamegraph.pl.
+    """
+    require_admin(x_admin_token)
+    if app_state.profiler is not None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    if sort not in {key.value for key in pstats.SortKey}:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key {sort!r}")
+    seconds = min(max(seconds, 0.1), Config.PROFILE_MAX_SECONDS)
+    
+    session = ProfileSession(mode, requests, max(interval_ms, 1) / 1000, memory)
+    started = time.perf_counter()
+    app_state.profiler = session
+    try:
+        session.start()
+        await asyncio.wait_for(session.done.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        app_state.profiler = None
+        result = session.stop()
+    result["duration_s"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Profiled {session.requests} requests over {result['duration_s']}s ({mode})")
+    
+    if mode == "deterministic":
+        if raw:
+            return Response(
+                session.pstats_dump(), media_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="profile.pstats"'}
+            )
+        result["profile"] = session.pstats_text(sort)
+    else:
+        if raw:
+            return Response(session.collapsed(), media_type="text/plain")
+        result["samples"] = session.samples
+        result["profile"] = session.collapsed()
+    return result
+
 @app.get("/health")
 async def health_check():
     """Enhanced health check with rate limit status"""
@@ -700,6 +4671,14 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "embeddings_loaded": app_state.embeddings_model is not None,
+        "indexes_loaded": len(app_state.index_registry.indexes),
+        "task_store": app_state.task_store.stats(),
+        "versions": app_state.version_store.stats(),
+        "storage": app_state.storage_manager.usage(),
+        "jobs": app_state.job_queue.stats(),
+        "progress_entries": len(app_state.progress_data),
+        "modes": list(PROMPT_MODES),
+        "llm_provider": app_state.llm_provider.name,
         "daily_tokens_used": stats["daily_tokens"],
         "daily_limit": Config.MAX_DAILY_TOKENS,
         "rate_limit_reset_seconds": app_state.rate_limiter.get_reset_time()
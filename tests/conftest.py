@@ -0,0 +1,26 @@
+"""Shared fixtures for the app's tests.
+
+main keeps its stores and uploads under relative paths, so the app is
+imported once per session from a scratch directory, with the offline
+embeddings and LLM providers.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        import main as app_module
+        yield app_module
+    finally:
+        os.chdir(previous)
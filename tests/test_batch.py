@@ -0,0 +1,25 @@
+import asyncio
+
+
+def test_batches_leave_queue_room_for_interactive_uploads(main, tmp_path, monkeypatch):
+    queue = main.JobQueue(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(main.app_state, "job_queue", queue)
+    monkeypatch.setattr(main.Config, "JOB_QUEUE_MAX", 6)
+    monkeypatch.setattr(main.Config, "INTERACTIVE_QUEUE_HEADROOM", 2)
+    monkeypatch.setattr(main.Config, "BATCH_EXTRACT_CONCURRENCY", 1)
+    monkeypatch.setattr(main.Config, "JOB_POLL_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(
+        main, "prepare_document",
+        lambda task_id, *args: {"chunks": ["text"], "metadatas": [{}], "vectors": [None]}
+    )
+    documents = [(f"doc-{index}", f"doc-{index}.pdf") for index in range(10)]
+
+    async def run():
+        monkeypatch.setattr(main.app_state, "job_event", asyncio.Event())
+        try:
+            await asyncio.wait_for(main.run_batch("batch", "tenant", -1, documents), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    assert queue.depth() == 4
@@ -0,0 +1,51 @@
+import pytest
+
+def body(number, extra=""):
+    return f"{number}.1 The tenant pays rent of 1,200 EUR by day {number}.\n\nParagraph {number} continues here.{extra}"
+
+
+def page(number, header, footer, extra=""):
+    return number, f"{header}\n{body(number, extra)}\n{footer}".strip("\n")
+
+
+@pytest.mark.parametrize("footer", ["Page {n}", "{n} of 5", "- {n} -", "Page {n} of 5", "[{n}]"])
+def test_page_number_footers_are_removed(main, footer):
+    pages = [page(n, "ACME LEASE AGREEMENT", footer.format(n=n)) for n in range(1, 6)]
+    cleaned = dict(main.strip_boilerplate(pages))
+    for n in range(1, 6):
+        assert cleaned[n] == body(n)
+
+
+def test_page_numbers_as_headers_are_removed(main):
+    pages = [page(n, f"- {n} -", "") for n in range(1, 5)]
+    cleaned = dict(main.strip_boilerplate(pages))
+    assert cleaned[2] == body(2)
+
+
+def test_paragraph_breaks_survive(main):
+    pages = [page(n, "ACME LEASE AGREEMENT", f"Page {n}", extra=f"\n\n\nSigned on day {n}.") for n in range(1, 5)]
+    cleaned = dict(main.strip_boilerplate(pages))
+    assert cleaned[1] == body(1, "\n\n\nSigned on day 1.")
+
+
+def test_body_lines_with_numbers_are_kept(main):
+    # Numbered clauses open and close each page, but their numbers don't run in page order
+    pages = [
+        (1, "12\nThe rent is 1,200 EUR.\nSee clause 4."),
+        (2, "7\nClause 30 applies to 2 parties.\n3"),
+        (3, "5\nPayment within 10 days.\n2 of 3"),
+        (4, "9\nThe term is 24 months.\n1"),
+    ]
+    cleaned = main.strip_boilerplate(pages)
+    assert cleaned == pages
+
+
+def test_untouched_pages_are_returned_unchanged(main):
+    pages = [(n, f"  Clause {n}.\r\nIt applies in full.  \n") for n in range(1, 4)]
+    pages[1] = (2, "Different text entirely.\n\nWith a break.")
+    assert main.strip_boilerplate(pages)[1] == pages[1]
+
+
+def test_short_documents_are_left_alone(main):
+    pages = [page(n, "ACME LEASE AGREEMENT", f"Page {n}") for n in range(1, 3)]
+    assert main.strip_boilerplate(pages) == pages
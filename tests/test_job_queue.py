@@ -0,0 +1,126 @@
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def queue(main, tmp_path, monkeypatch):
+    # Distinct, increasing creation times so ties fall back to FIFO deterministically
+    clock = itertools.count(1_000_000)
+    monkeypatch.setattr(main.time, "time", lambda: float(next(clock)))
+    return main.JobQueue(str(tmp_path / "jobs.db"))
+
+
+def payload(name):
+    return {"chunks": [f"chunk of {name}"], "metadatas": [{"chunk": 0}], "vectors": [None]}
+
+
+def test_claim_order_is_priority_then_fifo(queue):
+    for job_id, priority in [("a", 0), ("b", 5), ("c", 0), ("d", 5), ("e", -1)]:
+        queue.enqueue(job_id, "tenant", priority, payload(job_id))
+
+    assert [queue.get(job_id)["position"] for job_id in "abcde"] == [3, 1, 4, 2, 5]
+    claimed = []
+    while (job := queue.claim()) is not None:
+        claimed.append(job)
+    assert [job["job_id"] for job in claimed] == ["b", "d", "a", "c", "e"]
+    assert claimed[0] == {"job_id": "b", "tenant": "tenant", **payload("b")}
+    assert queue.depth() == 0
+    assert queue.stats() == {"running": 5}
+
+
+def test_requeue_interrupted_restores_running_jobs(main, queue, tmp_path):
+    queue.enqueue("low", "tenant", 0, payload("low"))
+    queue.enqueue("high", "tenant", 9, payload("high"))
+    assert queue.claim()["job_id"] == "high"
+
+    # A new process opens the same database after a crash
+    restarted = main.JobQueue(str(tmp_path / "jobs.db"))
+    assert restarted.requeue_interrupted() == ["high"]
+    assert restarted.get("high")["status"] == "queued"
+    assert restarted.get("high")["started"] is None
+    assert restarted.claim() == {"job_id": "high", "tenant": "tenant", **payload("high")}
+    assert restarted.requeue_interrupted() == ["high"]
+    restarted.finish("high", "done")
+    assert restarted.requeue_interrupted() == []
+
+
+def test_cancel_queued_job(queue):
+    queue.enqueue("a", "tenant", 0, payload("a"))
+    queue.enqueue("b", "tenant", 0, payload("b"))
+
+    assert queue.cancel("a") == "cancelled"
+    assert queue.get("a")["status"] == "cancelled"
+    assert queue.get("b")["position"] == 1
+    assert queue.claim()["job_id"] == "b"
+    assert queue.claim() is None
+    assert queue.cancel("missing") is None
+
+
+def test_cancel_running_job_only_flags_it(queue):
+    queue.enqueue("a", "tenant", 0, payload("a"))
+    queue.claim()
+
+    assert queue.cancel("a") == "cancelling"
+    job = queue.get("a")
+    assert job["status"] == "running"
+    assert job["cancel_requested"] is True
+    assert queue.cancel_requested("a")
+
+    queue.finish("a", "done")
+    assert queue.cancel("a") == "done"
+
+
+def test_cancelled_running_job_runs_to_completion_and_is_discarded(main, queue, monkeypatch, tmp_path):
+    queue.enqueue("job", "tenant", 0, payload("job"))
+    job = queue.claim()
+    index_dir = tmp_path / "staged-index"
+    index_dir.mkdir()
+    calls = []
+
+    def build_index(job_id, chunks, metadatas, vectors):
+        # The cancel lands while the worker is busy; the worker still finishes
+        assert queue.cancel(job_id) == "cancelling"
+        calls.append(job_id)
+        return {"index_dir": str(index_dir), "metadatas": metadatas, "timings": {}}
+
+    def install_index(*args):
+        raise AssertionError("a cancelled job's index must not be installed")
+
+    monkeypatch.setattr(main, "build_index", build_index)
+    monkeypatch.setattr(main, "install_index", install_index)
+    monkeypatch.setattr(main.app_state, "job_queue", queue)
+    monkeypatch.setattr(main.app_state, "job_event", None)
+    with ThreadPoolExecutor(1) as executor:
+        monkeypatch.setattr(main.app_state, "executor", executor)
+        asyncio.run(main.process_job(job))
+
+    assert calls == ["job"]
+    assert queue.get("job")["status"] == "cancelled"
+    assert not index_dir.exists()
+    assert main.app_state.progress_data["job"]["status"] == "cancelled"
+
+
+def test_result_of_an_evicted_upload_is_not_installed(main, queue, monkeypatch, tmp_path):
+    queue.enqueue("gone", "tenant", 0, payload("gone"))
+    job = queue.claim()
+    index_dir = tmp_path / "staged-index"
+    index_dir.mkdir()
+    main.app_state.task_store.delete("gone")
+
+    def install_index(*args):
+        raise AssertionError("an evicted upload's index must not be installed")
+
+    monkeypatch.setattr(main, "build_index", lambda *args: {"index_dir": str(index_dir), "metadatas": [], "timings": {}})
+    monkeypatch.setattr(main, "install_index", install_index)
+    monkeypatch.setattr(main.app_state, "job_queue", queue)
+    monkeypatch.setattr(main.app_state, "job_event", None)
+    with ThreadPoolExecutor(1) as executor:
+        monkeypatch.setattr(main.app_state, "executor", executor)
+        asyncio.run(main.process_job(job))
+
+    assert queue.get("gone")["status"] == "error"
+    assert not index_dir.exists()
+    assert main.app_state.progress_data["gone"]["status"] == "error"
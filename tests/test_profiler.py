@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+
+def profile(main, **options):
+    options = {
+        "mode": "deterministic", "seconds": 0.1, "requests": None, "memory": False,
+        "interval_ms": 5, "sort": "cumulative", "raw": False, "x_admin_token": "secret", **options
+    }
+    return asyncio.run(main.profile_requests(**options))
+
+
+@pytest.fixture
+def admin(main, monkeypatch):
+    monkeypatch.setattr(main.Config, "ADMIN_TOKEN", "secret")
+
+
+def test_profile_runs_and_releases_the_slot(main, admin):
+    result = profile(main)
+    assert result["mode"] == "deterministic"
+    assert "profile" in result
+    assert main.app_state.profiler is None
+
+
+def test_failed_start_releases_the_slot(main, admin, monkeypatch):
+    def start(self):
+        raise RuntimeError("another profiler is active")
+
+    monkeypatch.setattr(main.ProfileSession, "start", start)
+    with pytest.raises(RuntimeError):
+        profile(main)
+    assert main.app_state.profiler is None
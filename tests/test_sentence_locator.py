@@ -0,0 +1,33 @@
+import numpy as np
+
+
+class KeywordEmbeddings:
+    """Two-dimensional vectors: does the sentence mention rent, and does it mention notice"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float("rent" in text), float("notice" in text)] for text in texts]
+
+
+def test_picks_the_sentence_closest_to_the_query(main):
+    locator = main.SentenceLocator()
+    embeddings = KeywordEmbeddings()
+    text = "The tenant pays rent monthly. Either party may give notice. Signed in Paris."
+    (start, end), = locator.locate([text], np.array([0.0, 1.0]), embeddings)
+    assert text[start:end] == "Either party may give notice."
+
+    # Sentence vectors are cached between calls
+    locator.locate([text], np.array([1.0, 0.0]), embeddings)
+    assert len(embeddings.calls) == 1
+
+
+def test_single_sentence_chunks_are_not_embedded(main):
+    locator = main.SentenceLocator()
+    embeddings = KeywordEmbeddings()
+    texts = ["  Rent is due on the first.  ", "No notice. Rent applies."]
+    spans = locator.locate(texts, np.array([1.0, 0.0]), embeddings)
+    assert [text[start:end] for text, (start, end) in zip(texts, spans)] == ["Rent is due on the first.", "Rent applies."]
+    assert embeddings.calls == [["No notice.", "Rent applies."]]
@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.fixture
+def storage(main, tmp_path, monkeypatch):
+    manager = main.StorageManager(str(tmp_path))
+    monkeypatch.setattr(main.app_state, "storage_manager", manager)
+    monkeypatch.setattr(main.app_state, "job_queue", main.JobQueue(str(tmp_path / "jobs.db")))
+    monkeypatch.setattr(main.app_state, "progress_data", main.ProgressStore())
+    monkeypatch.setattr(main.app_state, "current_task_id", None)
+    monkeypatch.setattr(main.Config, "TENANT_STORAGE_QUOTA_BYTES", 250)
+    return manager
+
+
+def add_upload(storage, tmp_path, task_id, accessed):
+    (tmp_path / f"{task_id}.pdf").write_bytes(b"x" * 100)
+    storage.register(task_id, "acme")
+    storage.files[task_id]["accessed"] = accessed
+
+
+def test_eviction_skips_uploads_still_being_ingested(main, storage, tmp_path):
+    for accessed, task_id in enumerate(["queued", "running", "extracting", "current", "idle"]):
+        add_upload(storage, tmp_path, task_id, accessed)
+    main.app_state.job_queue.enqueue("queued", "acme", 0, {})
+    main.app_state.job_queue.enqueue("running", "acme", 0, {})
+    main.app_state.job_queue.claim()
+    main.app_state.job_queue.claim()
+    main.app_state.progress_data["extracting"] = {"status": "processing"}
+    main.app_state.current_task_id = "current"
+
+    assert storage.protected_tasks() == {"queued", "running", "extracting", "current"}
+    with pytest.raises(main.HTTPException) as error:
+        storage.make_room("acme", 100)
+    assert error.value.status_code == 507
+    # Only the idle upload could go, and it did not free enough on its own
+    assert sorted(storage.files) == ["current", "extracting", "queued", "running"]
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+REPORT = {
+    "clauses": [
+        {
+            "id": "c1",
+            "clause_type": "exclusions",
+            "page": 3,
+            "text": "Excludes \"acts of God\", floods {and} [war]; see \\\\server\\share.",
+            "compliance_status": "Gap",
+            "frameworks": ["IRDAI", "Solvency II"]
+        },
+        {
+            "id": "c2",
+            "clause_type": "termination",
+            "page": None,
+            "text": "Either party may terminate — café \\u00e9 clause.",
+            "compliance_status": "Aligned",
+            "frameworks": []
+        }
+    ],
+    "risks": [
+        {
+            "clause_id": "c1",
+            "description": "Nested [[1, 2], [3]] and {\"k\": \"v\"} in text",
+            "financial_exposure": 0.8,
+            "regulatory_impact": 0.5,
+            "urgency": 0.2,
+            "rationale": "Line one\nline two\ttabbed"
+        }
+    ],
+    "executive_summary": "Summary with \"quotes\" and a trailing backslash \\"
+}
+
+
+def expected_events(report):
+    return [(key, element) for key in ("clauses", "risks") for element in report[key]]
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_every_single_split_matches_json_loads(main, indent):
+    text = json.dumps(REPORT, indent=indent)
+    for split in range(len(text) + 1):
+        parser = main.IncrementalJSONParser()
+        events = feed_all(parser, [text[:split], text[split:]])
+        assert events == expected_events(json.loads(text)), f"split at {split}: {text[split - 5:split + 5]!r}"
+        assert parser.result() == json.loads(text)
+
+
+def test_one_character_at_a_time(main):
+    text = json.dumps(REPORT, ensure_ascii=False)
+    parser = main.IncrementalJSONParser()
+    assert feed_all(parser, list(text)) == expected_events(json.loads(text))
+
+
+def test_split_inside_string_and_on_escapes(main):
+    text = json.dumps(REPORT)
+    # Split right after every backslash, and inside the first quoted word
+    cut_points = [index + 1 for index, char in enumerate(text) if char == "\\"]
+    cut_points.append(text.index("acts of") + 3)
+    bounds = [0] + sorted(set(cut_points)) + [len(text)]
+    chunks = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+    assert any(chunk.endswith("\\") for chunk in chunks)
+    parser = main.IncrementalJSONParser()
+    assert feed_all(parser, chunks) == expected_events(json.loads(text))
+
+
+def test_nested_arrays_emit_only_top_level_elements(main):
+    text = '{"clauses": [{"grid": [[1, 2], [{"deep": [3]}]], "x": {"y": [4]}}, {"grid": []}], "other": [[{"no": 1}]]}'
+    parser = main.IncrementalJSONParser()
+    events = feed_all(parser, [text[i:i + 7] for i in range(0, len(text), 7)])
+    assert events == [("clauses", element) for element in json.loads(text)["clauses"]]
+
+
+def test_elements_are_emitted_as_soon_as_they_close(main):
+    text = json.dumps(REPORT)
+    first_end = text.index('}, {"id": "c2"') + 1
+    parser = main.IncrementalJSONParser()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [("clauses", REPORT["clauses"][0])]
+
+
+def test_incomplete_stream_has_no_result(main):
+    text = json.dumps(REPORT)
+    parser = main.IncrementalJSONParser()
+    parser.feed(text[:-10])
+    assert parser.result() is None
+
+
+def test_validate_compliance_element(main):
+    clause = main._validate_compliance_element("clauses", REPORT["clauses"][0])
+    assert clause == REPORT["clauses"][0]
+
+    risk = main._validate_compliance_element("risks", REPORT["risks"][0])
+    assert risk["risk_level"] in ("high", "medium", "low")
+    assert 0 <= risk["combined_score"] <= 1
+
+    assert main._validate_compliance_element("clauses", {**REPORT["clauses"][0], "compliance_status": "Maybe"}) is None
+    assert main._validate_compliance_element("risks", {**REPORT["risks"][0], "urgency": 1.5}) is None
+    assert main._validate_compliance_element("other", REPORT["clauses"][0]) is None
+    assert main._validate_compliance_element(None, {}) is None
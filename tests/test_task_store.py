@@ -0,0 +1,89 @@
+import pickle
+import sqlite3
+import threading
+
+import pytest
+import zstandard
+
+
+@pytest.fixture
+def store(main, tmp_path):
+    return main.TaskStore(str(tmp_path / "tasks.db"), cache_size=2)
+
+
+def record():
+    return {
+        "pdf_path": "uploads/t.pdf",
+        "tenant": "acme",
+        "pages": [(1, "page one " * 200), (2, "page two " * 200)],
+        "metadata": {"title": "Lease"},
+        "page_hashes": {1: "a", 2: "b"},
+        "document_id": "lease",
+        "version": 1
+    }
+
+
+def stored_data(store, task_id):
+    return store.conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+
+def test_round_trip_through_sqlite(store):
+    store["t"] = {**record(), "risk_table": {"exclusions": 0.4}}
+    store.cache.clear()
+    assert store.get("t") == {**record(), "risk_table": {"exclusions": 0.4}}
+    assert store.risk_tables() == [("t", {"exclusions": 0.4})]
+
+
+def test_status_updates_leave_the_page_blob_alone(store):
+    store["t"] = record()
+    data = stored_data(store, "t")
+
+    assert store.update("t", {"summary": {"status": "processing"}})
+    assert store.update("t", {"risk_table": {"regulatory": 0.9}})
+    assert stored_data(store, "t") == data
+
+    store.cache.clear()
+    loaded = store.get("t")
+    assert loaded["summary"] == {"status": "processing"}
+    assert loaded["risk_table"] == {"regulatory": 0.9}
+    assert loaded["pages"] == record()["pages"]
+    assert not store.update("missing", {"summary": {}})
+
+
+def test_concurrent_updates_keep_every_field(store):
+    store["t"] = record()
+    barrier = threading.Barrier(8)
+
+    def writer(index):
+        barrier.wait()
+        for round_ in range(25):
+            store.update("t", {f"field_{index}": round_})
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    store.cache.clear()
+    loaded = store.get("t")
+    assert all(loaded[f"field_{index}"] == 24 for index in range(8))
+
+
+def test_reads_stores_written_before_the_state_column(main, tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tasks (task_id TEXT PRIMARY KEY, updated REAL NOT NULL, data BLOB NOT NULL, risk_table BLOB)")
+    legacy = {**record(), "summary": {"status": "done", "summary": "old"}}
+    conn.execute(
+        "INSERT INTO tasks VALUES (?, 0, ?, NULL)",
+        ("t", zstandard.ZstdCompressor().compress(pickle.dumps(legacy)))
+    )
+    conn.commit()
+    conn.close()
+
+    store = main.TaskStore(path)
+    assert store.get("t") == legacy
+    store.update("t", {"summary": {"status": "error"}})
+    store.cache.clear()
+    assert store.get("t") == {**legacy, "summary": {"status": "error"}}
@@ -0,0 +1,200 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import ClientDisconnect, Request
+
+BOUNDARY = "lawgic-test-boundary"
+PDF = b"%PDF-1.4\n" + b"x" * 300 + b"\n%%EOF\n"
+
+
+def multipart(files, fields=None):
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for filename, data in files:
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="pdf"; filename="{filename}"\r\n'
+            f"Content-Type: application/pdf\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{BOUNDARY}--\r\n".encode())
+    return b"".join(parts)
+
+
+def messages_for(body, chunk_size, disconnect_after=None):
+    chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+    if disconnect_after is not None:
+        messages = messages[:disconnect_after] + [{"type": "http.disconnect"}]
+    return messages
+
+
+def make_scope(body, content_type=f"multipart/form-data; boundary={BOUNDARY}", content_length=True):
+    headers = [(b"content-type", content_type.encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    return {
+        "type": "http",
+        "method": "POST",
+        "path": "/upload-pdf/",
+        "raw_path": b"/upload-pdf/",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+        "scheme": "http",
+        "root_path": ""
+    }
+
+
+def make_request(body, chunk_size=16, disconnect_after=None, **scope_options):
+    messages = messages_for(body, chunk_size, disconnect_after)
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    return Request(make_scope(body, **scope_options), receive)
+
+
+def receive(main, request, tmp_path, max_files=1):
+    return asyncio.run(main.receive_pdf_uploads(request, lambda index: str(tmp_path / f"{index}.pdf"), max_files))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 100000])
+def test_streams_files_and_fields(main, tmp_path, chunk_size):
+    body = multipart([("a.pdf", PDF), ("B.PDF", PDF + b"tail")], {"document_id": "lease", "priority": "3"})
+    upload = receive(main, make_request(body, chunk_size), tmp_path, max_files=2)
+    assert upload.filenames == ["a.pdf", "B.PDF"]
+    assert upload.fields == {"document_id": "lease", "priority": "3"}
+    assert (tmp_path / "0.pdf").read_bytes() == PDF
+    assert (tmp_path / "1.pdf").read_bytes() == PDF + b"tail"
+
+
+def test_file_over_size_limit_is_rejected_while_streaming(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.Config, "MAX_FILE_SIZE_BYTES", 100)
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(multipart([("a.pdf", PDF)])), tmp_path)
+    assert error.value.status_code == 413
+
+
+def test_oversized_form_fields_are_rejected(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.Config, "UPLOAD_FORM_OVERHEAD_BYTES", 32)
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(multipart([("a.pdf", PDF)], {"document_id": "x" * 64})), tmp_path)
+    assert error.value.status_code == 413
+
+
+@pytest.mark.parametrize("data", [b"%PDX-1.4 not a pdf", b"<html>%PDF</html>", b"%PD"])
+def test_pdf_magic_is_required(main, tmp_path, data):
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(multipart([("a.pdf", data)]), chunk_size=1), tmp_path)
+    assert error.value.status_code == 400
+    assert error.value.detail == "File is not a PDF"
+
+
+def test_magic_of_every_file_is_checked(main, tmp_path):
+    body = multipart([("a.pdf", PDF), ("b.pdf", b"GIF89a")])
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(body), tmp_path, max_files=2)
+    assert error.value.detail == "File is not a PDF"
+
+
+def test_non_pdf_filename_and_file_count(main, tmp_path):
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(multipart([("a.txt", PDF)])), tmp_path)
+    assert error.value.detail == "Only PDF files are allowed"
+
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(multipart([("a.pdf", PDF), ("b.pdf", PDF)])), tmp_path, max_files=1)
+    assert error.value.status_code == 400
+
+
+def test_malformed_multipart_is_a_client_error(main, tmp_path):
+    body = (
+        f"--{BOUNDARY}\r\nContent-Disposition form-data; name=\"pdf\"\r\n\r\n".encode()
+        + PDF + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(body), tmp_path)
+    assert error.value.status_code == 400
+    assert error.value.detail == "Malformed multipart/form-data body"
+
+
+def test_requires_multipart(main, tmp_path):
+    with pytest.raises(HTTPException) as error:
+        receive(main, make_request(PDF, content_type="application/pdf"), tmp_path)
+    assert error.value.status_code == 400
+
+
+def test_aborted_upload_raises_and_closes_partial_file(main, tmp_path):
+    body = multipart([("a.pdf", PDF)])
+    with pytest.raises(ClientDisconnect):
+        receive(main, make_request(body, chunk_size=64, disconnect_after=3), tmp_path)
+    # The partial file is closed; removing it is the caller's job
+    os.remove(tmp_path / "0.pdf")
+
+
+@pytest.fixture
+def app_call(main, monkeypatch):
+    """POST a raw body to /upload-pdf/ through the ASGI app and return the response status"""
+    monkeypatch.setattr(main.Config, "COOLDOWN_PERIOD", 0)
+    monkeypatch.setattr(main.app_state.rate_limiter, "max_requests", 10 ** 9)
+
+    def call(body, chunk_size=64, disconnect_after=None, **scope_options):
+        messages = messages_for(body, chunk_size, disconnect_after)
+        sent = []
+
+        async def receive_message():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(main.app(make_scope(body, **scope_options), receive_message, send))
+        return next(message["status"] for message in sent if message["type"] == "http.response.start")
+
+    return call
+
+
+def uploads(main):
+    return sorted(os.listdir(main.Config.UPLOADS_DIR))
+
+
+@pytest.mark.parametrize("case", ["bad_magic", "too_large", "aborted", "malformed"])
+def test_upload_endpoint_removes_partial_file_on_error(main, app_call, monkeypatch, case):
+    before = uploads(main)
+    tracked = dict(main.app_state.storage_manager.files)
+    if case == "bad_magic":
+        status = app_call(multipart([("a.pdf", b"%PDX" + b"y" * 200)]))
+    elif case == "too_large":
+        monkeypatch.setattr(main.Config, "MAX_FILE_SIZE_BYTES", 100)
+        status = app_call(multipart([("a.pdf", PDF)]))
+    elif case == "aborted":
+        status = app_call(multipart([("a.pdf", PDF)]), disconnect_after=3)
+    else:
+        status = app_call(multipart([("a.pdf", PDF)]).replace(b"Content-Disposition:", b"Content-Disposition", 1))
+    assert status == {"bad_magic": 400, "too_large": 413, "aborted": 500, "malformed": 400}[case]
+    assert uploads(main) == before
+    assert main.app_state.storage_manager.files == tracked
+
+
+@pytest.mark.parametrize("content_length", [True, False])
+def test_quota_is_checked_against_the_bytes_written(main, app_call, monkeypatch, content_length):
+    before = uploads(main)
+    tracked = dict(main.app_state.storage_manager.files)
+    used = sum(entry["size"] for entry in tracked.values() if entry["tenant"] == main.Config.DEFAULT_TENANT)
+    monkeypatch.setattr(main.Config, "TENANT_STORAGE_QUOTA_BYTES", used + len(PDF) - 1)
+    # Nothing else may be evicted to make room
+    storage = main.app_state.storage_manager
+    monkeypatch.setattr(storage, "_evict_lru", lambda needed, quota, tenant=None: storage._usage(tenant) + needed <= quota)
+
+    status = app_call(multipart([("a.pdf", PDF)]), content_length=content_length)
+    assert status == 507
+    assert uploads(main) == before
+    assert main.app_state.storage_manager.files == tracked
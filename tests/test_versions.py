@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+
+@pytest.fixture
+def versions(main, tmp_path, monkeypatch):
+    store = main.DocumentVersionStore(str(tmp_path / "versions.db"))
+    monkeypatch.setattr(main.app_state, "version_store", store)
+    return store
+
+
+def test_versions_and_vectors_survive_a_restart(main, versions, tmp_path):
+    assert versions.next_version("lease") == 1
+    assert versions.add_version("lease", "t1", {1: "a", 2: "b"}) == 1
+    assert versions.add_version("lease", "t2", {1: "a", 2: "c"}) == 2
+    versions.record_chunks("lease", "t2", ["first  chunk", "second chunk"], [[0.5, 1.0], [2.0, 0.25]])
+
+    reopened = main.DocumentVersionStore(str(tmp_path / "versions.db"))
+    assert reopened.history("lease") == versions.history("lease")
+    assert reopened.latest("lease")["page_hashes"] == {1: "a", 2: "c"}
+    hashes = [main.DocumentVersionStore.hash_text(text) for text in ["first chunk", "second chunk", "new chunk"]]
+    assert reopened.chunk_vectors("lease", hashes) == {hashes[0]: [0.5, 1.0], hashes[1]: [2.0, 0.25]}
+    assert reopened.chunk_vectors("other", hashes) == {}
+    assert reopened.next_version("lease") == 3
+
+
+def test_removed_tasks_take_their_versions_and_vectors(main, versions):
+    versions.add_version("lease", "t1", {1: "a"})
+    versions.add_version("lease", "t2", {1: "b"})
+    versions.record_chunks("lease", "t2", ["chunk"], [[1.0]])
+
+    assert versions.remove_tasks(["t1"]) == 1
+    assert [entry["version"] for entry in versions.history("lease")] == [2]
+    assert versions.next_version("lease") == 3
+    assert versions.stats() == {"documents": 1, "versions": 1, "chunk_vectors": 1}
+
+    assert versions.remove_tasks(["t2"]) == 1
+    assert versions.stats() == {"documents": 0, "versions": 0, "chunk_vectors": 0}
+
+
+def test_cleanup_forgets_versions_of_expired_tasks(main, versions, tmp_path, monkeypatch):
+    store = main.TaskStore(str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(main.app_state, "task_store", store)
+    monkeypatch.setattr(main.app_state, "current_task_id", None)
+    monkeypatch.setattr(main.Config, "TASK_TTL_SECONDS", -1)
+    store["t1"] = {"document_id": "lease", "page_hashes": {1: "a"}}
+    versions.add_version("lease", "t1", {1: "a"})
+
+    main.run_cleanup()
+    assert versions.history("lease") == []
+
+
+def test_version_is_registered_only_when_the_index_is_installed(main, versions, monkeypatch):
+    monkeypatch.setattr(main, "swap_index", lambda *args: None)
+    main.app_state.task_store["t1"] = {"tenant": "acme", "document_id": "lease", "version": 1, "page_hashes": {1: "a"}}
+    main.app_state.task_store["t2"] = {"tenant": "acme", "document_id": "lease", "version": 1, "page_hashes": {1: "b"}}
+
+    # t1 was prepared first but its job failed; only t2's index is installed
+    result = {"index_dir": "unused", "metadatas": [{"chunk": 0}], "vectors": [[1.0, 0.0]]}
+    main.install_index("t2", ["only chunk"], result, activate=False)
+
+    key = main.DocumentVersionStore.key("acme", "lease")
+    assert [entry["task_id"] for entry in versions.history(key)] == ["t2"]
+    assert main.app_state.task_store.get("t2")["version"] == 1
+    chunk_hash = main.DocumentVersionStore.hash_text("only chunk")
+    assert versions.chunk_vectors(key, [chunk_hash]) == {chunk_hash: [1.0, 0.0]}
+
+
+def test_uploads_without_a_document_id_are_not_versioned(main, versions, monkeypatch):
+    monkeypatch.setattr(main, "swap_index", lambda *args: None)
+    monkeypatch.setattr(main, "get_pdf_pages", lambda path, task_id: [(1, "The tenant pays rent monthly. " * 40)])
+    monkeypatch.setattr(main, "extract_metadata", lambda path, pages: {})
+
+    prepared = main.prepare_document("t3", "unused.pdf", "tenant", None)
+    assert prepared["document_id"] is None and prepared["version"] is None
+    assert prepared["vectors"] == [None] * len(prepared["chunks"])
+
+    result = {"index_dir": "unused", "metadatas": prepared["metadatas"], "vectors": [[1.0]] * len(prepared["chunks"])}
+    main.install_index("t3", prepared["chunks"], result, activate=False)
+    assert versions.stats() == {"documents": 0, "versions": 0, "chunk_vectors": 0}
+
+
+def test_document_ids_are_scoped_to_the_tenant(main, versions):
+    versions.add_version(main.DocumentVersionStore.key("acme", "contract"), "t1", {1: "a"})
+    versions.add_version(main.DocumentVersionStore.key("acme", "contract"), "t2", {1: "b"})
+    versions.add_version(main.DocumentVersionStore.key("globex", "contract"), "t3", {1: "c"})
+
+    listed = asyncio.run(main.document_versions("contract", x_tenant_id="globex"))
+    assert [entry["task_id"] for entry in listed["versions"]] == ["t3"]
+    changes = asyncio.run(main.document_changes("contract", x_tenant_id="acme"))
+    assert changes["modified"] == [1]
+
+    for call in (main.document_versions("contract", x_tenant_id="initech"), main.document_changes("contract", x_tenant_id="initech")):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(call)
+        assert error.value.status_code == 404